@@ -1,103 +1,106 @@
 from logging import Logger
-from object_detection.capture_webcam import capture_webcam
+from config import Config
+from object_detection.capture_service import capture_frame
 from object_detection.detect_numbers import recognize_numbers, detect_dots_numbers
 import cv2
-import customtkinter
+import numpy as np
 import dobot.dobot_controller as dobot_controller
-from object_segmentation.detect_polygons import segment_instances, convert_coordinates_poly
-
-# Path of the trained yolo model for object detecion
-OBJECT_DETECTION_MODEL_PATH = "resources/yolo_model/object_detection_model.pt"
-# Path of the trained yolo model for object segmentation
-OBJECT_SEGMENTATION_MODEL_PATH = "resources/yolo_model/object_segmentation_model.pt"
-# Path where the captured image will be saved
-CAPTURED_IMG_PATH = "resources/captured_img/object_detection_test.jpg"
-# Path where the detected image will be saved
-SAVE_DIR = "resources/runs/detect"
-# Path to the tesseract executable
-PYTESSERACT_PATH = "C:/Program Files/Tesseract-OCR/tesseract.exe"
-
-# Webcam Settings
-CAPTURE_WEBCAM = False  # If True, the CAPTURED_IMG_PATH will be overwritten with the captured image
-WEBCAM_RESOLUTION_WIDTH = 1920
-WEBCAM_RESOLUTION_HEIGHT = 1080
-
-# Options to show results
-# First use case: Draw dot to dot
-SHOW_DETECTIONS = True  # Show the detections of the yolo model
-SHOW_CROPPED_NUMBER = False  # Show the cropped number with their recognized value
-SHOW_DETECTED_DOTS = True  # Show the order of the detected dots
-# Second use case: Color areas
-SHOW_POLYGONS = False  # Show the polygons of the segmented image
-SHOW_CALCULATED_POINTS = True  # Show the calculated points of the segmented image
-
-# Detection Settings
-CONFIDENCE_THRESHOLD = 0.1  # Threshold for the confidence of the yolo model detection
-RESIZE_FACTOR = 2  # Factor to resize the cropped, detected number
-THRESHOLD_VALUE = 170  # Threshold value for the grayscale image of the cropped, detected number
-THRESHOLD_MAX_VALUE = 255  # Max value for the threshold_value
-
-# Result Window Resolution
-RESULT_WINDOW_WIDTH = 1920
-RESULT_WINDOW_HEIGHT = 1080
-
-# COM-Port of the Dobot
-DOBOT_PORT = 0
-# Dobot Settings
-Z_AXIS_HEIGHT = -41
-CALC_POINTS_OFFSET_X = 194
-CALC_POINTS_OFFSET_Y = 50
-
-
-def run():
+from dobot.dobot_controller import plan_dot_to_dot_path, plan_area_strokes, plan_mask_strokes
+from object_segmentation.detect_polygons import segment_instances, segment_masks, convert_coordinates_poly
+from object_detection.model_registry import preload_models
+from utils.coordinate_transform import get_sheet_transform, get_pixel_to_robot_transform
+from utils.profiling import start_profiling, finish_profiling
+from utils.result_cache import get_result_cache
+from utils.review_server import (show_image, review_sheet, review_context, get_review_server, dot_to_dot_problems,
+                                 fill_problems)
+
+
+def run(config=None):
     """
     Runs the application.
+    :param config: settings to use, the defaults of config.py if None
     """
 
-    # Runs the first use case to draw dot to dot
-    run_dot_to_dot()
+    config = config or Config()
+
+    # Time the stages of the run
+    if config.profiling:
+        start_profiling(config)
+
+    try:
+        # Load the yolo models once for the whole process
+        if config.preload_models:
+            preload_models(config)
 
-    # Runs the second use case to color areas
-    # run_fill_areas()
+        # Serve the review page before the first sheet is processed
+        if config.review == "server":
+            get_review_server(config)
 
+        # Runs the first use case to draw dot to dot
+        with review_context():
+            run_dot_to_dot(config)
 
-def run_dot_to_dot():
+        # Runs the second use case to color areas
+        # with review_context():
+        #     run_fill_areas(config)
+    finally:
+        if config.profiling:
+            finish_profiling(config)
+
+
+def run_dot_to_dot(config):
     """
     Runs the first use case to draw dot to dot.
+    :param config: settings to use
     """
 
     # Capture image from webcam
-    if CAPTURE_WEBCAM:
-        capture_webcam(CAPTURED_IMG_PATH)
+    img = capture_frame(config) if config.capture_webcam else cv2.imread(config.captured_img_path)
+
+    # Reuse the results of the sheet if it did not change since the last run
+    cache = get_result_cache(config) if config.result_cache else None
+    key = cache.key(img, "dot_to_dot", config) if cache is not None else None
+    cached = cache.lookup(key) if cache is not None else None
 
-    # Detect Numbers and Dots
-    data = recognize_numbers(detect_dots_numbers())
+    if cached is not None:
+        print("The sheet did not change, using the cached results")
+        data, polylines = cached["data"], cached["polylines"]
+    else:
+        # Detect Numbers and Dots
+        data = recognize_numbers(detect_dots_numbers(img, config), config=config, image_shape=img.shape) or []
+        # Plan the lines between the dots
+        polylines = plan_dot_to_dot_path([coordinates for _, coordinates in data], config)
+        if cache is not None:
+            cache.store(key, {"data": data, "polylines": polylines})
 
     # Show detections
-    if SHOW_DETECTED_DOTS:
-        img = cv2.imread(CAPTURED_IMG_PATH)
+    if config.show_detected_dots:
+        img = img.copy()
 
-        for number, coordinates in data:
-            x, y = coordinates
-            x = int((x / 100) * 1080) + 420
-            y = int((y / 100) * 1080)
+        transform = get_sheet_transform(img.shape[1], img.shape[0], config)
+        pixels = transform.invert([coordinates for _, coordinates in data])
 
+        for (number, _), (x, y) in zip(data, pixels):
             cv2.circle(img, (int(x), int(y)), 5, (0, 0, 255), 3)
 
             label = f"{number}"
             cv2.putText(img, label, (int(x) - 15, int(y) - 15), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
-        cv2.namedWindow("Result", cv2.WINDOW_NORMAL)
-        cv2.resizeWindow("Result", RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT)
-        cv2.imshow("Result", img)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        # Planned path of the Dobot
+        path_transform = get_pixel_to_robot_transform(img.shape[1], img.shape[0], config)
+        for polyline in polylines:
+            cv2.polylines(img, [np.round(path_transform.invert(polyline)).astype(np.int32)], False, (255, 0, 0), 2)
+
+        show_image("Result", img, config)
 
     # Only recognized numbers
     numbers = [item[0] for item in data if item[0] is not None]
 
-    # Show GUI
-    show_gui(numbers)
+    # Review the results, with the review server only sheets with problems wait for the operator
+    if config.review == "window":
+        show_gui(numbers)
+    elif not review_sheet("Dot to dot", {"Recognized numbers": numbers}, dot_to_dot_problems(numbers), config):
+        return
 
     # Shape data to coordinates only
     coordinates_only = [coordinates for _, coordinates in data]
@@ -105,55 +108,71 @@ def run_dot_to_dot():
 
     # Connect to Dobot
     logger = Logger(name="dobot")
-    dobot = dobot_controller.DobotController(logger=logger, port=DOBOT_PORT)
+    dobot = dobot_controller.DobotController(logger=logger, port=config.dobot_port, config=config)
 
     # Draw dot to dot
     if dobot.is_connected:
-        dobot.draw_dot_to_dot(coordinates_only)
+        dobot.draw_polylines(polylines)
 
 
-def run_fill_areas():
+def run_fill_areas(config):
     """
     Runs the second use case to color areas.
     This use case is not finished and will probably not work with a newly captured image.
+    :param config: settings to use
     """
 
     # Capture image from webcam
-    if CAPTURE_WEBCAM:
-        capture_webcam(CAPTURED_IMG_PATH)
-
-    # Detect the areas to color
-    data = segment_instances()
-    # Convert the coordinates to polygons
-    poly_to_draw = convert_coordinates_poly(data)
-
-    # Show calculated points
-    img = cv2.imread(CAPTURED_IMG_PATH)
-    for k in range(len(data)):
-        for i in range(len(data[k])):
-            for j in range(len(data[k][i])):
-                cv2.circle(img, (int(data[k][i][j][0]), int(data[k][i][j][1])), 5, (0, 255, 0), -1)
-
-    if SHOW_CALCULATED_POINTS:
-        cv2.namedWindow("Result", cv2.WINDOW_NORMAL)
-        cv2.resizeWindow("Result", RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT)
-        cv2.imshow("Result", img)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
-
-    # Show GUI
-    show_gui()
+    img = capture_frame(config) if config.capture_webcam else cv2.imread(config.captured_img_path)
+
+    # Reuse the results of the sheet if it did not change since the last run
+    cache = get_result_cache(config) if config.result_cache else None
+    key = cache.key(img, "fill_areas", config) if cache is not None else None
+    cached = cache.lookup(key) if cache is not None else None
+
+    if cached is not None:
+        print("The sheet did not change, using the cached results")
+        strokes = cached["strokes"]
+    elif config.fill_from_masks:
+        # Detect the areas to color and plan the hatch lines from their masks
+        strokes = plan_mask_strokes(segment_masks(img, config), img.shape, config)
+    else:
+        # Detect the areas to color
+        data = segment_instances(img, config)
+        # Convert the coordinates to polygons and plan the strokes to color them
+        strokes = plan_area_strokes(convert_coordinates_poly(data, img.shape, config), config)
+    if cache is not None and cached is None:
+        cache.store(key, {"strokes": strokes})
+
+    # Show calculated strokes
+    if config.show_calculated_points:
+        img = img.copy()
+        transform = get_pixel_to_robot_transform(img.shape[1], img.shape[0], config)
+        for stroke in strokes:
+            pixels = np.round(transform.invert(stroke)).astype(np.int32)
+            cv2.polylines(img, [pixels], False, (0, 255, 0), 2)
+
+        show_image("Result", img, config)
+
+    # Review the results, with the review server only sheets with problems wait for the operator
+    if config.review == "window":
+        show_gui()
+    elif not review_sheet("Fill areas", {"Strokes": len(strokes)}, fill_problems(strokes), config):
+        return
 
     # Connect to Dobot
     logger = Logger(name="dobot")
-    dobot = dobot_controller.DobotController(logger=logger, port=DOBOT_PORT)
+    dobot = dobot_controller.DobotController(logger=logger, port=config.dobot_port, config=config)
 
     # Color areas
-    for poly in poly_to_draw:
-        dobot.draw_area(poly)
+    if dobot.is_connected and strokes:
+        dobot.draw_polylines(strokes)
 
 
 def show_gui(numbers=None):
+    # customtkinter is only needed for the dialog, so it is not imported by headless runs
+    import customtkinter
+
     # Show GUI
     customtkinter.set_appearance_mode("System")
     customtkinter.set_default_color_theme("blue")
@@ -0,0 +1,170 @@
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+from config import Config
+from dobot.dobot_controller import plan_dot_to_dot_path
+from dobot.path_planner import plan_moves, estimate_travel_time
+from object_detection.detect_numbers import process_images, group_numbers_dots, recognize_numbers
+from object_detection.model_registry import get_model
+
+# File extensions of the images in a batch folder
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def iter_images(source):
+    """
+    Yields the images of a batch, every image gets a unique name. An image path is named by its file name without
+    the extension, the extension or a number is appended if another image already has that name
+    :param source: folder with images, or an iterable of image paths, images or (name, image) tuples
+    :return: generator of (name, image) tuples
+    """
+
+    if isinstance(source, str):
+        paths = sorted(path for path in glob.glob(os.path.join(source, "*")) if path.lower().endswith(IMAGE_EXTENSIONS))
+        source = paths
+
+    used = set()
+    for i, item in enumerate(source):
+        if isinstance(item, tuple):
+            name, img = item
+        elif isinstance(item, str):
+            name, img = os.path.splitext(os.path.basename(item))[0], cv2.imread(item)
+        else:
+            name, img = f"sheet_{i:04d}", item
+
+        if img is None:
+            print(f"Failed to read image {name}")
+            continue
+
+        # a.jpg and a.png would write their results to the same a.json
+        if name in used and isinstance(item, str):
+            name = f"{name}_{os.path.splitext(item)[1][1:].lower()}"
+        unique, suffix = name, 2
+        while unique in used:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        used.add(unique)
+        yield unique, img
+
+
+def iter_batches(items, batch_size):
+    """
+    Groups the items of an iterable into lists of batch_size items
+    :param items: iterable to group
+    :param batch_size: number of items per batch
+    :return: generator of lists
+    """
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def plan_dot_to_dot(data, config=None):
+    """
+    Plans the moves of the Dobot for the recognized dots
+    :param data: sorted (number, coordinates) tuples returned by recognize_numbers
+    :param config: settings to use, the defaults if None
+    :return: list of (x, y, z) moves and their estimated time in seconds
+    """
+
+    config = config or Config()
+    polylines = plan_dot_to_dot_path([coordinates for _, coordinates in data], config)
+    moves = plan_moves(polylines, config.z_axis_height)
+    return moves, estimate_travel_time(moves, config.dobot_velocity, config.dobot_acceleration,
+                                       config.dobot_command_overhead)
+
+
+def process_sheet(name, number_coords, dot_coords, img, config=None):
+    """
+    Pairs, recognizes and plans the dots of one sheet
+    :param name: name of the sheet
+    :param number_coords: numbers detected by yolo
+    :param dot_coords: dots detected by yolo
+    :param img: image of the sheet
+    :param config: settings to use, the defaults if None
+    :return: json serializable result of the sheet
+    """
+
+    grouped_coords, unmatched_numbers, unmatched_dots = group_numbers_dots(number_coords, dot_coords, img, config)
+    data = recognize_numbers(grouped_coords, show=False, config=config, image_shape=img.shape) or []
+    moves, estimated_time = plan_dot_to_dot(data, config) if data else ([], 0.0)
+
+    return {
+        "name": name,
+        "image_size": [img.shape[1], img.shape[0]],
+        "detected_numbers": len(number_coords),
+        "detected_dots": len(dot_coords),
+        "unmatched_numbers": len(unmatched_numbers),
+        "unmatched_dots": len(unmatched_dots),
+        "numbers": [int(number) for number, _ in data],
+        "dot_to_dot": [[float(x), float(y)] for _, (x, y) in data],
+        "path": [[float(x), float(y), float(z)] for x, y, z in moves],
+        "estimated_time": estimated_time,
+    }
+
+
+def run_batch(source, output_dir, batch_size=None, config=None):
+    """
+    Runs detection, pairing, ocr and path planning for every image of a batch without any window and writes one
+    json file per sheet, the files can be drawn with benchmarks/benchmark_plotting.py. A sheet that fails is
+    recorded with its error in the results and the batch continues with the next sheet
+    :param source: folder with images, or an iterable of image paths, images or (name, image) tuples
+    :param output_dir: directory to write the results to
+    :param batch_size: number of images per yolo call, batch_size of the config is used if None
+    :param config: settings to use, the defaults if None
+    :return: list with the results of all sheets, a failed sheet only has a name and an error
+    """
+
+    config = config or Config()
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = get_model(config.object_detection_model_path, task="detect", config=config)
+
+    results = []
+    start = time.perf_counter()
+    for batch in iter_batches(iter_images(source), batch_size or config.batch_size):
+        names = [name for name, _ in batch]
+        try:
+            detections = process_images(model, [img for _, img in batch], config)
+        except Exception as e:
+            print(f"Failed to detect the sheets {', '.join(names)}: {e}")
+            results.extend({"name": name, "error": str(e)} for name in names)
+            continue
+
+        for name, (number_coords, dot_coords, _, img) in zip(names, detections):
+            try:
+                result = process_sheet(name, number_coords, dot_coords, img, config)
+                with open(os.path.join(output_dir, f"{name}.json"), "w") as f:
+                    json.dump(result, f, indent=1)
+            except Exception as e:
+                print(f"{name}: failed, {e}")
+                results.append({"name": name, "error": str(e)})
+                continue
+            results.append(result)
+            print(f"{name}: {len(result['numbers'])} numbers, estimated drawing time {result['estimated_time']:.1f}s")
+
+    elapsed = time.perf_counter() - start
+    if results:
+        failed = [result["name"] for result in results if "error" in result]
+        print(f"Processed {len(results)} sheets in {elapsed:.1f}s ({elapsed / len(results):.2f}s per sheet)")
+        if failed:
+            print(f"{len(failed)} sheets failed: {', '.join(failed)}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process a folder of dot to dot sheets without the gui')
+    parser.add_argument('source', help='folder with the images of the sheets')
+    parser.add_argument('output_dir', help='folder to write one json result per sheet to')
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args()
+    run_batch(args.source, args.output_dir, args.batch_size)
@@ -0,0 +1,77 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Modules of the entry points that are imported by the benchmark
+ENTRY_POINTS = [
+    "app",
+    "batch",
+    "pipeline",
+    "dobot.simulator",
+    "object_detection.ocr_backends",
+    "object_detection.detect_numbers",
+    "benchmarks.benchmark_plotting",
+]
+# Libraries that should only be imported once they are used
+HEAVY_MODULES = ["torch", "ultralytics", "supervision", "pytesseract", "customtkinter", "pydobot", "serial"]
+
+# Runs in a fresh interpreter, so every measurement is a cold import
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "loaded": [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeat=5):
+    """
+    Measures the time to import a module in a fresh interpreter
+    :param module: name of the module
+    :param repeat: number of interpreters started
+    :return: dictionary with the fastest import time and the heavy modules it loads, or the error
+    """
+
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            return {"module": module, "error": process.stderr.strip().splitlines()[-1]}
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        times.append(result["time"])
+        loaded = result["loaded"]
+
+    return {"module": module, "time": min(times), "loaded": loaded}
+
+
+def run(modules=None, repeat=5):
+    """
+    Measures the cold import time of the entry points and prints which heavy libraries they load
+    :param modules: names of the modules, ENTRY_POINTS if None
+    :param repeat: number of measurements per module, the fastest is reported
+    :return: list with the result of every module
+    """
+
+    results = [measure_import(module, repeat) for module in modules or ENTRY_POINTS]
+
+    print(f"{'module':<36} {'import':>9}  heavy modules")
+    for result in results:
+        if "error" in result:
+            print(f"{result['module']:<36} {'failed':>9}  {result['error']}")
+        else:
+            print(f"{result['module']:<36} {result['time'] * 1000:>7.0f}ms  {', '.join(result['loaded']) or '-'}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cold import time of the entry points')
+    parser.add_argument('modules', nargs='*', help='modules to import, all entry points if not set')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.modules, args.repeat)
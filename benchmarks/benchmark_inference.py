@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+from config import Config
+from object_detection.inference_backends import export_and_check
+
+# Exported variants of the models that are compared with the pytorch model as (backend, int8) tuples
+VARIANTS = [
+    ("onnx", False),
+    ("onnx", True),
+    ("openvino", False),
+    ("openvino", True),
+]
+# File the results of the benchmark are saved to
+DEFAULT_OUTPUT = "resources/runs/benchmark/inference.json"
+
+
+def run(variants=None, output_file=DEFAULT_OUTPUT, config=None):
+    """
+    Exports both yolo models for every variant and compares their accuracy and latency with the pytorch models
+    on the calibration images
+    :param variants: list of (backend, int8) tuples, VARIANTS if None
+    :param output_file: json file to save the results to
+    :param config: settings to use, the defaults if None
+    :return: list with the result of every model and variant
+    """
+
+    config = config or Config()
+    models = [
+        (config.object_detection_model_path, "detect", config.confidence_threshold),
+        (config.object_segmentation_model_path, "segment", config.segmentation_confidence_threshold),
+    ]
+
+    results = []
+    for model_path, task, conf in models:
+        for backend, int8 in variants or VARIANTS:
+            variant = f"{backend}{' int8' if int8 else ''}"
+            try:
+                path, report = export_and_check(model_path, task, backend, int8, config.inference_imgsz,
+                                                config.inference_calibration_images, conf)
+            except Exception as e:
+                print(f"Skipping {variant} of {model_path}. Reason: {e}")
+                continue
+            results.append({"model": model_path, "task": task, "variant": variant, "path": path, **report})
+
+    print(f"{'task':<8} {'variant':<14} {'precision':>9} {'recall':>7} {'box iou':>8} {'mask iou':>8} "
+          f"{'latency':>9} {'pytorch':>9} {'speedup':>8}")
+    for result in results:
+        box_iou = f"{result['box_iou']:.3f}" if result["box_iou"] is not None else "-"
+        mask_iou = f"{result['mask_iou']:.3f}" if result["mask_iou"] is not None else "-"
+        speedup = result["pytorch_latency"] / result["latency"] if result["latency"] else 0.0
+        print(f"{result['task']:<8} {result['variant']:<14} {result['precision']:>9.3f} {result['recall']:>7.3f} "
+              f"{box_iou:>8} {mask_iou:>8} {result['latency'] * 1000:>7.1f}ms "
+              f"{result['pytorch_latency'] * 1000:>7.1f}ms {speedup:>7.2f}x")
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved the results to {output_file}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the exported yolo models with the pytorch models')
+    parser.add_argument('--backend', choices=["onnx", "openvino"], default=None, help='only export this backend')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+    run([variant for variant in VARIANTS if args.backend in (None, variant[0])], args.output)
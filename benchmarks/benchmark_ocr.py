@@ -0,0 +1,85 @@
+import glob
+import time
+from config import Config
+from object_detection.detect_numbers import process_image, preprocess_number_crop, load_crop
+from object_detection.model_registry import get_model
+from object_detection.ocr_backends import OCR_CONFIG, TesseractBackend, parse_number
+
+# Images the benchmark runs on
+IMAGE_PATTERN = "resources/captured_img/*.jpg"
+# Number of crops to benchmark, the full set of crops of an image is always included
+CROP_COUNTS = [1, 5, 10, 25, 50, 100]
+
+
+def time_ocr(ocr_function, number_imgs):
+    """
+    Measures the time of an ocr function
+    :param ocr_function: function that takes the list of images
+    :param number_imgs: preprocessed images of the numbers
+    :return: ocr results and the elapsed time in seconds
+    """
+
+    start = time.perf_counter()
+    results = ocr_function(number_imgs)
+    return results, time.perf_counter() - start
+
+
+def recognize_per_crop(number_imgs):
+    """
+    Reads the numbers the way detect_numbers did before the ocr backends, with one image_to_string call per crop
+    :param number_imgs: preprocessed images of the numbers
+    :return: list with the number of every image, None if no number was read
+    """
+
+    import pytesseract
+
+    return [parse_number(pytesseract.image_to_string(number_img, config=OCR_CONFIG)) for number_img in number_imgs]
+
+
+def benchmark_image(model, img_path, batched, config):
+    """
+    Compares the original per-crop ocr with the batched ocr on the numbers detected in an image
+    :param model: yolo model for the object detection
+    :param img_path: path to the image
+    :param batched: tesseract backend with one call for all crops
+    :param config: settings to use
+    :return: list of result rows
+    """
+
+    number_coords, _, _, _ = process_image(model, img_path, config)
+    number_imgs = [preprocess_number_crop(load_crop(number_info, config), config) for number_info in number_coords]
+
+    counts = sorted({count for count in CROP_COUNTS if count < len(number_imgs)} | {len(number_imgs)})
+    rows = []
+    for count in counts:
+        if count == 0:
+            continue
+        subset = number_imgs[:count]
+        per_crop_numbers, per_crop_time = time_ocr(recognize_per_crop, subset)
+        batched_results, batched_time = time_ocr(batched.recognize, subset)
+        matches = sum(number == result.number for number, result in zip(per_crop_numbers, batched_results))
+        rows.append((img_path, count, per_crop_time, batched_time, matches))
+    return rows
+
+
+def run(config=None):
+    """
+    Runs the ocr benchmark on all sample images and prints the results
+    :param config: settings to use, the defaults if None
+    """
+
+    config = config or Config()
+    model = get_model(config.object_detection_model_path, task="detect", config=config)
+    batched = TesseractBackend(config.pytesseract_path, batched=True)
+
+    print(f"{'image':<55} {'crops':>5} {'per-crop':>10} {'batched':>10} {'speedup':>8} {'agree':>7}")
+    for img_path in sorted(glob.glob(IMAGE_PATTERN)):
+        rows = benchmark_image(model, img_path, batched, config)
+        for path, count, per_crop_time, batched_time, matches in rows:
+            speedup = per_crop_time / batched_time if batched_time > 0 else float("inf")
+            print(f"{path:<55} {count:>5} {per_crop_time:>9.3f}s {batched_time:>9.3f}s {speedup:>7.1f}x "
+                  f"{matches:>3}/{count:<3}")
+
+
+if __name__ == '__main__':
+    run()
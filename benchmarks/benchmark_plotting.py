@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+from config import Config
+from dobot.dobot_controller import calculate_points
+from dobot.simulator import SimulatedDobotController
+
+# Recorded detection outputs the benchmark draws by default
+DEFAULT_INPUT = "benchmarks/data/sample_detections.json"
+# Directory the trajectory images are saved to
+DEFAULT_OUTPUT_DIR = "resources/runs/benchmark"
+
+
+def draw_segment_by_segment(dobot, points):
+    """
+    Draws the dots like the original implementation, with a full lift and lower for every segment
+    :param dobot: simulated controller
+    :param points: list of points to draw
+    """
+
+    points = calculate_points(points, dobot.config)
+    for x in range(0, len(points) - 1):
+        dobot.draw_line(points[x][0], points[x][1], points[x + 1][0], points[x + 1][1])
+
+
+def run_case(name, draw, streaming, output_dir):
+    """
+    Runs one drawing on a fresh simulated Dobot
+    :param name: name of the case
+    :param draw: function that draws with the given controller
+    :param streaming: if True, the moves are streamed to the command queue
+    :param output_dir: directory to save the trajectory image to
+    :return: statistics of the drawing
+    """
+
+    dobot = SimulatedDobotController(config=Config(dobot_streaming=streaming))
+    draw(dobot)
+
+    mode = "streaming" if streaming else "blocking"
+    dobot.render_trajectory(os.path.join(output_dir, f"{name}_{mode}.png"))
+    stats = dobot.stats()
+    stats["case"] = name
+    stats["mode"] = mode
+    return stats
+
+
+def run(input_file=DEFAULT_INPUT, output_dir=DEFAULT_OUTPUT_DIR):
+    """
+    Draws the recorded detections on the simulated Dobot and prints the estimated times
+    :param input_file: json file with the keys "dot_to_dot" (list of points) and "fill_areas" (list of polygons)
+    :param output_dir: directory to save the trajectory images to
+    :return: list with the statistics of every case
+    """
+
+    with open(input_file) as f:
+        data = json.load(f)
+    os.makedirs(output_dir, exist_ok=True)
+
+    dots = data.get("dot_to_dot", [])
+    areas = data.get("fill_areas", [])
+
+    def draw_areas_unordered(dobot):
+        for poly in areas:
+            dobot.draw_area(poly)
+
+    cases = [
+        ("dot_to_dot_segments", lambda dobot: draw_segment_by_segment(dobot, dots)),
+        ("dot_to_dot", lambda dobot: dobot.draw_dot_to_dot(dots)),
+        ("fill_areas_unordered", draw_areas_unordered),
+        ("fill_areas", lambda dobot: dobot.draw_areas(areas)),
+    ]
+
+    results = []
+    for name, draw in cases:
+        for streaming in (False, True):
+            results.append(run_case(name, draw, streaming, output_dir))
+
+    print(f"{'case':<22} {'mode':<10} {'commands':>8} {'moves':>6} {'lifts':>6} {'draw mm':>9} {'travel mm':>10} "
+          f"{'motion':>8} {'estimated':>10}")
+    for stats in results:
+        print(f"{stats['case']:<22} {stats['mode']:<10} {stats['commands']:>8} {stats['moves']:>6} "
+              f"{stats['pen_lifts']:>6} {stats['draw_distance']:>9.0f} {stats['travel_distance']:>10.0f} "
+              f"{stats['motion_time']:>7.1f}s {stats['elapsed_time']:>9.1f}s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate the plotting time on a simulated Dobot')
+    parser.add_argument('--input', default=DEFAULT_INPUT)
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    args = parser.parse_args()
+    run(args.input, args.output_dir)
@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from config import Config
+from dobot.fill_planner import mask_outlines
+from dobot.simulator import SimulatedDobotController
+from object_detection.detect_numbers import detect_dots_numbers, recognize_numbers
+from object_detection.model_registry import preload_models, registry
+from object_segmentation.detect_polygons import segment_instances, segment_masks, convert_coordinates_poly
+from utils.coordinate_transform import get_sheet_transform
+from utils.profiling import profiler
+
+# Sample sheets of the benchmark as (case, use case, image) tuples
+CASES = [
+    ("object_detection_test", "dot_to_dot", "resources/captured_img/object_detection_test.jpg"),
+    ("object_segmentation_test", "fill_areas", "resources/captured_img/object_segmentation_test.jpg"),
+]
+# Directory with the expected output of every case
+GOLDEN_DIR = "benchmarks/golden"
+# File the results of the benchmark are saved to
+DEFAULT_OUTPUT = "resources/runs/benchmark/regression.json"
+# Max distance in mm between a detected dot and the expected dot to count as the same dot
+DOT_TOLERANCE_MM = 2.0
+# Min intersection over union of a segmented area and the expected area to count as the same area
+IOU_THRESHOLD = 0.5
+# Resolution in mm of the grid the areas are rasterized on to compare them
+IOU_RESOLUTION_MM = 0.25
+# Relative increase of the p50 latency compared to the baseline that is reported as a regression
+REGRESSION_TOLERANCE = 0.1
+# Settings that open a window and are switched off while the benchmark runs
+SHOW_SETTINGS = ["show_detections", "show_cropped_number", "show_detected_dots", "show_polygons",
+                 "show_calculated_points"]
+
+
+def run_dot_to_dot(img, config):
+    """
+    Detects and recognizes the numbers of a sheet and draws them on a simulated Dobot
+    :param img: image of the sheet
+    :param config: settings to use
+    :return: list of (number, [x, y]) dots and the statistics of the simulated drawing
+    """
+
+    data = recognize_numbers(detect_dots_numbers(img, config), show=False, config=config,
+                             image_shape=img.shape) or []
+
+    dobot = SimulatedDobotController(config=config)
+    dobot.draw_dot_to_dot([coordinates for _, coordinates in data])
+    return [[number, list(coordinates)] for number, coordinates in data], dobot.stats()
+
+
+def run_fill_areas(img, config):
+    """
+    Segments the areas of a sheet and colors them on a simulated Dobot, the strokes are planned from the masks or
+    from the polygons as selected by fill_from_masks
+    :param img: image of the sheet
+    :param config: settings to use
+    :return: list of polygons and the statistics of the simulated drawing
+    """
+
+    dobot = SimulatedDobotController(config=config)
+    if config.fill_from_masks:
+        masks = segment_masks(img, config)
+        dobot.draw_masks(masks, img.shape)
+        polygons = mask_polygons(masks, img.shape, config)
+    else:
+        polygons = convert_coordinates_poly(segment_instances(img, config), img.shape, config)
+        dobot.draw_areas(polygons)
+    return [polygon.tolist() for polygon in polygons], dobot.stats()
+
+
+def mask_polygons(masks, image_shape, config):
+    """
+    Converts the outer boundary of every mask to a polygon on the sheet to compare it with the golden areas
+    :param masks: boolean array of shape (n, height, width)
+    :param image_shape: shape of the segmented image
+    :param config: settings to use
+    :return: list of arrays of shape (n, 2)
+    """
+
+    transform = get_sheet_transform(image_shape[1], image_shape[0], config)
+    polygons = []
+    for mask in masks:
+        rings = mask_outlines(mask, transform, config.polygon_smoothing_window, config.polygon_tolerance_mm)
+        if rings:
+            polygons.append(np.round(max(rings, key=lambda ring: cv2.contourArea(ring.astype(np.float32))), 2))
+    return polygons
+
+
+USE_CASES = {
+    "dot_to_dot": run_dot_to_dot,
+    "fill_areas": run_fill_areas,
+}
+
+
+def percentiles(values):
+    """
+    Summarizes measured values
+    :param values: list of values
+    :return: dictionary with the p50, p95 and max value
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
+
+
+def measure(function, img, repeat, config):
+    """
+    Runs a use case several times and measures its latency and the latency of its stages, its peak memory is
+    measured in one more run, so tracing the allocations does not slow down the timed runs
+    :param function: use case function that takes the image and the config
+    :param img: image of the sheet
+    :param repeat: number of runs
+    :param config: settings to use
+    :return: output of the last run, statistics of its drawing and the measurements
+    """
+
+    latencies = []
+    stage_latencies = {}
+    output, drawing = None, None
+
+    for _ in range(repeat):
+        profiler.start()
+        start = time.perf_counter()
+        try:
+            output, drawing = function(img, config)
+        finally:
+            latencies.append(time.perf_counter() - start)
+            profiler.stop()
+
+        for name, stage in profiler.summary()["stages"].items():
+            stage_latencies.setdefault(name, []).append(stage["total"])
+    counters = profiler.summary()["counters"]
+
+    tracemalloc.start()
+    try:
+        function(img, config)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return output, drawing, {
+        "latency": percentiles(latencies),
+        "stages": {name: percentiles(values) for name, values in stage_latencies.items()},
+        "counters": counters,
+        "peak_memory_mb": peak_memory / 1024 ** 2,
+    }
+
+
+def dot_accuracy(dots, expected, tolerance=DOT_TOLERANCE_MM):
+    """
+    Compares the recognized dots with the expected dots, every expected dot is matched with the closest
+    recognized dot within the tolerance
+    :param dots: list of recognized (number, [x, y]) dots
+    :param expected: list of expected (number, [x, y]) dots
+    :param tolerance: max distance in mm between matched dots
+    :return: dictionary with the detection precision and recall and the ocr accuracy
+    """
+
+    if not dots or not expected:
+        return {"precision": float(not dots), "recall": float(not expected), "ocr_accuracy": float(not expected)}
+
+    positions = np.array([coordinates for _, coordinates in dots], dtype=np.float64)
+    expected_positions = np.array([coordinates for _, coordinates in expected], dtype=np.float64)
+    distances = np.linalg.norm(expected_positions[:, None] - positions[None], axis=2)
+
+    matched = 0
+    correct = 0
+    used = np.zeros(len(dots), dtype=bool)
+    for i in np.argsort(distances.min(axis=1)):
+        candidates = np.where(~used & (distances[i] <= tolerance))[0]
+        if len(candidates) == 0:
+            continue
+        j = candidates[distances[i, candidates].argmin()]
+        used[j] = True
+        matched += 1
+        correct += int(dots[j][0] == expected[i][0])
+
+    return {
+        "precision": matched / len(dots),
+        "recall": matched / len(expected),
+        "ocr_accuracy": correct / len(expected),
+    }
+
+
+def polygon_iou(polygon, other, resolution=IOU_RESOLUTION_MM):
+    """
+    Calculates the intersection over union of two polygons by rasterizing them
+    :param polygon: list of points
+    :param other: list of points
+    :param resolution: size of a grid cell in mm
+    :return: intersection over union
+    """
+
+    polygon = np.asarray(polygon, dtype=np.float64)
+    other = np.asarray(other, dtype=np.float64)
+    minimum = np.minimum(polygon.min(axis=0), other.min(axis=0))
+    size = np.ceil((np.maximum(polygon.max(axis=0), other.max(axis=0)) - minimum) / resolution).astype(int) + 1
+
+    masks = []
+    for points in (polygon, other):
+        mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round((points - minimum) / resolution).astype(np.int32)], 1)
+        masks.append(mask.astype(bool))
+
+    union = np.logical_or(*masks).sum()
+    return np.logical_and(*masks).sum() / union if union else 0.0
+
+
+def area_accuracy(polygons, expected, threshold=IOU_THRESHOLD):
+    """
+    Compares the segmented areas with the expected areas, every expected area is matched with the
+    segmented area it overlaps the most
+    :param polygons: list of segmented polygons
+    :param expected: list of expected polygons
+    :param threshold: min intersection over union of matched areas
+    :return: dictionary with the precision, recall and mean intersection over union of the areas
+    """
+
+    if not polygons or not expected:
+        return {"precision": float(not polygons), "recall": float(not expected), "mean_iou": float(not expected)}
+
+    ious = np.array([[polygon_iou(polygon, area) for polygon in polygons] for area in expected])
+    best = ious.max(axis=1)
+    return {
+        "precision": float((ious.max(axis=0) >= threshold).mean()),
+        "recall": float((best >= threshold).mean()),
+        "mean_iou": float(best.mean()),
+    }
+
+
+def golden_path(case):
+    return os.path.join(GOLDEN_DIR, f"{case}.json")
+
+
+def load_golden(case):
+    """
+    Loads the expected output of a case
+    :param case: name of the case
+    :return: expected output or None if there is no golden file
+    """
+
+    path = golden_path(case)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["output"]
+
+
+def save_golden(case, img_path, output):
+    """
+    Saves the output of a case as its expected output
+    :param case: name of the case
+    :param img_path: path of the image of the case
+    :param output: output of the case
+    """
+
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    with open(golden_path(case), "w") as f:
+        json.dump({"image": img_path, "output": output}, f, indent=1)
+
+
+def compare_with_baseline(results, baseline_file, tolerance=REGRESSION_TOLERANCE):
+    """
+    Prints the cases and stages whose p50 latency increased by more than the tolerance since a previous run
+    :param results: results of this run
+    :param baseline_file: results of a previous run saved by this benchmark
+    :param tolerance: relative increase that is reported
+    :return: list of (case, stage, baseline, current) regressions
+    """
+
+    with open(baseline_file) as f:
+        baseline = {result["case"]: result for result in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["case"])
+        if previous is None:
+            continue
+        pairs = [("end_to_end", previous["latency"], result["latency"])]
+        pairs += [(name, previous["stages"][name], stage) for name, stage in result["stages"].items()
+                  if name in previous["stages"]]
+        for name, before, after in pairs:
+            if after["p50"] > before["p50"] * (1 + tolerance):
+                regressions.append((result["case"], name, before["p50"], after["p50"]))
+
+    for case, name, before, after in regressions:
+        print(f"Regression in {case}/{name}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms")
+    if not regressions:
+        print(f"No latency regressions compared to {baseline_file}")
+    return regressions
+
+
+def run(repeat=5, update=False, output_file=DEFAULT_OUTPUT, baseline_file=None, config=None):
+    """
+    Runs every case of the benchmark and compares its output with the golden output
+    :param repeat: number of runs per case
+    :param update: if True, the outputs are saved as the new golden outputs
+    :param output_file: json file to save the results to
+    :param baseline_file: results of a previous run to compare the latency with
+    :param config: settings to use, the defaults if None. Every window is switched off
+    :return: list with the results of every case
+    """
+
+    config = (config or Config()).replace(**{name: False for name in SHOW_SETTINGS})
+
+    preload_models(config)
+    model_loading = {f"{path} ({task})": timing for (path, task), timing in registry.timings.items()}
+
+    results = []
+    for case, use_case, img_path in CASES:
+        img = cv2.imread(img_path)
+        if img is None:
+            print(f"Skipping {case}, {img_path} could not be read")
+            continue
+
+        output, drawing, measurements = measure(USE_CASES[use_case], img, repeat, config)
+
+        if update:
+            save_golden(case, img_path, output)
+            print(f"Saved the output of {case} to {golden_path(case)}, check it before committing it")
+
+        expected = load_golden(case)
+        if expected is None:
+            print(f"No golden output for {case} in {GOLDEN_DIR}, its accuracy is not measured")
+            accuracy = None
+        elif use_case == "dot_to_dot":
+            accuracy = dot_accuracy(output, expected)
+        else:
+            accuracy = area_accuracy(output, expected)
+        results.append({"case": case, "use_case": use_case, "image": img_path, **measurements,
+                        "accuracy": accuracy, "drawing": drawing})
+
+    print(f"{'case':<26} {'p50':>9} {'p95':>9} {'memory':>9}  accuracy")
+    for result in results:
+        accuracy = "n/a"
+        if result["accuracy"] is not None:
+            accuracy = ", ".join(f"{name} {value:.2f}" for name, value in result["accuracy"].items())
+        print(f"{result['case']:<26} {result['latency']['p50']:>8.2f}s {result['latency']['p95']:>8.2f}s "
+              f"{result['peak_memory_mb']:>7.1f}MB  {accuracy}")
+        for name, stage in result["stages"].items():
+            print(f"  {name:<24} {stage['p50'] * 1000:>7.1f}ms {stage['p95'] * 1000:>7.1f}ms")
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump({"repeat": repeat, "model_loading": model_loading, "results": results}, f, indent=2)
+    print(f"Saved the results to {output_file}")
+
+    if baseline_file is not None:
+        compare_with_baseline(results, baseline_file)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure latency, memory and accuracy on the sample sheets')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs per case')
+    parser.add_argument('--update', action='store_true', help='save the outputs as the new golden outputs')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=None, help='results of a previous run to compare the latency with')
+    args = parser.parse_args()
+    run(args.repeat, args.update, args.output, args.baseline)
@@ -0,0 +1,141 @@
+class Config:
+    """
+    Settings of the application. Every module takes the config it should use as an argument, so the modules can be
+    used without the application. The values below are the defaults, single settings are changed by passing them
+    when the config is created, e.g. Config(dobot_streaming=False)
+    """
+
+    # Path of the trained yolo model for object detecion
+    object_detection_model_path = "resources/yolo_model/object_detection_model.pt"
+    # Path of the trained yolo model for object segmentation
+    object_segmentation_model_path = "resources/yolo_model/object_segmentation_model.pt"
+    # Path where the captured image will be saved
+    captured_img_path = "resources/captured_img/object_detection_test.jpg"
+    # Path where the detected image will be saved
+    save_dir = "resources/runs/detect"
+    # Path to the tesseract executable
+    pytesseract_path = "C:/Program Files/Tesseract-OCR/tesseract.exe"
+
+    # Model Settings
+    preload_models = True  # If True, both yolo models are loaded once at startup instead of on first use
+    warmup_models = True  # If True, every loaded model runs one inference on a blank frame
+    # "pytorch", "onnx" or "openvino". The models are exported next to their weights on first use and only used if
+    # they find the same objects as the pytorch model on the calibration images
+    inference_backend = "pytorch"
+    inference_int8 = False  # If True, the exported models are quantized to int8, calibrated on the calibration images
+    inference_imgsz = 640  # Image size the models are exported with
+    inference_calibration_images = "resources/captured_img"  # Images to quantize and check the exported models with
+    inference_min_agreement = 0.9  # Min precision and recall of an exported model against the pytorch model
+
+    # Webcam Settings
+    capture_webcam = False  # If True, a frame of the webcam is used instead of the image at captured_img_path
+    webcam_index = 1
+    webcam_resolution_width = 1920
+    webcam_resolution_height = 1080
+    webcam_buffer_size = 5  # Number of recent frames the capture service keeps
+    webcam_select_sharpest = True  # If True, the sharpest of the recent frames is used instead of the latest one
+
+    # Options to show results
+    # First use case: Draw dot to dot
+    show_detections = True  # Show the detections of the yolo model
+    show_cropped_number = False  # Show the cropped number with their recognized value
+    show_detected_dots = True  # Show the order of the detected dots
+    # Second use case: Color areas
+    show_polygons = False  # Show the polygons of the segmented image
+    show_calculated_points = True  # Show the calculated points of the segmented image
+
+    # Detection Settings
+    confidence_threshold = 0.1  # Threshold for the confidence of the yolo model detection
+    pairing_distance_ratio = 0.09  # Max distance between a number and its dot as a fraction of the image height
+    resize_factor = 2  # Factor to resize the cropped, detected number
+    threshold_value = 170  # Threshold value for the grayscale image of the cropped, detected number
+    threshold_max_value = 255  # Max value for the threshold_value
+    ocr_backend = "tesseract"  # "tesseract" or "template" (fast digit template matching with tesseract as fallback)
+    ocr_batched = True  # If True, all cropped numbers are read with one tesseract call instead of one call per number
+    ocr_min_confidence = 0.8  # Numbers read by the template backend with a lower confidence are read again by tesseract
+    ocr_templates_path = "resources/ocr_templates.npz"  # Digit templates trained with object_detection/ocr_backends.py
+    # If True, the detected numbers are cropped from the loaded image instead of saved to save_dir
+    in_memory_crops = True
+    tiled_inference = False  # If True, the sheet is located first and the yolo model runs on overlapping tiles of it
+    tile_size = 640  # Size of the tiles in pixels
+    # Overlap of neighbouring tiles as a fraction of the tile size, should exceed the size of a number
+    tile_overlap = 0.2
+    tile_batch_size = 4  # Number of tiles passed to the yolo model at once
+    # Boxes of a class overlapping a more confident box by more (of the smaller box) are removed
+    tile_nms_threshold = 0.5
+
+    # Batch Settings
+    batch_size = 8  # Number of images passed to the yolo model at once in batch mode (batch.py)
+    pipeline_queue_size = 2  # Number of sheets waiting in front of every stage of the pipeline (pipeline.py)
+    ocr_workers = 2  # Number of threads reading numbers in the pipeline
+    pipeline_poll_interval = 0.5  # Seconds between two frames while the pipeline waits for the next sheet
+
+    # Segmentation Settings
+    segmentation_confidence_threshold = 0.5  # Threshold for the confidence of the yolo model segmentation
+    polygon_tolerance_mm = 0.5  # Maximum deviation of the simplified polygons from the segmented outlines
+    polygon_smoothing_window = 5  # Number of vertices averaged to smooth the segmented outlines
+
+    # Result Window Resolution
+    result_window_width = 1920
+    result_window_height = 1080
+
+    # Review Settings
+    # "server" to review the results on a local web page without blocking, "window" for opencv windows and a dialog
+    review = "server"
+    review_host = "127.0.0.1"
+    review_port = 8050
+    review_auto_approve = True  # If True, sheets without problems are drawn without waiting for a review
+    review_timeout = None  # Seconds to wait for the review of a problem sheet before it is rejected, None waits
+    review_history = 20  # Number of reviewed sheets kept on the review page
+
+    # COM-Port of the Dobot
+    dobot_port = 0
+    # Dobot Settings
+    z_axis_height = -41
+    calc_points_offset_x = 194
+    calc_points_offset_y = 50
+    use_calibration = False  # If True, the homography saved by utils/calibration.py is used to convert the coordinates
+    calibration_path = "resources/calibration/homography.json"
+    # Corners of the sheet in the Dobot coordinate system (top left, top right, bottom right, bottom left in the image)
+    calibration_sheet_corners = [(194, -50), (194, 50), (294, 50), (294, -50)]
+    dobot_velocity = 100  # Velocity of the Dobot in mm/s
+    dobot_acceleration = 100  # Acceleration of the Dobot in mm/s^2
+    fill_pen_width = 2  # Distance between the hatch lines when filling an area in mm
+    fill_hatch_angle = 0  # Angle of the hatch lines when filling an area in degrees
+    fill_from_masks = True  # If True, the hatch lines are planned from the segmentation masks instead of the polygons
+    fill_mask_resolution = 0.5  # Distance in mm between the samples of a mask along a hatch line
+    dobot_streaming = True  # If True, moves are queued ahead of the execution instead of waiting for every move
+    dobot_lookahead = 10  # Maximum number of moves queued ahead of the executing move, the Dobot queue holds 32
+    dobot_command_overhead = 0.2  # Time in seconds pydobot needs to send one command, used for time estimates
+
+    # Result Cache Settings
+    result_cache = False  # If True, the results of a sheet are reused as long as the same sheet is under the camera
+    result_cache_dir = "resources/cache"  # Directory the results are stored in, None to keep them in memory only
+    result_cache_size = 8  # Number of sheets kept in memory
+    result_cache_disk_size = 100  # Number of sheets kept in result_cache_dir
+    result_cache_hash_distance = 10  # Max number of differing bits of the perceptual hashes of the same sheet
+    # Max mean difference of the gray values of a cell of the sheet, a larger change in any cell is a new sheet
+    result_cache_cell_threshold = 5.0
+    result_cache_corner_tolerance = 4.0  # Max distance in pixels the corners of the same sheet moved
+
+    # Profiling Settings
+    profiling = False  # If True, the stages of a run are timed and counted and a report is written to profiling_dir
+    profiling_dir = "resources/profiling"
+    profiling_format = "json"  # "json" or "csv"
+    profiling_hook = None  # None, "cprofile" or "pyinstrument" to additionally profile every function call of a run
+
+
+    def __init__(self, **settings):
+        for name, value in settings.items():
+            if not hasattr(Config, name) or callable(getattr(Config, name)):
+                raise AttributeError(f"Unknown setting: {name}")
+            setattr(self, name, value)
+
+    def replace(self, **settings):
+        """
+        Creates a copy of the config with some settings changed
+        :param settings: settings to change
+        :return: new config
+        """
+
+        return Config(**{**vars(self), **settings})
@@ -0,0 +1,133 @@
+import struct
+import threading
+import time
+from utils.profiling import count
+
+
+def queued_index(response):
+    """
+    Reads the index the Dobot assigned to a queued command from its response
+    :param response: response message of the queued command
+    :return: queued command index
+    """
+
+    if response is None or len(response.params) < 8:
+        raise RuntimeError("Dobot did not return a queued command index")
+    return struct.unpack_from('<Q', response.params, 0)[0]
+
+
+class CommandStream:
+    """
+    Streams moves to the command queue of the Dobot without waiting for every move to finish.
+    At most lookahead commands are queued ahead of the command the Dobot is executing, the progress is tracked
+    with the queued command indices. pause, resume and abort can be called from another thread
+    """
+
+    def __init__(self, bot, lookahead=10, poll_interval=0.05):
+        self.bot = bot
+        self.lookahead = lookahead
+        self.poll_interval = poll_interval
+        self.queued = 0
+        self.executed = 0
+        self.total = 0
+        self._running = threading.Event()
+        self._running.set()
+        self._aborted = threading.Event()
+
+    @property
+    def is_aborted(self):
+        return self._aborted.is_set()
+
+    def run(self, moves):
+        """
+        Queues all moves and returns once the Dobot executed the last one or the stream was aborted
+        :param moves: list of (x, y, z) moves
+        :return: True if all moves were executed, False if the stream was aborted
+        """
+
+        from pydobot.enums import PTPMode
+
+        self.total = len(moves)
+        self.queued = 0
+        self.executed = 0
+        first_index = None
+        last_index = None
+
+        for x, y, z in moves:
+            while not self._wait_for_slot(first_index, last_index):
+                if self.is_aborted:
+                    return False
+
+            count("serial_commands")
+            response = self.bot._set_ptp_cmd(x, y, z, 0, mode=PTPMode.MOVL_XYZ, wait=False)
+            last_index = queued_index(response)
+            if first_index is None:
+                first_index = last_index
+            self.queued += 1
+
+        while last_index is not None and not self.is_aborted:
+            self._update_progress(first_index)
+            if self.executed >= self.total:
+                return True
+            time.sleep(self.poll_interval)
+
+        return not self.is_aborted
+
+    def _wait_for_slot(self, first_index, last_index):
+        """
+        Waits until the stream is not paused and the queue has room for one more command
+        :param first_index: queued index of the first move
+        :param last_index: queued index of the last queued move
+        :return: True if the next command can be queued
+        """
+
+        self._running.wait()
+        if self.is_aborted:
+            return False
+        # The executed count only grows, so the index is only polled once the queue looks full
+        if last_index is None or self.queued - self.executed < self.lookahead:
+            return True
+
+        self._update_progress(first_index)
+        if self.queued - self.executed < self.lookahead:
+            return True
+
+        time.sleep(self.poll_interval)
+        return False
+
+    def _update_progress(self, first_index):
+        """
+        Updates the number of executed moves from the current queued command index of the Dobot
+        :param first_index: queued index of the first move
+        """
+
+        count("serial_commands")
+        current_index = self.bot._get_queued_cmd_current_index()
+        self.executed = max(self.executed, min(current_index - first_index + 1, self.queued))
+
+    def pause(self):
+        """
+        Stops the execution of the queue, queued commands are kept
+        """
+
+        self._running.clear()
+        self.bot._set_queued_cmd_stop_exec()
+
+    def resume(self):
+        """
+        Continues the execution of the queue after a pause
+        """
+
+        self.bot._set_queued_cmd_start_exec()
+        self._running.set()
+
+    def abort(self):
+        """
+        Stops the execution and removes all commands that are not executed yet
+        """
+
+        self._aborted.set()
+        self.bot._set_queued_cmd_stop_exec()
+        self.bot._set_queued_cmd_clear()
+        self.bot._set_queued_cmd_start_exec()
+        self._running.set()
@@ -1,31 +1,114 @@
 from logging import Logger
-from serial.tools import list_ports
-from pydobot import Dobot
+from config import Config
+from dobot.path_planner import merge_segments, plan_moves, estimate_travel_time, count_pen_lifts
+from dobot.command_stream import CommandStream
+from dobot.fill_planner import plan_area, plan_mask_area
+from dobot.region_ordering import order_regions, apply_order
+from utils.coordinate_transform import get_robot_transform, get_pixel_to_robot_transform
+from utils.profiling import timed, timer, count
 
 
-def calculate_points(points):
+def calculate_points(points, config=None):
     """
     Re-calculate the points to fit the Dobot's coordinate system
     :param points: List of points to calculate
+    :param config: settings to use, the defaults if None
     :return: List of calculated points
     """
 
-    from app import CALC_POINTS_OFFSET_X, CALC_POINTS_OFFSET_Y
+    if len(points) == 0:
+        return []
+    return get_robot_transform(config).apply(points).tolist()
 
-    output = []
-    for point in points:
-        print("Calc Input:", point)
-        new_point = [point[1] + CALC_POINTS_OFFSET_X, point[0] - CALC_POINTS_OFFSET_Y]
-        output.append(new_point)
-    return output
+
+def plan_dot_to_dot_path(points, config=None):
+    """
+    Plans the polylines that connect the dots in their order
+    :param points: List of points on the sheet
+    :param config: settings to use, the defaults if None
+    :return: List of polylines in the Dobot's coordinate system
+    """
+
+    points = calculate_points(points, config)
+    segments = [(points[x], points[x + 1]) for x in range(0, len(points) - 1)]
+    return merge_segments(segments)
+
+
+def plan_area_strokes(polygons, config=None):
+    """
+    Plans the strokes that color several areas, the order of the areas and the corner every fill starts at are
+    optimized to keep the pen-up travel short
+    :param polygons: List of polygons on the sheet, every polygon is a list of points
+    :param config: settings to use, the defaults if None
+    :return: List of strokes in the Dobot's coordinate system
+    """
+
+    config = config or Config()
+
+    with timer("fill_planning"):
+        # Every area is planned from both ends of its first scanline, so it can be entered at any of its corners
+        regions = [[plan_area([calculate_points(points, config)], config.fill_pen_width, config.fill_hatch_angle,
+                              start_right) for start_right in (False, True)]
+                   for points in polygons]
+
+    return order_area_strokes(regions)
+
+
+def plan_mask_strokes(masks, image_shape, config=None):
+    """
+    Plans the strokes that color the areas of segmentation masks, the hatch lines are planned from the masks
+    directly, so holes and concave areas are filled without converting the masks to polygons
+    :param masks: boolean array of shape (n, height, width)
+    :param image_shape: shape of the segmented image
+    :param config: settings to use, the defaults if None
+    :return: List of strokes in the Dobot's coordinate system
+    """
+
+    config = config or Config()
+    transform = get_pixel_to_robot_transform(image_shape[1], image_shape[0], config)
+
+    with timer("fill_planning"):
+        regions = [[plan_mask_area(mask, transform, config.fill_pen_width, config.fill_hatch_angle,
+                                   config.fill_mask_resolution, config.polygon_smoothing_window,
+                                   config.polygon_tolerance_mm, start_right) for start_right in (False, True)]
+                   for mask in masks]
+
+    return order_area_strokes(regions)
+
+
+def order_area_strokes(regions):
+    """
+    Orders the areas and chooses how every area is drawn to keep the pen-up travel between them short
+    :param regions: List of areas, every area is a list of variants and every variant a list of strokes
+    :return: List of strokes
+    """
+
+    regions = [[variant for variant in region if variant] for region in regions]
+    regions = [region for region in regions if region]
+
+    with timer("region_ordering"):
+        order, report = order_regions(regions)
+    print(f"ordered {len(regions)} areas in {report['time'] * 1000:.1f}ms, travel between areas: "
+          f"{report['travel_before']:.0f}mm -> {report['travel_after']:.0f}mm")
+
+    return apply_order(regions, order)
 
 
 class DobotController:
 
-    def __init__(self, logger: Logger, port=2):
+    # Seconds between two checks of the command queue while streaming
+    poll_interval = 0.05
+
+    def __init__(self, logger: Logger, port=2, device=None, config=None):
         self.logger = logger
+        self.config = config or Config()
         self.is_connected = False
-        self.bot = self.init_bot(port)
+        self.stream = None
+        if device is not None:
+            self.bot = device
+            self.is_connected = True
+        else:
+            self.bot = self.init_bot(port)
 
     def init_bot(self, port):
         """
@@ -34,6 +117,9 @@ class DobotController:
         :return: device
         """
 
+        from serial.tools import list_ports
+        from pydobot import Dobot
+
         ports = list_ports.comports()
         self.logger.debug("ports: {}".format(ports))
 
@@ -43,8 +129,7 @@ class DobotController:
 
         device_port = ports[port].device
         device = Dobot(port=device_port, verbose=False)
-
-        device.speed(100, 100)
+        device.speed(self.config.dobot_velocity, self.config.dobot_acceleration)
         self.is_connected = True
         return device
 
@@ -57,54 +142,119 @@ class DobotController:
         :param y2: y coordinate of point 2
         """
 
-        from app import Z_AXIS_HEIGHT
+        z_axis_height = self.config.z_axis_height
 
         try:
             print("drawing:", x1, y1, "to", x2, y2)
 
             self.bot.move_to(x1, y1, 0, 0, wait=True)
-            self.bot.move_to(x1, y1, Z_AXIS_HEIGHT, 0, wait=True)
-            self.bot.move_to(x2, y2, Z_AXIS_HEIGHT, 0, wait=True)
+            self.bot.move_to(x1, y1, z_axis_height, 0, wait=True)
+            self.bot.move_to(x2, y2, z_axis_height, 0, wait=True)
             self.bot.move_to(x2, y2, 0, 0, wait=True)
         except Exception as e:
             print('Error:', e)
             print("Coordinates out of range!")
 
+    @timed("drawing")
+    def execute_moves(self, moves):
+        """
+        Move the Dobot through a list of planned moves.
+        With dobot_streaming the moves are queued ahead of the execution, otherwise every move is awaited
+        :param moves: List of (x, y, z) moves
+        """
+
+        try:
+            if self.config.dobot_streaming:
+                self.stream = CommandStream(self.bot, lookahead=self.config.dobot_lookahead,
+                                            poll_interval=self.poll_interval)
+                self.stream.run(moves)
+            else:
+                for x, y, z in moves:
+                    count("serial_commands")
+                    self.bot.move_to(x, y, z, 0, wait=True)
+        except Exception as e:
+            print('Error:', e)
+            print("Coordinates out of range!")
+
+    def pause(self):
+        """
+        Pause the moves that are streamed to the Dobot
+        """
+
+        if self.stream is not None:
+            self.stream.pause()
+
+    def resume(self):
+        """
+        Resume the moves that are streamed to the Dobot
+        """
+
+        if self.stream is not None:
+            self.stream.resume()
+
+    def abort(self):
+        """
+        Stop the Dobot and drop all moves that are not executed yet
+        """
+
+        if self.stream is not None:
+            self.stream.abort()
+
+    def draw_polylines(self, polylines):
+        """
+        Draw polylines with the Dobot, the pen is only lifted between polylines
+        :param polylines: List of polylines, every polyline is a list of points
+        """
+
+        config = self.config
+
+        with timer("path_planning"):
+            moves = plan_moves(polylines, config.z_axis_height)
+        count("moves", len(moves))
+        count("pen_lifts", count_pen_lifts(moves, config.z_axis_height))
+        estimated_time = estimate_travel_time(moves, config.dobot_velocity, config.dobot_acceleration,
+                                              config.dobot_command_overhead)
+        print(f"drawing {len(polylines)} polylines with {len(moves)} moves, estimated time: {estimated_time:.1f}s")
+
+        self.execute_moves(moves)
+
     def draw_dot_to_dot(self, points):
         """
         Draw multiple lines with the Dobot from point to point
         :param points: List of points to draw
         """
 
-        points = calculate_points(points)
-        for x in range(0, len(points) - 1):
-            print("drawing:", points[x][0], points[x][1], points[x + 1][0], points[x + 1][1])
-            self.draw_line(points[x][0], points[x][1], points[x + 1][0], points[x + 1][1])
+        self.draw_polylines(plan_dot_to_dot_path(points, self.config))
 
-    def draw_area(self, points):
+    def draw_area(self, points, holes=None):
         """
-        Color an area with the Dobot by connecting the points and filling the area
+        Color an area with the Dobot by filling it with zig-zag hatch lines and drawing its outline
         :param points: List of points that form the area
+        :param holes: Optional list of point lists that form holes in the area
         """
 
-        calculated_points = calculate_points(points)
+        rings = [calculate_points(ring, self.config) for ring in [points] + list(holes or [])]
+        strokes = plan_area(rings, self.config.fill_pen_width, self.config.fill_hatch_angle)
+        if strokes:
+            self.draw_polylines(strokes)
 
-        for i in range(len(calculated_points) -1):
-            x1, y1 = calculated_points[i]
-            x2, y2 = calculated_points[i + 1]
-            self.draw_line(x1, y1, x2, y2)
-
-        x1, y1 = calculated_points[-1]
-        x2, y2 = calculated_points[0]
-        self.draw_line(x1, y1, x2, y2)
-        self.bot.move_to(x2, y2, -20, 0, wait=True)
+    def draw_areas(self, polygons):
+        """
+        Color several areas, the order and direction of the areas is optimized to keep the pen-up travel short
+        :param polygons: List of polygons, every polygon is a list of points
+        """
 
-        top_y = max([point[1] for point in calculated_points])
+        strokes = plan_area_strokes(polygons, self.config)
+        if strokes:
+            self.draw_polylines(strokes)
 
-        farthest_x = max(point[0] for point in calculated_points if point[1] == top_y)
-        nearest_x = min(point[0] for point in calculated_points if point[1] == top_y)
+    def draw_masks(self, masks, image_shape):
+        """
+        Color the areas of segmentation masks
+        :param masks: boolean array of shape (n, height, width)
+        :param image_shape: shape of the segmented image
+        """
 
-        current_y = top_y
-        while current_y > min([point[1] for point in calculated_points]):
-            self.draw_line(farthest_x, current_y, x2, current_y)
-            current_y -= 2
+        strokes = plan_mask_strokes(masks, image_shape, self.config)
+        if strokes:
+            self.draw_polylines(strokes)
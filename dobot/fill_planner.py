@@ -0,0 +1,361 @@
+import math
+import cv2
+import numpy as np
+from object_segmentation.simplify_polygons import smooth_polygon, simplify_polygon
+
+
+def rotate_points(points, angle):
+    """
+    Rotates points around the origin
+    :param points: array of shape (n, 2)
+    :param angle: angle in degrees
+    :return: rotated array of shape (n, 2)
+    """
+
+    radians = math.radians(angle)
+    rotation = np.array([[math.cos(radians), -math.sin(radians)], [math.sin(radians), math.cos(radians)]])
+    return np.asarray(points, dtype=np.float64) @ rotation.T
+
+
+def scanline_intervals(rings, ys):
+    """
+    Intersects horizontal scanlines with a polygon.
+    All crossings of all scanlines with all edges are calculated at once and paired with the even-odd rule, so
+    concave polygons and holes are handled
+    :param rings: list of arrays of shape (n, 2), the outer ring and optional holes
+    :param ys: y coordinates of the scanlines
+    :return: list with an array of shape (m, 2) of the (x_start, x_end) intervals inside the polygon per scanline
+    """
+
+    starts = np.concatenate([ring for ring in rings])
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    x1, y1 = starts[:, 0], starts[:, 1]
+    x2, y2 = ends[:, 0], ends[:, 1]
+
+    ys = np.asarray(ys, dtype=np.float64)[:, None]
+    # Half-open test, so a scanline through a vertex is only counted once
+    crosses = ((y1 <= ys) & (y2 > ys)) | ((y2 <= ys) & (y1 > ys))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xs = x1 + (ys - y1) * (x2 - x1) / (y2 - y1)
+    xs = np.sort(np.where(crosses, xs, np.nan), axis=1)
+    counts = crosses.sum(axis=1)
+
+    return [row[:count - count % 2].reshape(-1, 2) for row, count in zip(xs, counts)]
+
+
+def points_inside(rings, points, tolerance=0.0):
+    """
+    Tests which points lie inside a polygon with the even-odd rule
+    :param rings: list of arrays of shape (n, 2), the outer ring and optional holes
+    :param points: array of shape (m, 2)
+    :param tolerance: points closer to the boundary count as inside
+    :return: boolean array of shape (m,)
+    """
+
+    starts = np.concatenate([ring for ring in rings])
+    ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    x1, y1 = starts[:, 0], starts[:, 1]
+    x2, y2 = ends[:, 0], ends[:, 1]
+    xs, ys = points[:, :1], points[:, 1:]
+
+    # Counts the edges a ray to the right of every point crosses
+    crosses = ((y1 <= ys) & (y2 > ys)) | ((y2 <= ys) & (y1 > ys))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossings = crosses & (x1 + (ys - y1) * (x2 - x1) / (y2 - y1) > xs)
+    inside = crossings.sum(axis=1) % 2 == 1
+    if tolerance <= 0:
+        return inside
+
+    edges = ends - starts
+    lengths = np.maximum((edges ** 2).sum(axis=1), 1e-12)
+    t = np.clip(((points[:, None] - starts) * edges).sum(axis=2) / lengths, 0, 1)
+    distances = np.hypot(*(starts + t[..., None] * edges - points[:, None]).transpose(2, 0, 1)).min(axis=1)
+    return inside | (distances <= tolerance)
+
+
+def segment_inside(rings, start, end, tolerance):
+    """
+    Checks if a straight pen move stays inside a polygon, the move is sampled every tolerance
+    :param rings: list of arrays of shape (n, 2), the outer ring and optional holes
+    :param start: (x, y) start of the move
+    :param end: (x, y) end of the move
+    :param tolerance: points closer to the boundary count as inside
+    :return: True if no sample of the move lies outside the polygon
+    """
+
+    start, end = np.asarray(start, dtype=np.float64), np.asarray(end, dtype=np.float64)
+    samples = max(int(math.ceil(np.hypot(*(end - start)) / tolerance)), 2)
+    t = np.linspace(0, 1, samples + 1)[1:-1, None]
+    return bool(points_inside(rings, start + t * (end - start), tolerance).all())
+
+
+def link_intervals(rows, connected=None, start_right=False):
+    """
+    Links the intervals of consecutive scanlines to zig-zag strokes.
+    A stroke continues on the next scanline if the next interval overlaps the current one and the straight move
+    from the end of the current interval to the start of the next one stays inside the area, the pen then moves
+    down to the next scanline and draws it in the opposite direction. Otherwise the interval starts a new stroke
+    :param rows: list of (y, intervals) tuples from top to bottom or bottom to top
+    :param connected: function that takes the (x, y) start and end of a move between two scanlines and returns
+                      True if it stays inside the area, every move is drawn if None
+    :param start_right: if True, every stroke starts at the right end of its first interval
+    :return: list of strokes, every stroke is a list of (x, y) points
+    """
+
+    strokes = []
+    # Every active stroke is (stroke index, interval of the last scanline, True if it ended on the right side)
+    active = []
+
+    for y, intervals in rows:
+        used = np.zeros(len(intervals), dtype=bool)
+        next_active = []
+
+        for stroke_index, (a, b), ended_right in active:
+            overlapping = np.flatnonzero(~used & (intervals[:, 0] <= b) & (intervals[:, 1] >= a))
+            for i in overlapping:
+                start, end = intervals[i]
+                if ended_right:
+                    start, end = end, start
+                if connected is None or connected(strokes[stroke_index][-1], (start, y)):
+                    used[i] = True
+                    strokes[stroke_index].extend([(start, y), (end, y)])
+                    next_active.append((stroke_index, intervals[i], not ended_right))
+                    break
+
+        for i in np.flatnonzero(~used):
+            start, end = intervals[i]
+            if start_right:
+                start, end = end, start
+            strokes.append([(start, y), (end, y)])
+            next_active.append((len(strokes) - 1, intervals[i], not start_right))
+
+        active = next_active
+
+    return strokes
+
+
+def plan_fill(rings, pen_width, hatch_angle=0.0, start_right=False):
+    """
+    Plans the hatch lines to fill a polygon as zig-zag strokes that stay on the paper between adjacent scanlines
+    as long as the pen does not leave the polygon
+    :param rings: list of point lists, the outer ring and optional holes
+    :param pen_width: distance between the hatch lines
+    :param hatch_angle: angle of the hatch lines in degrees
+    :param start_right: if True, the first hatch line starts at its right end
+    :return: list of strokes, every stroke is a list of (x, y) points
+    """
+
+    rings = [rotate_points(ring, -hatch_angle) for ring in rings if len(ring) >= 3]
+    if not rings:
+        return []
+
+    all_points = np.concatenate(rings)
+    y_min, y_max = all_points[:, 1].min(), all_points[:, 1].max()
+    ys = np.arange(y_max - pen_width / 2, y_min, -pen_width)
+    if len(ys) == 0:
+        return []
+
+    rows = [(y, intervals) for y, intervals in zip(ys, scanline_intervals(rings, ys)) if len(intervals)]
+
+    # The intervals end exactly on the boundary, so a small tolerance only absorbs rounding
+    strokes = link_intervals(rows, lambda start, end: segment_inside(rings, start, end, pen_width / 10), start_right)
+    return [[tuple(point) for point in rotate_points(stroke, hatch_angle)] for stroke in strokes]
+
+
+def plan_area(rings, pen_width, hatch_angle=0.0, start_right=False):
+    """
+    Plans the strokes to color an area, the hatch lines first and then the outline of every ring
+    :param rings: list of point lists, the outer ring and optional holes
+    :param pen_width: distance between the hatch lines
+    :param hatch_angle: angle of the hatch lines in degrees
+    :param start_right: if True, the first hatch line starts at its right end
+    :return: list of strokes, every stroke is a list of (x, y) points
+    """
+
+    rings = [np.asarray(ring, dtype=np.float64) for ring in rings if len(ring) >= 3]
+    return add_outlines(plan_fill(rings, pen_width, hatch_angle, start_right), rings, pen_width)
+
+
+def add_outlines(strokes, rings, pen_width):
+    """
+    Appends the outline of every ring to the strokes of an area.
+    Every outline starts at its point closest to the end of the previous stroke, so the pen moves as little as
+    possible between them and stays down if the point is within one pen width
+    :param strokes: list of strokes, the hatch lines of the area
+    :param rings: list of arrays of shape (n, 2)
+    :param pen_width: distance between the hatch lines
+    :return: list of strokes
+    """
+
+    position = np.asarray(strokes[-1][-1]) if strokes else None
+    for ring in rings:
+        connected = False
+        if position is not None:
+            ring, distance = start_ring_at(ring, position)
+            # The hatch lines end on the boundary, so the pen can stay down on the way to the outline
+            connected = distance <= pen_width
+        outline = [tuple(point) for point in ring.tolist()]
+        outline.append(outline[0])
+        if connected:
+            strokes[-1].extend(outline)
+        else:
+            strokes.append(outline)
+        position = ring[0]
+
+    return strokes
+
+
+def start_ring_at(ring, position):
+    """
+    Rotates a ring so it starts at the point of its boundary closest to a position,
+    the point is inserted as a new vertex if it lies on an edge
+    :param ring: array of shape (n, 2)
+    :param position: (x, y) position
+    :return: the rotated ring and the distance of its new first point to the position
+    """
+
+    starts = ring
+    ends = np.roll(ring, -1, axis=0)
+    edges = ends - starts
+    lengths = np.maximum((edges ** 2).sum(axis=1), 1e-12)
+    t = np.clip(((position - starts) * edges).sum(axis=1) / lengths, 0, 1)
+    closest = starts + t[:, None] * edges
+    distances = np.hypot(*(closest - position).T)
+
+    edge = int(distances.argmin())
+    rotated = np.roll(ring, -(edge + 1), axis=0)
+    if t[edge] < 1:
+        rotated = np.concatenate([closest[edge:edge + 1], rotated])
+        if t[edge] == 0:
+            # The closest point is the first vertex of the edge, which is now the last vertex of the ring
+            rotated = rotated[:-1]
+    return rotated, float(distances[edge])
+
+
+def mask_runs(raster):
+    """
+    Finds the runs of set cells in every row of a boolean raster
+    :param raster: boolean array of shape (rows, columns)
+    :return: arrays with the row, the first column and the column after the last cell of every run, sorted by row
+    """
+
+    padded = np.pad(raster.astype(np.int8), ((0, 0), (1, 1)))
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends
+
+
+def rasterize_mask(mask, transform, pen_width, hatch_angle=0.0, resolution=0.5):
+    """
+    Samples a mask on a grid in the rotated plane of the hatch lines, every row of the grid is one hatch line.
+    The rows are one pen width apart and the columns resolution apart, so the mask is only sampled where the pen draws
+    :param mask: boolean array of shape (height, width) in image pixels
+    :param transform: transform from image pixels to the plane of the strokes
+    :param pen_width: distance between the hatch lines
+    :param hatch_angle: angle of the hatch lines in degrees
+    :param resolution: distance between the samples along a hatch line
+    :return: boolean raster and the (x, y) position of the center of its first cell in the rotated plane,
+             or (None, None) if the mask is empty
+    """
+
+    left, top, width, height = cv2.boundingRect(mask.astype(np.uint8))
+    if width == 0 or height == 0:
+        return None, None
+
+    right, bottom = left + width, top + height
+    corners = np.array([(left, top), (right, top), (right, bottom), (left, bottom)], dtype=np.float64)
+    rotated = rotate_points(transform.apply(corners), -hatch_angle)
+    x_min, y_min = rotated.min(axis=0)
+    x_max, y_max = rotated.max(axis=0)
+    columns = max(int(math.ceil((x_max - x_min) / resolution)), 1)
+    rows = max(int(math.ceil((y_max - y_min) / pen_width)), 1)
+    origin = np.array([x_min + resolution / 2, y_min + pen_width / 2])
+
+    # Raster cell -> rotated plane -> plane of the strokes -> image pixels -> pixels of the cropped mask.
+    # Only the bounding rectangle of the mask is converted and warped instead of the whole image
+    radians = math.radians(hatch_angle)
+    rotation = np.array([[math.cos(radians), -math.sin(radians), 0], [math.sin(radians), math.cos(radians), 0],
+                         [0, 0, 1]])
+    cells = np.array([[resolution, 0, origin[0]], [0, pen_width, origin[1]], [0, 0, 1]])
+    crop = np.array([[1, 0, -left], [0, 1, -top], [0, 0, 1]])
+    matrix = crop @ transform.inverse().matrix @ rotation @ cells
+
+    raster = cv2.warpPerspective(mask[top:bottom, left:right].astype(np.float32), matrix, (columns, rows),
+                                 flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+    return raster >= 0.5, origin
+
+
+def plan_mask_fill(mask, transform, pen_width, hatch_angle=0.0, resolution=0.5, start_right=False):
+    """
+    Plans the hatch lines to fill a mask as zig-zag strokes without converting it to a polygon first.
+    The runs of every row of the rasterized mask are the intervals of a hatch line, so concave areas and holes of
+    any shape are filled correctly
+    :param mask: boolean array of shape (height, width) in image pixels
+    :param transform: transform from image pixels to the plane of the strokes
+    :param pen_width: distance between the hatch lines
+    :param hatch_angle: angle of the hatch lines in degrees
+    :param resolution: distance between the samples along a hatch line
+    :param start_right: if True, the first hatch line starts at its right end
+    :return: list of strokes, every stroke is a list of (x, y) points
+    """
+
+    raster, origin = rasterize_mask(mask, transform, pen_width, hatch_angle, resolution)
+    if raster is None:
+        return []
+
+    rows, starts, ends = mask_runs(raster)
+    if len(rows) == 0:
+        return []
+
+    # A hatch line runs from the left edge of the first cell of a run to the right edge of its last cell
+    intervals = np.column_stack([starts - 0.5, ends - 0.5]) * resolution + origin[0]
+    ys = rows * pen_width + origin[1]
+    splits = np.flatnonzero(np.diff(rows)) + 1
+    lines = [(ys[indices[0]], intervals[indices]) for indices in np.split(np.arange(len(rows)), splits)]
+
+    # The ends of the runs are only known to the resolution, so the moves may leave the outlines by as much
+    rings = [rotate_points(ring, -hatch_angle) for ring in mask_outlines(mask, transform, 0, resolution / 4)]
+    connected = (lambda start, end: segment_inside(rings, start, end, resolution)) if rings else None
+    strokes = link_intervals(lines, connected, start_right)
+    return [[tuple(point) for point in rotate_points(stroke, hatch_angle)] for stroke in strokes]
+
+
+def mask_outlines(mask, transform, smoothing_window=5, tolerance=0.5):
+    """
+    Extracts the outer boundary and the holes of a mask as simplified rings
+    :param mask: boolean array of shape (height, width) in image pixels
+    :param transform: transform from image pixels to the plane of the strokes
+    :param smoothing_window: number of vertices averaged to smooth the rings
+    :param tolerance: maximum deviation of the simplified rings from the boundary
+    :return: list of arrays of shape (n, 2)
+    """
+
+    contours = cv2.findContours(mask.astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)[0]
+    rings = []
+    for contour in contours:
+        points = transform.apply(contour.reshape(-1, 2).astype(np.float64))
+        points = simplify_polygon(smooth_polygon(points, smoothing_window), tolerance)
+        if len(points) >= 3:
+            rings.append(points)
+    return rings
+
+
+def plan_mask_area(mask, transform, pen_width, hatch_angle=0.0, resolution=0.5, smoothing_window=5,
+                   tolerance=0.5, start_right=False):
+    """
+    Plans the strokes to color the area of a mask, the hatch lines first and then its outlines
+    :param mask: boolean array of shape (height, width) in image pixels
+    :param transform: transform from image pixels to the plane of the strokes
+    :param pen_width: distance between the hatch lines
+    :param hatch_angle: angle of the hatch lines in degrees
+    :param resolution: distance between the samples along a hatch line
+    :param smoothing_window: number of vertices averaged to smooth the outlines
+    :param tolerance: maximum deviation of the simplified outlines from the boundary
+    :param start_right: if True, the first hatch line starts at its right end
+    :return: list of strokes, every stroke is a list of (x, y) points
+    """
+
+    strokes = plan_mask_fill(mask, transform, pen_width, hatch_angle, resolution, start_right)
+    return add_outlines(strokes, mask_outlines(mask, transform, smoothing_window, tolerance), pen_width)
@@ -0,0 +1,90 @@
+import math
+
+
+def merge_segments(segments, tolerance=1e-6):
+    """
+    Merges line segments into polylines, a segment that starts where the previous one ended continues its polyline
+    :param segments: list of ((x1, y1), (x2, y2)) segments in drawing order
+    :param tolerance: maximum distance between two points to be treated as the same point
+    :return: list of polylines, every polyline is a list of (x, y) points
+    """
+
+    polylines = []
+    for start, end in segments:
+        if polylines and math.dist(polylines[-1][-1], start) <= tolerance:
+            polylines[-1].append(tuple(end))
+        else:
+            polylines.append([tuple(start), tuple(end)])
+    return polylines
+
+
+def plan_moves(polylines, draw_height, travel_height=0):
+    """
+    Converts polylines to the moves of the Dobot.
+    The pen is lowered once at the start and lifted once at the end of every polyline
+    :param polylines: list of polylines, every polyline is a list of (x, y) points
+    :param draw_height: z coordinate of the pen on the paper
+    :param travel_height: z coordinate of the lifted pen
+    :return: list of (x, y, z) moves
+    """
+
+    moves = []
+    for polyline in polylines:
+        x, y = polyline[0]
+        moves.append((x, y, travel_height))
+        moves.append((x, y, draw_height))
+        for x, y in polyline[1:]:
+            moves.append((x, y, draw_height))
+        moves.append((x, y, travel_height))
+    return moves
+
+
+def count_pen_lifts(moves, draw_height):
+    """
+    Counts how often the pen is lifted from the paper
+    :param moves: list of (x, y, z) moves
+    :param draw_height: z coordinate of the pen on the paper
+    :return: number of pen lifts
+    """
+
+    lifts = 0
+    for previous, move in zip(moves, moves[1:]):
+        if previous[2] == draw_height and move[2] != draw_height:
+            lifts += 1
+    return lifts
+
+
+def estimate_move_time(distance, velocity, acceleration):
+    """
+    Estimates the time of a single move with a trapezoidal velocity profile
+    :param distance: length of the move in mm
+    :param velocity: maximum velocity in mm/s
+    :param acceleration: acceleration in mm/s^2
+    :return: time of the move in seconds
+    """
+
+    if distance <= 0:
+        return 0.0
+    if distance < velocity ** 2 / acceleration:
+        # The maximum velocity is never reached
+        return 2 * math.sqrt(distance / acceleration)
+    return distance / velocity + velocity / acceleration
+
+
+def estimate_travel_time(moves, velocity, acceleration, command_overhead=0.0, start=None):
+    """
+    Estimates the time the Dobot needs to execute a list of moves
+    :param moves: list of (x, y, z) moves
+    :param velocity: maximum velocity in mm/s
+    :param acceleration: acceleration in mm/s^2
+    :param command_overhead: time in seconds every command costs on top of the motion
+    :param start: (x, y, z) position before the first move, the first move is not timed if None
+    :return: estimated time in seconds
+    """
+
+    total = command_overhead * len(moves)
+    previous = start if start is not None else (moves[0] if moves else None)
+    for move in moves:
+        total += estimate_move_time(math.dist(previous, move), velocity, acceleration)
+        previous = move
+    return total
@@ -0,0 +1,182 @@
+import time
+import numpy as np
+
+
+def region_options(regions):
+    """
+    Returns the entry and the exit point of every way to draw every region.
+    A region is drawn as one of its variants, forwards or backwards, option o is variant o // 2 and drawn backwards
+    if o is odd. Regions with fewer variants repeat their last one
+    :param regions: list of regions, every region is a list of variants and every variant a list of strokes
+    :return: arrays of shape (n, m, 2) with the entry and with the exit points, m is twice the number of variants
+    """
+
+    variants = max(len(region) for region in regions)
+    starts = np.array([[region[min(v, len(region) - 1)][0][0] for v in range(variants)] for region in regions],
+                      dtype=np.float64)
+    ends = np.array([[region[min(v, len(region) - 1)][-1][-1] for v in range(variants)] for region in regions],
+                    dtype=np.float64)
+    entries = np.stack([starts, ends], axis=2).reshape(len(regions), 2 * variants, 2)
+    exits = np.stack([ends, starts], axis=2).reshape(len(regions), 2 * variants, 2)
+    return entries, exits
+
+
+def travel_distance(regions, order, start=None):
+    """
+    Calculates the pen-up travel between the regions for an order
+    :param regions: list of regions, every region is a list of variants and every variant a list of strokes
+    :param order: list of (region index, variant, reversed) tuples
+    :param start: (x, y) position before the first region, the travel to the first region is ignored if None
+    :return: travel distance
+    """
+
+    position = None if start is None else np.asarray(start, dtype=np.float64)
+    distance = 0.0
+    for index, variant, reverse in order:
+        strokes = regions[index][variant]
+        entry, exit_ = (strokes[-1][-1], strokes[0][0]) if reverse else (strokes[0][0], strokes[-1][-1])
+        entry, exit_ = np.asarray(entry, dtype=np.float64), np.asarray(exit_, dtype=np.float64)
+        if position is not None:
+            distance += float(np.hypot(*(entry - position)))
+        position = exit_
+    return distance
+
+
+def nearest_neighbour_order(entries, exits, start=None):
+    """
+    Orders the regions by always moving to the closest entry point of a region that is not drawn yet
+    :param entries: array of shape (n, m, 2) with the entry point of every option of every region
+    :param exits: array of shape (n, m, 2) with the exit point of every option of every region
+    :param start: (x, y) position before the first region
+    :return: list of (region index, option) tuples
+    """
+
+    count = len(entries)
+    remaining = np.ones(count, dtype=bool)
+    position = entries[0, 0] if start is None else np.asarray(start, dtype=np.float64)
+    order = []
+
+    for _ in range(count):
+        distances = np.hypot(entries[..., 0] - position[0], entries[..., 1] - position[1])
+        distances[~remaining] = np.inf
+        index, option = np.unravel_index(int(distances.argmin()), distances.shape)
+        remaining[index] = False
+        order.append((int(index), int(option)))
+        position = exits[index, option]
+
+    return order
+
+
+def two_opt(order, entries, exits, start=None, max_passes=5):
+    """
+    Improves an order by reversing sections of it, a reversed section is drawn backwards and every region in it
+    changes its direction. The gain of all sections starting at one region is calculated at once.
+    After every pass each region takes the option that is the shortest between its new neighbours
+    :param order: list of (region index, option) tuples
+    :param entries: array of shape (n, m, 2) with the entry point of every option of every region
+    :param exits: array of shape (n, m, 2) with the exit point of every option of every region
+    :param start: (x, y) position before the first region
+    :param max_passes: maximum number of passes over the order
+    :return: improved list of (region index, option) tuples
+    """
+
+    indices = np.array([index for index, _ in order])
+    options = np.array([option for _, option in order])
+    count = len(indices)
+
+    # Entry and exit point of every position of the order
+    region_entries, region_exits = entries, exits
+    entries = region_entries[indices, options]
+    exits = region_exits[indices, options]
+    start = None if start is None else np.asarray(start, dtype=np.float64)
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(count - 1):
+            previous = exits[i - 1] if i > 0 else start
+
+            # Reversing i..j replaces the edges previous -> entry i and exit j -> entry j+1
+            # with previous -> exit j and entry i -> entry j+1
+            following = entries[i + 2:]
+            old = np.zeros(count - i - 1)
+            new = np.zeros(count - i - 1)
+            old[:-1] = np.hypot(*(following - exits[i + 1:-1]).T)
+            new[:-1] = np.hypot(*(following - entries[i]).T)
+            if previous is not None:
+                old += np.hypot(*(entries[i] - previous))
+                new += np.hypot(*(exits[i + 1:] - previous).T)
+
+            gains = old - new
+            best = int(gains.argmax())
+            if gains[best] > 1e-9:
+                last = i + 1 + best
+                section = slice(i, last + 1)
+                indices[section] = indices[section][::-1]
+                # Flipping the lowest bit of an option draws the same variant in the other direction
+                options[section] = options[section][::-1] ^ 1
+                entries[section], exits[section] = exits[section][::-1].copy(), entries[section][::-1].copy()
+                improved = True
+
+        for i in range(count):
+            previous = exits[i - 1] if i > 0 else start
+            costs = np.zeros(region_entries.shape[1])
+            if previous is not None:
+                costs += np.hypot(*(region_entries[indices[i]] - previous).T)
+            if i < count - 1:
+                costs += np.hypot(*(entries[i + 1] - region_exits[indices[i]]).T)
+            best = int(costs.argmin())
+            if costs[best] < costs[options[i]] - 1e-9:
+                options[i] = best
+                entries[i], exits[i] = region_entries[indices[i], best], region_exits[indices[i], best]
+                improved = True
+
+        if not improved:
+            break
+
+    return list(zip(indices.tolist(), options.tolist()))
+
+
+def order_regions(regions, start=None):
+    """
+    Finds an order of the regions and the way to draw every region that keeps the pen-up travel between the regions
+    short, with a nearest neighbour tour improved by 2-opt. Every region is drawn as one of its variants, forwards or
+    backwards, e.g. a zig-zag fill planned from the left and from the right end of its first scanline can be entered
+    at both ends of its first and of its last scanline
+    :param regions: list of regions, every region is a list of variants and every variant a list of strokes
+    :param start: (x, y) position before the first region
+    :return: list of (region index, variant, reversed) tuples and a report with the travel before and after
+    """
+
+    if not regions:
+        return [], {"travel_before": 0.0, "travel_after": 0.0, "time": 0.0}
+
+    started = time.perf_counter()
+    entries, exits = region_options(regions)
+    order = two_opt(nearest_neighbour_order(entries, exits, start), entries, exits, start)
+    order = [(index, min(option // 2, len(regions[index]) - 1), bool(option % 2)) for index, option in order]
+    elapsed = time.perf_counter() - started
+
+    original = [(index, 0, False) for index in range(len(regions))]
+    report = {
+        "travel_before": travel_distance(regions, original, start),
+        "travel_after": travel_distance(regions, order, start),
+        "time": elapsed,
+    }
+    return order, report
+
+
+def apply_order(regions, order):
+    """
+    Concatenates the strokes of the regions in the given order, variant and direction
+    :param regions: list of regions, every region is a list of variants and every variant a list of strokes
+    :param order: list of (region index, variant, reversed) tuples
+    :return: list of strokes
+    """
+
+    strokes = []
+    for index, variant, reverse in order:
+        if reverse:
+            strokes.extend(stroke[::-1] for stroke in regions[index][variant][::-1])
+        else:
+            strokes.extend(regions[index][variant])
+    return strokes
@@ -0,0 +1,171 @@
+import math
+import struct
+import threading
+import time
+from collections import deque
+from dobot.path_planner import estimate_move_time
+
+
+class SimulatedMessage:
+    """
+    Response of the simulated device, shaped like the messages of pydobot
+    """
+
+    def __init__(self, params=b""):
+        self.params = bytearray(params)
+
+
+class SimulatedDevice:
+    """
+    Stand-in for pydobot.Dobot that needs no serial port.
+    Queued moves are executed in the background based on the elapsed time, each move takes as long as a move with
+    a trapezoidal velocity profile would take on the arm. time_scale speeds the simulation up.
+    With virtual_clock the device does not use the real time at all: every message advances the clock by
+    command_latency, so a whole drawing is simulated instantly and elapsed_time estimates its wall-clock time
+    """
+
+    def __init__(self, port=None, verbose=False, velocity=100., acceleration=100., queue_size=32, time_scale=1.0,
+                 command_latency=0.0, virtual_clock=False, pen_height=None):
+        self.port = port
+        self.verbose = verbose
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.queue_size = queue_size
+        self.time_scale = time_scale
+        self.command_latency = command_latency
+        self.virtual_clock = virtual_clock
+        self.pen_height = pen_height
+        self.lock = threading.Lock()
+
+        if virtual_clock and command_latency <= 0:
+            raise ValueError("The virtual clock needs a command latency to advance")
+
+        self.position = (0.0, 0.0, 0.0, 0.0)
+        self.executed = []
+        self.commands_sent = 0
+        self.pen_lifts = 0
+        self.motion_time = 0.0
+        self._virtual_time = 0.0
+        self._start_time = self._now()
+        self._queue = deque()
+        self._next_index = 0
+        self._current_index = 0
+        self._running = True
+        self._move_started = None
+
+    def _now(self):
+        if self.virtual_clock:
+            return self._virtual_time
+        return time.monotonic() * self.time_scale
+
+    @property
+    def elapsed_time(self):
+        """
+        Simulated time since the device was created in seconds
+        """
+
+        return self._now() - self._start_time
+
+    def _advance(self):
+        """
+        Executes all queued moves that finished since the last call
+        """
+
+        now = self._now()
+        while self._running and self._queue:
+            index, target, duration = self._queue[0]
+            if self._move_started is None:
+                self._move_started = now
+            if now - self._move_started < duration:
+                break
+            self._queue.popleft()
+            self._move_started += duration
+            self._execute(target, duration)
+            self._current_index = index
+        if not self._queue:
+            self._move_started = None
+
+    def _execute(self, target, duration):
+        """
+        Records an executed move
+        :param target: (x, y, z, r) position the move ends at
+        :param duration: time of the move in seconds
+        """
+
+        if self.pen_height is not None and self.position[2] <= self.pen_height < target[2]:
+            self.pen_lifts += 1
+        self.motion_time += duration
+        self.executed.append((self.position, target))
+        self.position = target
+
+    def _send(self):
+        self.commands_sent += 1
+        if self.virtual_clock:
+            self._virtual_time += self.command_latency
+        elif self.command_latency:
+            time.sleep(self.command_latency)
+
+    def _set_ptp_cmd(self, x, y, z, r, mode, wait):
+        self._send()
+        with self.lock:
+            self._advance()
+            if len(self._queue) >= self.queue_size:
+                raise RuntimeError("Command queue of the simulated Dobot is full")
+
+            previous = self._queue[-1][1] if self._queue else self.position
+            target = (float(x), float(y), float(z), float(r))
+            distance = math.dist(previous[:3], target[:3])
+            duration = estimate_move_time(distance, self.velocity, self.acceleration)
+
+            self._next_index += 1
+            index = self._next_index
+            self._queue.append((index, target, duration))
+
+        while wait and self._get_queued_cmd_current_index() < index:
+            if not self.virtual_clock:
+                time.sleep(0.001)
+        return SimulatedMessage(struct.pack('<Q', index))
+
+    def _get_queued_cmd_current_index(self):
+        self._send()
+        with self.lock:
+            self._advance()
+            return self._current_index
+
+    def _set_queued_cmd_start_exec(self):
+        self._send()
+        with self.lock:
+            if not self._running:
+                self._running = True
+                self._move_started = None
+        return SimulatedMessage()
+
+    def _set_queued_cmd_stop_exec(self):
+        self._send()
+        with self.lock:
+            self._advance()
+            self._running = False
+        return SimulatedMessage()
+
+    def _set_queued_cmd_clear(self):
+        self._send()
+        with self.lock:
+            self._queue.clear()
+            self._move_started = None
+        return SimulatedMessage()
+
+    def move_to(self, x, y, z, r, wait=False):
+        self._set_ptp_cmd(x, y, z, r, mode=None, wait=wait)
+
+    def speed(self, velocity=100., acceleration=100.):
+        self._send()
+        self.velocity = velocity
+        self.acceleration = acceleration
+
+    def pose(self):
+        with self.lock:
+            self._advance()
+            return self.position + (0.0, 0.0, 0.0, 0.0)
+
+    def close(self):
+        pass
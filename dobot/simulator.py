@@ -0,0 +1,92 @@
+import math
+from logging import Logger
+import cv2
+import numpy as np
+from config import Config
+from dobot.dobot_controller import DobotController
+from dobot.simulated_device import SimulatedDevice
+
+
+class SimulatedDobotController(DobotController):
+    """
+    DobotController that draws on a simulated Dobot instead of the arm on a COM port.
+    The device runs on a virtual clock, so drawings are simulated instantly and their wall-clock time is estimated
+    from the motion of the arm and the serial latency of every command
+    """
+
+    poll_interval = 0
+
+    def __init__(self, logger: Logger = None, velocity=None, acceleration=None, command_latency=None, config=None):
+        config = config or Config()
+        device = SimulatedDevice(
+            velocity=velocity if velocity is not None else config.dobot_velocity,
+            acceleration=acceleration if acceleration is not None else config.dobot_acceleration,
+            command_latency=command_latency if command_latency is not None else config.dobot_command_overhead,
+            virtual_clock=True,
+            pen_height=config.z_axis_height,
+        )
+        super().__init__(logger=logger or Logger(name="dobot-simulator"), device=device, config=config)
+
+    def stats(self):
+        """
+        Returns the statistics of everything drawn so far
+        :return: dictionary with the statistics
+        """
+
+        z_axis_height = self.config.z_axis_height
+
+        draw_distance = 0.0
+        travel_distance = 0.0
+        for start, end in self.bot.executed:
+            distance = math.dist(start[:3], end[:3])
+            if start[2] <= z_axis_height and end[2] <= z_axis_height:
+                draw_distance += distance
+            else:
+                travel_distance += distance
+
+        return {
+            "commands": self.bot.commands_sent,
+            "moves": len(self.bot.executed),
+            "pen_lifts": self.bot.pen_lifts,
+            "draw_distance": draw_distance,
+            "travel_distance": travel_distance,
+            "motion_time": self.bot.motion_time,
+            "elapsed_time": self.bot.elapsed_time,
+        }
+
+    def render_trajectory(self, output_file=None, size=800, margin=20):
+        """
+        Renders the drawn trajectory as an image, pen-down moves are black and pen-up moves are light blue.
+        The approach from the start pose of the device is left out, so the image is scaled to the drawing
+        :param output_file: path to save the image, the image is only returned if None
+        :param size: size of the longer side of the image in pixels
+        :param margin: margin around the trajectory in pixels
+        :return: the rendered image
+        """
+
+        z_axis_height = self.config.z_axis_height
+
+        moves = [(start, end) for start, end in self.bot.executed[1:] if start[:2] != end[:2]]
+        img = np.full((size, size, 3), 255, dtype=np.uint8)
+        if not moves:
+            return img
+
+        points = np.array([point[:2] for move in moves for point in move])
+        minimum = points.min(axis=0)
+        extent = max((points.max(axis=0) - minimum).max(), 1e-6)
+        scale = (size - 2 * margin) / extent
+
+        def to_pixel(point):
+            # The x axis of the Dobot points away from the base, so it is drawn upwards
+            x = margin + (point[1] - minimum[1]) * scale
+            y = size - margin - (point[0] - minimum[0]) * scale
+            return int(round(x)), int(round(y))
+
+        for start, end in moves:
+            pen_down = start[2] <= z_axis_height and end[2] <= z_axis_height
+            color = (0, 0, 0) if pen_down else (230, 200, 150)
+            cv2.line(img, to_pixel(start), to_pixel(end), color, 2 if pen_down else 1, cv2.LINE_AA)
+
+        if output_file is not None:
+            cv2.imwrite(output_file, img)
+        return img
@@ -0,0 +1,160 @@
+import atexit
+import threading
+import time
+from collections import deque
+import cv2
+from config import Config
+from utils.profiling import timed
+
+
+def frame_sharpness(frame):
+    """
+    Measures the sharpness of a frame as the variance of its Laplacian
+    :param frame: image to measure
+    :return: sharpness, higher is sharper
+    """
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, (0, 0), fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+class CaptureService:
+    """
+    Keeps the webcam open and grabs frames in a background thread into a ring buffer of the most recent frames,
+    so the pipeline gets a settled frame as an array without opening the camera for every sheet
+    """
+
+    def __init__(self, camera_index=1, width=1920, height=1080, buffer_size=5):
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.frames = deque(maxlen=buffer_size)
+        self._capture = None
+        self._thread = None
+        self._running = threading.Event()
+        self._new_frame = threading.Condition()
+
+    @property
+    def is_running(self):
+        return self._running.is_set()
+
+    def start(self):
+        """
+        Opens the camera and starts the background thread
+        """
+
+        if self.is_running:
+            return
+
+        self._capture = cv2.VideoCapture(self.camera_index)
+        self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if not self._capture.isOpened():
+            self._capture.release()
+            raise RuntimeError(f"Cannot open camera {self.camera_index}")
+
+        self._running.set()
+        self._thread = threading.Thread(target=self._grab_frames, name="capture-service", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and releases the camera
+        """
+
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def _grab_frames(self):
+        while self.is_running:
+            ret, frame = self._capture.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self._new_frame:
+                self.frames.append((time.monotonic(), frame))
+                self._new_frame.notify_all()
+
+    def latest_frame(self, timeout=5.0, newer_than=None):
+        """
+        Returns the most recent frame
+        :param timeout: maximum time in seconds to wait for a frame
+        :param newer_than: only frames grabbed after this time.monotonic() timestamp are returned
+        :return: the frame
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._new_frame:
+            while not self.frames or (newer_than is not None and self.frames[-1][0] <= newer_than):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._new_frame.wait(remaining):
+                    raise TimeoutError("No frame received from the camera")
+            return self.frames[-1][1]
+
+    def sharpest_frame(self, timeout=5.0):
+        """
+        Returns the sharpest frame of the ring buffer, waits until the buffer is full
+        :param timeout: maximum time in seconds to wait for the buffer to fill up
+        :return: the frame
+        """
+
+        deadline = time.monotonic() + timeout
+        with self._new_frame:
+            while len(self.frames) < self.frames.maxlen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._new_frame.wait(remaining):
+                    break
+            frames = [frame for _, frame in self.frames]
+
+        if not frames:
+            raise TimeoutError("No frame received from the camera")
+        return max(frames, key=frame_sharpness)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+_service = None
+
+
+def get_capture_service(config=None):
+    """
+    Returns the capture service of the process and starts it on first use
+    :param config: settings to use for the camera, the defaults if None
+    :return: capture service
+    """
+
+    config = config or Config()
+
+    global _service
+    if _service is None:
+        _service = CaptureService(config.webcam_index, config.webcam_resolution_width,
+                                  config.webcam_resolution_height, config.webcam_buffer_size)
+        atexit.register(_service.stop)
+    _service.start()
+    return _service
+
+
+@timed("capture")
+def capture_frame(config=None):
+    """
+    Captures a frame with the capture service of the process
+    :param config: settings to use, the defaults if None
+    :return: the captured frame
+    """
+
+    config = config or Config()
+    service = get_capture_service(config)
+    if config.webcam_select_sharpest:
+        return service.sharpest_frame()
+    return service.latest_frame()
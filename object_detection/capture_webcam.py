@@ -1,34 +1,16 @@
-import argparse
 import cv2
 
 
-def parse_arguments() -> argparse.Namespace:
+def capture_webcam(output_file, frame_width=1920, frame_height=1080, camera_index=1):
     """
-    Parse arguments to set webcam resolution
-    :return: parsed arguments
-    """
-    from app import WEBCAM_RESOLUTION_WIDTH, WEBCAM_RESOLUTION_HEIGHT
-    parser = argparse.ArgumentParser(description='YOLOv8')
-    parser.add_argument(
-        '--webcam-resolution',
-        default=[WEBCAM_RESOLUTION_WIDTH, WEBCAM_RESOLUTION_HEIGHT],
-        nargs=2,
-        type=int,
-    )
-    args = parser.parse_args()
-    return args
-
-
-def capture_webcam(output_file):
-    """
-    Capture image from webcam
+    Capture a single image from webcam, use the capture service to capture frames repeatedly
     :param output_file: path to save image
+    :param frame_width: width of the captured image
+    :param frame_height: height of the captured image
+    :param camera_index: index of the camera to open
     """
 
-    args = parse_arguments()
-    frame_width, frame_height = args.webcam_resolution
-
-    cap = cv2.VideoCapture(1)
+    cap = cv2.VideoCapture(camera_index)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
 
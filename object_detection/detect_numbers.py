@@ -1,10 +1,14 @@
 import os
 import shutil
-import math
 import cv2
-from ultralytics import YOLO
-import supervision as sv
-import pytesseract
+import numpy as np
+from config import Config
+from object_detection.model_registry import get_model
+from object_detection.ocr_backends import create_ocr_backend
+from object_detection.tiled_inference import detect_tiled
+from utils.coordinate_transform import get_sheet_transform
+from utils.profiling import timed, timer, count
+from utils.review_server import show_image
 
 
 def delete_folder_contents(folder_path):
@@ -13,8 +17,6 @@ def delete_folder_contents(folder_path):
     :param folder_path: path to the folder to delete
     """
 
-    from app import SAVE_DIR
-
     try:
         if os.path.exists(folder_path) and os.path.isdir(folder_path):
             for filename in os.listdir(folder_path):
@@ -24,27 +26,12 @@ def delete_folder_contents(folder_path):
                 elif os.path.isdir(file_path):
                     shutil.rmtree(file_path)
         else:
-            save_dir = SAVE_DIR
-            os.makedirs(save_dir, exist_ok=True)
+            os.makedirs(folder_path, exist_ok=True)
             raise FileNotFoundError(f"Error: {folder_path} does not exist, creating it now")
     except Exception as e:
         print(f"Failed to delete contents of {folder_path}. Reason: {e}")
 
 
-def load_model(model_path):
-    """
-    Loads a YOLO model from a given path
-    :param model_path: path to the model to load
-    :return: yolo model
-    """
-
-    try:
-        return YOLO(model_path)
-    except Exception as e:
-        print(f"Failed to load model from {model_path}. Reason: {e}")
-        return None
-
-
 def sort_files_by_number(directory):
     """
     Sorts a list of files by their number in the filename
@@ -60,82 +47,220 @@ def sort_files_by_number(directory):
     return files
 
 
-def calculate_distance(coord1, coord2):
+def box_centers(coords):
+    """
+    Calculates the centers of the bounding boxes of detected numbers or dots
+    :param coords: list of numbers or dots created by process_image
+    :return: array of shape (n, 2) with the centers
+    """
+
+    if not coords:
+        return np.empty((0, 2))
+    boxes = np.array([coord[1] for coord in coords], dtype=np.float64)
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+
+def pair_numbers_dots(number_coords, dot_coords, max_distance):
+    """
+    Pairs every number with at most one dot and every dot with at most one number.
+    All center distances are calculated at once, then the closest pairs below max_distance are assigned first,
+    so a number that is close to several dots is only assigned to the nearest free one
+    :param number_coords: numbers created by process_image
+    :param dot_coords: dots created by process_image
+    :param max_distance: maximum distance in pixels between the centers of a number and its dot
+    :return: list of (number, dot) pairs, the unmatched numbers and the unmatched dots
+    """
+
+    distances = np.linalg.norm(box_centers(number_coords)[:, None, :] - box_centers(dot_coords)[None, :, :], axis=2)
+
+    candidates = np.argwhere(distances < max_distance)
+    candidates = candidates[np.argsort(distances[candidates[:, 0], candidates[:, 1]], kind="stable")]
+
+    number_matched = np.zeros(len(number_coords), dtype=bool)
+    dot_matched = np.zeros(len(dot_coords), dtype=bool)
+    pairs = []
+    for number_index, dot_index in candidates:
+        if number_matched[number_index] or dot_matched[dot_index]:
+            continue
+        number_matched[number_index] = True
+        dot_matched[dot_index] = True
+        pairs.append((number_index, dot_index))
+
+    pairs.sort()
+    grouped_coords = [(number_coords[n], dot_coords[d]) for n, d in pairs]
+    unmatched_numbers = [coord for coord, matched in zip(number_coords, number_matched) if not matched]
+    unmatched_dots = [coord for coord, matched in zip(dot_coords, dot_matched) if not matched]
+    return grouped_coords, unmatched_numbers, unmatched_dots
+
+
+def crop_detection(img, bbox, gain=1.02, pad=10):
+    """
+    Crops a detected object out of an already loaded image.
+    The box is enlarged the same way as the crops written by yolo with save_crop, so both paths feed the same
+    image region to the ocr
+    :param img: image the detection was made on
+    :param bbox: bounding box of the detection as (x_min, y_min, x_max, y_max)
+    :param gain: factor to enlarge the width and height of the box
+    :param pad: pixels to add to the width and height of the box
+    :return: the cropped image, copied so later annotations of the image do not end up in the crop
+    """
+
+    x_min, y_min, x_max, y_max = bbox
+    center_x = (x_min + x_max) / 2
+    center_y = (y_min + y_max) / 2
+    half_width = ((x_max - x_min) * gain + pad) / 2
+    half_height = ((y_max - y_min) * gain + pad) / 2
+
+    height, width = img.shape[:2]
+    x1 = min(max(int(center_x - half_width), 0), width)
+    y1 = min(max(int(center_y - half_height), 0), height)
+    x2 = min(max(int(center_x + half_width), 0), width)
+    y2 = min(max(int(center_y + half_height), 0), height)
+
+    return img[y1:y2, x1:x2].copy()
+
+
+def load_crop(number_info, config=None):
     """
-    Calculates the distance between two coordinates
-    :param coord1: coordinate 1
-    :param coord2: coordinate 2
-    :return: distance between the two coordinates
+    Returns the cropped image of a detected number
+    :param number_info: number entry created by process_image
+    :param config: settings to use, the defaults if None
+    :return: the cropped image
     """
 
-    x1, y1, _, _ = coord1[1]
-    x2, y2, _, _ = coord2[1]
-    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+    crop = number_info[2]
+    if isinstance(crop, str):
+        return cv2.imread(f"{(config or Config()).save_dir}/predict/crops/Number/{crop}")
+    return crop
 
 
-def process_image(model, img_path):
+@timed("detection")
+def process_image(model, img, config=None):
     """
-    Processes an image using a yolo model and returns the coordinates of the numbers and dots, as well as the image
+    Processes an image using a yolo model and returns the coordinates of the numbers and dots, as well as the image.
+    Each number and dot is returned as (class name, bounding box, crop, detection index). With in_memory_crops the
+    crop of a number is the image region itself, otherwise it is the filename of the crop saved by yolo. Only the
+    numbers are read by the ocr, so the crop of a dot is always None.
+    With tiled_inference the model runs on overlapping tiles of the sheet and the crops are always taken in memory
     :param model: yolo model to use
-    :param img_path: path to the image to process
+    :param img: the image to process or the path to it
+    :param config: settings to use, the defaults if None
     :return: coordinates of the numbers and dots, the detections object, and the image
     """
 
-    from app import SAVE_DIR, CONFIDENCE_THRESHOLD
+    config = config or Config()
 
-    img = cv2.imread(img_path)
+    if isinstance(img, str):
+        img = cv2.imread(img)
 
-    results = model(img, conf=CONFIDENCE_THRESHOLD, project=SAVE_DIR, save=True, save_crop=True)[0]
-    detections = sv.Detections.from_ultralytics(results)
+    if config.tiled_inference:
+        return extract_detections(detect_tiled(model, img, config), img) + (img,)
 
-    numbers = sort_files_by_number(f"{SAVE_DIR}/predict/crops/Number")
-    dots = sort_files_by_number(f"{SAVE_DIR}/predict/crops/Dot")
+    if config.in_memory_crops:
+        results = model(img, conf=config.confidence_threshold)[0]
+        return extract_detections(results, img) + (img,)
 
-    classes = []
-    for _, _, _, class_id, _ in detections:
-        classes.append(class_id)
+    save_dir = config.save_dir
+    results = model(img, conf=config.confidence_threshold, project=save_dir, save=True, save_crop=True)[0]
+    numbers = sort_files_by_number(f"{save_dir}/predict/crops/Number")
+    return extract_detections(results, img, numbers) + (img,)
 
-    coords = []
-    for bbox in detections.xyxy:
-        x_min, y_min, x_max, y_max = bbox
-        coords.append((x_min, y_min, x_max, y_max))
+
+@timed("detection_batch")
+def process_images(model, imgs, config=None):
+    """
+    Processes several images with one batched call of the yolo model, the crops are always taken in memory.
+    With tiled_inference the tiles of every image are batched instead
+    :param model: yolo model to use
+    :param imgs: list of images
+    :param config: settings to use, the defaults if None
+    :return: list with the coordinates of the numbers and dots, the detections object, and the image for every image
+    """
+
+    config = config or Config()
+
+    if not imgs:
+        return []
+
+    if config.tiled_inference:
+        return [extract_detections(detect_tiled(model, img, config), img) + (img,) for img in imgs]
+
+    results = model(list(imgs), conf=config.confidence_threshold)
+    return [extract_detections(result, img) + (img,) for result, img in zip(results, imgs)]
+
+
+def extract_detections(results, img, number_files=None):
+    """
+    Splits the yolo results of an image into numbers and dots, only the numbers are cropped
+    :param results: yolo results or detections of the image
+    :param img: the processed image
+    :param number_files: filenames of the number crops saved by yolo, the crops are taken from the image if None
+    :return: coordinates of the numbers and dots and the detections object
+    """
+
+    import supervision as sv
+
+    detections = results if isinstance(results, sv.Detections) else sv.Detections.from_ultralytics(results)
+    count("detections", len(detections))
 
     number_coords = []
     dot_coords = []
 
     number_index = 0
-    dot_index = 0
 
-    for i in range(len(classes)):
-        if classes[i] == 1:
-            number_coords.append(('number', coords[i], numbers[number_index]))
+    for i, (bbox, class_id) in enumerate(zip(detections.xyxy, detections.class_id)):
+        x_min, y_min, x_max, y_max = bbox
+        coords = (x_min, y_min, x_max, y_max)
+
+        if class_id == 1:
+            crop = crop_detection(img, coords) if number_files is None else number_files[number_index]
+            number_coords.append(('number', coords, crop, i))
             number_index += 1
-        elif classes[i] == 0:
-            dot_coords.append(('dot', coords[i], dots[dot_index]))
-            dot_index += 1
+        elif class_id == 0:
+            dot_coords.append(('dot', coords, None, i))
+
+    return number_coords, dot_coords, detections
+
+
+def group_numbers_dots(number_coords, dot_coords, img, config=None):
+    """
+    Pairs the numbers and dots of an image and reports the detections that could not be paired
+    :param number_coords: numbers created by process_image
+    :param dot_coords: dots created by process_image
+    :param img: the processed image, its height scales the pairing distance
+    :param config: settings to use, the defaults if None
+    :return: list of (number, dot) pairs, the unmatched numbers and the unmatched dots
+    """
 
-    return number_coords, dot_coords, detections, img
+    max_distance = (config or Config()).pairing_distance_ratio * img.shape[0]
+    grouped_coords, unmatched_numbers, unmatched_dots = pair_numbers_dots(number_coords, dot_coords, max_distance)
 
+    if unmatched_numbers or unmatched_dots:
+        print(f"Unmatched numbers: {len(unmatched_numbers)}, unmatched dots: {len(unmatched_dots)}")
 
-def detect_dots_numbers():
+    return grouped_coords, unmatched_numbers, unmatched_dots
+
+
+def detect_dots_numbers(img=None, config=None):
     """
     Detects numbers and dots in an image with a given model and groups them by their calculated distance
+    :param img: the image to process, the image at captured_img_path is used if None
+    :param config: settings to use, the defaults if None
     :return: a list of grouped coordinates of the numbers and dots
     """
-    from app import OBJECT_DETECTION_MODEL_PATH, CAPTURED_IMG_PATH, SAVE_DIR, SHOW_DETECTIONS, RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT
+    import supervision as sv
 
-    delete_folder_contents(SAVE_DIR)
+    config = config or Config()
 
-    model = load_model(OBJECT_DETECTION_MODEL_PATH)
+    if not config.in_memory_crops:
+        delete_folder_contents(config.save_dir)
 
-    number_coords, dot_coords, detections, img = process_image(model, CAPTURED_IMG_PATH)
+    model = get_model(config.object_detection_model_path, task="detect", config=config)
 
-    grouped_coords = []
+    img = config.captured_img_path if img is None else img
+    number_coords, dot_coords, detections, img = process_image(model, img, config)
 
-    for number_coord in number_coords:
-        for dot_coord in dot_coords:
-            if calculate_distance(number_coord, dot_coord) < 100:
-                grouped_coords.append((number_coord, dot_coord))
+    grouped_coords, _, _ = group_numbers_dots(number_coords, dot_coords, img, config)
 
     box_annotator = sv.BoxAnnotator(
         thickness=2,
@@ -151,85 +276,82 @@ def detect_dots_numbers():
     ]
 
     img = box_annotator.annotate(
-        scene=img,
+        scene=img.copy(),
         detections=detections,
         labels=labels,
     )
 
-    if SHOW_DETECTIONS:
-        cv2.namedWindow('Object Detection', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('Object Detection', RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT)
-        cv2.imshow('Object Detection', img)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+    if config.show_detections:
+        show_image('Object Detection', img, config)
 
     return grouped_coords
 
 
-def convert_coordinates(grouped_coords):
+def convert_coordinates(grouped_coords, image_shape=None, config=None):
     """
     Converts the coordinates of the coordinates to a percentage of the image size
     :param grouped_coords: grouped coordinates to convert
+    :param image_shape: shape of the image the coordinates belong to, the webcam resolution if None
+    :param config: settings to use, the defaults if None
     :return: converted coordinates
     """
-    from app import WEBCAM_RESOLUTION_WIDTH, WEBCAM_RESOLUTION_HEIGHT
-    converted_data = []
 
-    for number_coords, dot_coords, number in grouped_coords:
-        _, (dot_x_min, dot_y_min, dot_x_max, dot_y_max), _ = dot_coords
+    if not grouped_coords:
+        return []
 
-        center_x = (dot_x_min + dot_x_max) / 2
-        center_y = (dot_y_min + dot_y_max) / 2
+    centers = box_centers([dot_coords for _, dot_coords, _ in grouped_coords])
+    height, width = image_shape[:2] if image_shape is not None else (None, None)
+    converted = np.round(get_sheet_transform(width, height, config).apply(centers), 2)
 
-        resolution_difference = WEBCAM_RESOLUTION_WIDTH - WEBCAM_RESOLUTION_HEIGHT
+    return [(number, (x, y)) for (_, _, number), (x, y) in zip(grouped_coords, converted.tolist())]
 
-        if center_x > resolution_difference / 2:
-            center_x -= resolution_difference / 2
-        new_center_x = round((center_x / WEBCAM_RESOLUTION_HEIGHT) * 100, 2)
-        new_center_y = round((center_y / WEBCAM_RESOLUTION_HEIGHT) * 100, 2)
 
-        converted_data.append((number, (new_center_x, new_center_y)))
+def preprocess_number_crop(number_img, config=None):
+    """
+    Prepares the cropped image of a number for the ocr by resizing and thresholding it
+    :param number_img: cropped image of the number
+    :param config: settings to use, the defaults if None
+    :return: binary image of the number
+    """
 
-    return converted_data
+    config = config or Config()
+    number_img = cv2.resize(number_img, (0, 0), fx=config.resize_factor, fy=config.resize_factor)
+    number_img = cv2.cvtColor(number_img, cv2.COLOR_BGR2GRAY)
+    return cv2.threshold(number_img, config.threshold_value, config.threshold_max_value, cv2.THRESH_BINARY)[1]
 
 
-def recognize_numbers(img_coordinates):
+def recognize_numbers(img_coordinates, show=None, config=None, image_shape=None):
     """
-    Recognizes the numbers in the cropped images from the yolo detections using pytesseract
-    and returns the sorted coordinates with their recognized number
+    Recognizes the numbers in the cropped images from the yolo detections using the ocr backend selected in the
+    config and returns the sorted coordinates with their recognized number
     :param img_coordinates: coordinates of the cropped images of the numbers to recognize
+    :param show: if True, every cropped number is shown, show_cropped_number is used if None
+    :param config: settings to use, the defaults if None
+    :param image_shape: shape of the image the numbers were detected in, the webcam resolution if None
     :return: sorted coordinates with their recognized number
     """
-    from app import PYTESSERACT_PATH, SAVE_DIR, SHOW_CROPPED_NUMBER, RESIZE_FACTOR, THRESHOLD_VALUE, THRESHOLD_MAX_VALUE
+    config = config or Config()
 
-    pytesseract.pytesseract.tesseract_cmd = PYTESSERACT_PATH
-    detection_info = []
-    converted_coordinates = []
-
-    for number_info, dot_info in img_coordinates:
-        number_img = cv2.imread(f"{SAVE_DIR}/predict/crops/Number/{number_info[2]}")
-        number_img = cv2.resize(number_img, (0, 0), fx=RESIZE_FACTOR, fy=RESIZE_FACTOR)
-        number_img = cv2.cvtColor(number_img, cv2.COLOR_BGR2GRAY)
-        number_img = cv2.threshold(number_img, THRESHOLD_VALUE, THRESHOLD_MAX_VALUE, cv2.THRESH_BINARY)[1]
-        config_number = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
-        detected_number = pytesseract.image_to_string(number_img, config=config_number)
-        cleaned_number = ''.join(filter(str.isdigit, detected_number))
+    if show is None:
+        show = config.show_cropped_number
 
-        try:
-            number = int(cleaned_number)
-        except ValueError:
-            number = None
+    with timer("ocr_preprocessing"):
+        number_imgs = [preprocess_number_crop(load_crop(number_info, config), config)
+                       for number_info, _ in img_coordinates]
 
-        detection_info.append((number_info, dot_info, number))
+    with timer("ocr"):
+        results = create_ocr_backend(config).recognize(number_imgs)
+    count("ocr_crops", len(number_imgs))
 
-        converted_coordinates = convert_coordinates(detection_info)
+    detection_info = []
+    for (number_info, dot_info), number_img, result in zip(img_coordinates, number_imgs, results):
+        detection_info.append((number_info, dot_info, result.number))
 
-        if SHOW_CROPPED_NUMBER:
-            print(number)
-            cv2.imshow("Cropped Number", number_img)
-            cv2.waitKey(0)
-            cv2.destroyAllWindows()
+        if show:
+            print(f"{result.number} (confidence: {result.confidence:.2f}, latency: {result.latency * 1000:.1f}ms)")
+            show_image(f"Cropped Number {result.number}", number_img, config)
 
+    converted_coordinates = convert_coordinates(detection_info, image_shape, config)
     filtered_data = [coord for coord in converted_coordinates if coord[0] is not None]
 
     if not filtered_data:
@@ -0,0 +1,367 @@
+import glob
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+import cv2
+import numpy as np
+from config import Config
+
+# Backends the yolo models can be run with
+BACKENDS = ("pytorch", "onnx", "openvino")
+# File extensions of the calibration images
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# Min intersection over union of a box of the exported model and the box of the pytorch model to be the same object
+MATCH_IOU = 0.5
+
+
+def exported_path(model_path, backend, int8=False):
+    """
+    Returns the path the model is exported to, next to the pytorch weights
+    :param model_path: path of the pytorch weights
+    :param backend: "onnx" or "openvino"
+    :param int8: if True, the path of the quantized model
+    :return: path of the .onnx file or of the openvino model directory
+    """
+
+    stem = os.path.splitext(model_path)[0] + ("_int8" if int8 else "")
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    return model_path
+
+
+def check_path(path):
+    return f"{path}.check.json"
+
+
+def is_current(path, model_path):
+    """
+    Checks if an exported model exists and is newer than the pytorch weights it was exported from
+    """
+
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path)
+
+
+def load_images(source):
+    """
+    Loads the images used to calibrate the quantization and to check the exported models
+    :param source: folder with images or a glob pattern
+    :return: list of images
+    """
+
+    pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+    paths = sorted(path for path in glob.glob(pattern) if path.lower().endswith(IMAGE_EXTENSIONS))
+    return [img for img in (cv2.imread(path) for path in paths) if img is not None]
+
+
+def letterbox(img, imgsz):
+    """
+    Prepares an image as input of an exported model like yolo does: scaled to fit, padded with gray, RGB, CHW
+    :param img: BGR image
+    :param imgsz: size of the square input
+    :return: float32 array of shape (1, 3, imgsz, imgsz)
+    """
+
+    height, width = img.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = round(width * scale), round(height * scale)
+    resized = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_height) // 2, (imgsz - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = resized
+    return np.ascontiguousarray(canvas[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255
+
+
+def export_model(model_path, task, backend, imgsz=640):
+    """
+    Exports the pytorch weights with ultralytics, the exported model gets dynamic shapes so it can run batches
+    and tiles of any size
+    :param model_path: path of the pytorch weights
+    :param task: task of the model ("detect" or "segment")
+    :param backend: "onnx" or "openvino"
+    :param imgsz: image size the model is exported with
+    :return: path of the exported model
+    """
+
+    from ultralytics import YOLO
+
+    exported = YOLO(model_path, task=task).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+    path = exported_path(model_path, backend)
+    if os.path.normpath(str(exported)) != os.path.normpath(path):
+        shutil.move(str(exported), path)
+    return path
+
+
+def quantize_onnx(fp32_path, int8_path, images, imgsz=640):
+    """
+    Quantizes an onnx model to int8 with static quantization, the activations are calibrated on the images
+    :param fp32_path: path of the exported onnx model
+    :param int8_path: path to save the quantized model to
+    :param images: calibration images
+    :param imgsz: image size the model was exported with
+    """
+
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter([{input_name: letterbox(img, imgsz)} for img in images])
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    quantize_static(fp32_path, int8_path, ImageReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # ultralytics reads the class names, stride and task from the metadata of the onnx model
+    metadata = onnx.load(fp32_path, load_external_data=False).metadata_props
+    quantized = onnx.load(int8_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(metadata)
+    onnx.save(quantized, int8_path)
+
+
+def quantize_openvino(fp32_dir, int8_dir, images, imgsz=640):
+    """
+    Quantizes an openvino model to int8 with nncf, the activations are calibrated on the images
+    :param fp32_dir: directory of the exported openvino model
+    :param int8_dir: directory to save the quantized model to
+    :param images: calibration images
+    :param imgsz: image size the model was exported with
+    """
+
+    import nncf
+    import openvino as ov
+
+    xml_path = glob.glob(os.path.join(fp32_dir, "*.xml"))[0]
+    model = ov.Core().read_model(xml_path)
+    dataset = nncf.Dataset(images, lambda img: letterbox(img, imgsz))
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED, subset_size=len(images))
+
+    os.makedirs(int8_dir, exist_ok=True)
+    ov.save_model(quantized, os.path.join(int8_dir, os.path.basename(xml_path)))
+    # ultralytics reads the class names, stride and task from the metadata file of the model directory
+    shutil.copy(os.path.join(fp32_dir, "metadata.yaml"), int8_dir)
+
+
+def box_ious(boxes, other):
+    """
+    Calculates the intersection over union of every pair of boxes
+    :param boxes: array of shape (n, 4)
+    :param other: array of shape (m, 4)
+    :return: array of shape (n, m)
+    """
+
+    top_left = np.maximum(boxes[:, None, :2], other[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], other[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    other_areas = np.prod(other[:, 2:] - other[:, :2], axis=1)
+    return intersection / np.maximum(areas[:, None] + other_areas[None] - intersection, 1e-9)
+
+
+def match_results(reference, candidate, iou_threshold=MATCH_IOU):
+    """
+    Matches the objects found by two models in the same image, every object of the reference is matched with the
+    overlapping object of the same class found by the candidate
+    :param reference: yolo results of the pytorch model
+    :param candidate: yolo results of the exported model
+    :param iou_threshold: min intersection over union of matched boxes
+    :return: number of objects of both models and list of (reference index, candidate index, box iou) matches
+    """
+
+    boxes = reference.boxes.xyxy.cpu().numpy()
+    other_boxes = candidate.boxes.xyxy.cpu().numpy()
+    classes = reference.boxes.cls.cpu().numpy()
+    other_classes = candidate.boxes.cls.cpu().numpy()
+    if len(boxes) == 0 or len(other_boxes) == 0:
+        return len(boxes), len(other_boxes), []
+
+    ious = box_ious(boxes, other_boxes)
+    ious[classes[:, None] != other_classes[None]] = 0
+
+    matches = []
+    used = np.zeros(len(other_boxes), dtype=bool)
+    for i in np.argsort(-reference.boxes.conf.cpu().numpy()):
+        candidates = np.where(~used & (ious[i] >= iou_threshold))[0]
+        if len(candidates) == 0:
+            continue
+        j = candidates[ious[i, candidates].argmax()]
+        used[j] = True
+        matches.append((int(i), int(j), float(ious[i, j])))
+    return len(boxes), len(other_boxes), matches
+
+
+def mask_iou(reference, candidate, i, j):
+    mask = reference.masks.data[i].cpu().numpy() > 0.5
+    other = candidate.masks.data[j].cpu().numpy() > 0.5
+    if mask.shape != other.shape:
+        other = cv2.resize(other.astype(np.uint8), mask.shape[::-1], interpolation=cv2.INTER_NEAREST) > 0
+    union = np.logical_or(mask, other).sum()
+    return float(np.logical_and(mask, other).sum() / union) if union else 1.0
+
+
+def measure_latency(model, images, conf, repeat=3):
+    """
+    Measures the median latency of a model on single images after one warm-up run
+    :return: latency in seconds and the results of the last run
+    """
+
+    model(images[0], conf=conf, verbose=False)
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for img in images:
+            start = time.perf_counter()
+            results.append(model(img, conf=conf, verbose=False)[0])
+            latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies)), results
+
+
+def compare_models(model_path, exported, task, images, conf, repeat=3):
+    """
+    Compares an exported model with the pytorch model on the images
+    :param model_path: path of the pytorch weights
+    :param exported: path of the exported model
+    :param task: task of the model ("detect" or "segment")
+    :param images: images to compare the models on
+    :param conf: confidence threshold of both models
+    :param repeat: number of runs per image to measure the latency
+    :return: dictionary with the precision and recall of the exported model against the pytorch model, the mean
+             iou of the matched boxes and masks and the latency of both models
+    """
+
+    from ultralytics import YOLO
+
+    reference_latency, reference_results = measure_latency(YOLO(model_path, task=task), images, conf, repeat)
+    latency, results = measure_latency(YOLO(exported, task=task), images, conf, repeat)
+
+    reference_count, count, box_iou_values, mask_iou_values = 0, 0, [], []
+    for reference, candidate in zip(reference_results, results):
+        found, other_found, matches = match_results(reference, candidate)
+        reference_count += found
+        count += other_found
+        box_iou_values += [iou for _, _, iou in matches]
+        if task == "segment" and reference.masks is not None and candidate.masks is not None:
+            mask_iou_values += [mask_iou(reference, candidate, i, j) for i, j, _ in matches]
+
+    matched = len(box_iou_values)
+    return {
+        "images": len(images),
+        "precision": matched / count if count else float(reference_count == 0),
+        "recall": matched / reference_count if reference_count else float(count == 0),
+        "box_iou": float(np.mean(box_iou_values)) if box_iou_values else None,
+        "mask_iou": float(np.mean(mask_iou_values)) if mask_iou_values else None,
+        "latency": latency,
+        "pytorch_latency": reference_latency,
+    }
+
+
+def print_check(path, report):
+    mask_iou_text = f", mask iou {report['mask_iou']:.3f}" if report["mask_iou"] is not None else ""
+    box_iou_text = f"{report['box_iou']:.3f}" if report["box_iou"] is not None else "-"
+    print(f"{path} against pytorch on {report['images']} images: precision {report['precision']:.3f}, "
+          f"recall {report['recall']:.3f}, box iou {box_iou_text}{mask_iou_text}, latency "
+          f"{report['latency'] * 1000:.1f}ms vs {report['pytorch_latency'] * 1000:.1f}ms")
+
+
+def export_and_check(model_path, task, backend, int8, imgsz, calibration_images, conf):
+    """
+    Exports the model if the exported model is missing or older than the weights, and checks it against the
+    pytorch model. The result of the check is saved next to the exported model
+    :param model_path: path of the pytorch weights
+    :param task: task of the model ("detect" or "segment")
+    :param backend: "onnx" or "openvino"
+    :param int8: if True, the exported model is quantized to int8
+    :param imgsz: image size the model is exported with
+    :param calibration_images: folder with the images to calibrate the quantization and to check the model on
+    :param conf: confidence threshold of the models in the check
+    :return: path of the exported model and the report of the check
+    """
+
+    path = exported_path(model_path, backend, int8)
+    if is_current(path, model_path) and os.path.exists(check_path(path)):
+        with open(check_path(path)) as f:
+            return path, json.load(f)
+
+    images = load_images(calibration_images)
+    if not images:
+        raise ValueError(f"No calibration images found in {calibration_images}")
+
+    start = time.perf_counter()
+    fp32_path = exported_path(model_path, backend)
+    if not is_current(fp32_path, model_path):
+        export_model(model_path, task, backend, imgsz)
+    if int8:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        quantize = quantize_onnx if backend == "onnx" else quantize_openvino
+        quantize(fp32_path, path, images, imgsz)
+    print(f"Exported {model_path} to {path} in {time.perf_counter() - start:.1f}s")
+
+    report = compare_models(model_path, path, task, images, conf)
+    with open(check_path(path), "w") as f:
+        json.dump(report, f, indent=1)
+    print_check(path, report)
+    return path, report
+
+
+@lru_cache(maxsize=None)
+def resolve_model_path(model_path, task, backend, int8, imgsz, calibration_images, conf, min_agreement):
+    """
+    Returns the path of the model to run with the selected backend, the model is exported on first use.
+    The pytorch weights are used if the export fails or the exported model does not find the same objects
+    :param model_path: path of the pytorch weights
+    :param task: task of the model ("detect" or "segment")
+    :param backend: "pytorch", "onnx" or "openvino"
+    :param int8: if True, the exported model is quantized to int8
+    :param imgsz: image size the model is exported with
+    :param calibration_images: folder with the images to calibrate the quantization and to check the model on
+    :param conf: confidence threshold of the models in the check
+    :param min_agreement: min precision and recall of the exported model against the pytorch model
+    :return: path of the model to load
+    """
+
+    if backend == "pytorch":
+        return model_path
+    if backend not in BACKENDS:
+        print(f"Unknown inference backend: {backend}, using {model_path}")
+        return model_path
+    if not os.path.exists(model_path):
+        return model_path
+
+    try:
+        path, report = export_and_check(model_path, task, backend, int8, imgsz, calibration_images, conf)
+    except Exception as e:
+        print(f"Failed to export {model_path} to {backend}. Reason: {e}")
+        return model_path
+
+    if min(report["precision"], report["recall"]) < min_agreement:
+        print(f"{path} does not find the same objects as {model_path} (precision {report['precision']:.2f}, "
+              f"recall {report['recall']:.2f}), using {model_path}")
+        return model_path
+    return path
+
+
+def get_model_path(model_path, task=None, config=None):
+    """
+    Returns the path of the model to run with the inference backend of the config
+    :param model_path: path of the pytorch weights
+    :param task: task of the model ("detect" or "segment")
+    :param config: settings to use, the defaults if None
+    :return: path of the model to load
+    """
+
+    config = config or Config()
+    conf = config.segmentation_confidence_threshold if task == "segment" else config.confidence_threshold
+    return resolve_model_path(model_path, task, config.inference_backend, config.inference_int8,
+                              config.inference_imgsz, config.inference_calibration_images, conf,
+                              config.inference_min_agreement)
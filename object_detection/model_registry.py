@@ -0,0 +1,175 @@
+import threading
+import time
+import numpy as np
+from config import Config
+from object_detection.inference_backends import get_model_path
+from utils.profiling import timed
+
+
+def load_model(model_path, task=None):
+    """
+    Loads a YOLO model from a given path
+    :param model_path: path to the model to load
+    :param task: task of the model ("detect" or "segment"), guessed by yolo if None
+    :return: yolo model
+    """
+
+    # ultralytics imports torch, so it is only imported once a model is needed
+    from ultralytics import YOLO
+
+    try:
+        return YOLO(model_path, task=task)
+    except Exception as e:
+        print(f"Failed to load model from {model_path}. Reason: {e}")
+        return None
+
+
+def run_warmup(model, frame_size):
+    """
+    Runs one inference of a model on a blank frame
+    :param model: yolo model
+    :param frame_size: (width, height) of the blank frame
+    :return: time of the inference in seconds
+    """
+
+    width, height = frame_size
+    dummy_frame = np.zeros((height, width, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    model(dummy_frame, verbose=False)
+    return time.perf_counter() - start
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of YOLO models, so the weights are loaded and warmed up once instead of once per sheet.
+    A model is only added to the cache after its warm-up, other threads asking for it wait until then
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        self.timings = {}
+
+    def _loading_lock(self, key):
+        """
+        Returns the lock that is held while the model of a key is loaded and warmed up
+        :param key: (model path, task) of the model
+        :return: lock of the key
+        """
+
+        with self._lock:
+            return self._loading_locks.setdefault(key, threading.Lock())
+
+    def get(self, model_path, task=None, warmup=None):
+        """
+        Returns the cached model for a path and task and loads it on first use
+        :param model_path: path to the model
+        :param task: task of the model ("detect" or "segment")
+        :param warmup: (width, height) of a dummy frame a newly loaded model runs one inference on, None to skip it
+        :return: yolo model or None if it could not be loaded
+        """
+
+        key = (model_path, task)
+        with self._loading_lock(key):
+            with self._lock:
+                model = self._models.get(key)
+            if model is not None:
+                return model
+
+            start = time.perf_counter()
+            model = load_model(model_path, task)
+            if model is None:
+                return None
+            timing = {"load": time.perf_counter() - start, "warmup": None}
+            if warmup is not None:
+                timing["warmup"] = run_warmup(model, warmup)
+
+            with self._lock:
+                self._models[key] = model
+                self.timings[key] = timing
+        return model
+
+    def warmup(self, model_path, task=None, frame_size=(1920, 1080)):
+        """
+        Runs one inference on a blank frame, so the first real sheet does not pay for the lazy initialisation
+        :param model_path: path to the model
+        :param task: task of the model
+        :param frame_size: (width, height) of the blank frame
+        """
+
+        key = (model_path, task)
+        with self._lock:
+            model = self._models.get(key)
+        if model is None:
+            return
+
+        warmup_time = run_warmup(model, frame_size)
+        with self._lock:
+            self.timings[key]["warmup"] = warmup_time
+
+    def preload(self, models, warmup=None):
+        """
+        Loads several models at once
+        :param models: list of (model path, task) tuples
+        :param warmup: (width, height) of a dummy frame every model runs one inference on, None to skip it
+        """
+
+        for model_path, task in models:
+            self.get(model_path, task, warmup=warmup)
+
+    def clear(self):
+        """
+        Removes all cached models
+        """
+
+        with self._lock:
+            self._models.clear()
+            self.timings.clear()
+
+
+registry = ModelRegistry()
+
+
+def warmup_size(config):
+    """
+    Returns the size of the frame the models are warmed up with
+    :param config: settings to use
+    :return: (width, height) of the webcam, or None if warming up is switched off
+    """
+
+    if not config.warmup_models:
+        return None
+    return config.webcam_resolution_width, config.webcam_resolution_height
+
+
+def get_model(model_path, task=None, config=None):
+    """
+    Returns a model from the process-wide registry
+    :param model_path: path to the pytorch weights, the model exported for the inference backend of the config is
+                       loaded instead if there is one
+    :param task: task of the model ("detect" or "segment")
+    :param config: settings to use, the defaults if None
+    :return: yolo model
+    """
+
+    config = config or Config()
+    return registry.get(get_model_path(model_path, task, config), task, warmup=warmup_size(config))
+
+
+@timed("model_loading")
+def preload_models(config=None):
+    """
+    Loads and warms up the object detection and the object segmentation model
+    :param config: settings to use, the defaults if None
+    """
+
+    config = config or Config()
+    registry.preload([
+        (get_model_path(config.object_detection_model_path, "detect", config), "detect"),
+        (get_model_path(config.object_segmentation_model_path, "segment", config), "segment"),
+    ], warmup=warmup_size(config))
+
+    for (model_path, task), timing in registry.timings.items():
+        warmup_time = f"{timing['warmup']:.2f}s" if timing["warmup"] is not None else "skipped"
+        print(f"Loaded {model_path} ({task}) in {timing['load']:.2f}s, warm-up: {warmup_time}")
@@ -0,0 +1,344 @@
+import math
+import os
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+from config import Config
+from utils.profiling import count
+
+# Tesseract configuration to read a single block of digits
+OCR_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789'
+# Size every digit is scaled to before it is compared with the templates
+TEMPLATE_WIDTH = 16
+TEMPLATE_HEIGHT = 24
+# Components smaller than this fraction of the tallest component are treated as noise
+MIN_DIGIT_HEIGHT_RATIO = 0.5
+
+# Result of the ocr for one cropped number
+OcrResult = namedtuple("OcrResult", ["number", "confidence", "latency"])
+
+
+def parse_number(text):
+    """
+    Converts the text returned by the ocr to a number
+    :param text: recognized text
+    :return: the number or None if the text contains no digits
+    """
+
+    cleaned_number = ''.join(filter(str.isdigit, text))
+
+    try:
+        return int(cleaned_number)
+    except ValueError:
+        return None
+
+
+def words_to_result(words, latency):
+    """
+    Combines the words tesseract found for one number into an ocr result
+    :param words: list of (left, text, confidence) tuples
+    :param latency: time spent on the number in seconds
+    :return: ocr result
+    """
+
+    words = sorted(word for word in words if word[1].strip())
+    number = parse_number(''.join(text for _, text, _ in words))
+    if number is None:
+        return OcrResult(None, 0.0, latency)
+    confidence = min(float(conf) for _, _, conf in words) / 100
+    return OcrResult(number, max(confidence, 0.0), latency)
+
+
+def tile_number_crops(number_imgs):
+    """
+    Places all number crops on one white canvas in a grid of equally sized cells.
+    Every crop is centered in its cell with a margin of half a cell on each side, so tesseract does not merge
+    neighbouring numbers into one word
+    :param number_imgs: preprocessed images of the numbers
+    :return: the tiled image, the cell width and the cell height
+    """
+
+    max_height = max(img.shape[0] for img in number_imgs)
+    max_width = max(img.shape[1] for img in number_imgs)
+    cell_height = max_height * 2
+    cell_width = max_width * 2
+    columns = math.ceil(math.sqrt(len(number_imgs)))
+    rows = math.ceil(len(number_imgs) / columns)
+
+    canvas = np.full((rows * cell_height, columns * cell_width), 255, dtype=np.uint8)
+    for i, img in enumerate(number_imgs):
+        row, column = divmod(i, columns)
+        y = row * cell_height + (cell_height - img.shape[0]) // 2
+        x = column * cell_width + (cell_width - img.shape[1]) // 2
+        canvas[y:y + img.shape[0], x:x + img.shape[1]] = img
+
+    return canvas, cell_width, cell_height
+
+
+def extract_digits(number_img):
+    """
+    Splits a binary image of a number into its digits using connected components
+    :param number_img: preprocessed image of the number, dark digits on a white background
+    :return: array of shape (digits, TEMPLATE_HEIGHT * TEMPLATE_WIDTH) with the normalized digits from left to right
+    """
+
+    inverted = cv2.bitwise_not(number_img)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(inverted, connectivity=8)
+    if count <= 1:
+        return np.empty((0, TEMPLATE_HEIGHT * TEMPLATE_WIDTH), dtype=np.float32)
+
+    # Label 0 is the background
+    stats = stats[1:]
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    stats = stats[heights >= heights.max() * MIN_DIGIT_HEIGHT_RATIO]
+    stats = stats[np.argsort(stats[:, cv2.CC_STAT_LEFT])]
+
+    digits = []
+    for x, y, width, height, _ in stats:
+        digit = inverted[y:y + height, x:x + width]
+        digit = cv2.resize(digit, (TEMPLATE_WIDTH, TEMPLATE_HEIGHT), interpolation=cv2.INTER_AREA)
+        digits.append(digit.astype(np.float32).ravel())
+
+    digits = np.array(digits)
+    digits -= digits.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(digits, axis=1, keepdims=True)
+    return digits / np.where(norms > 0, norms, 1)
+
+
+def render_templates():
+    """
+    Renders the digits 0-9 with an OpenCV font, used when no templates were trained from real crops
+    :return: array of shape (10, TEMPLATE_HEIGHT * TEMPLATE_WIDTH) with the normalized templates
+    """
+
+    templates = []
+    for digit in range(10):
+        img = np.full((60, 40), 255, dtype=np.uint8)
+        cv2.putText(img, str(digit), (5, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 3)
+        templates.append(extract_digits(img)[0])
+    return np.array(templates)
+
+
+def build_templates(number_imgs, numbers):
+    """
+    Builds digit templates by averaging the digits of labelled number crops
+    :param number_imgs: preprocessed images of the numbers
+    :param numbers: known number of every image, entries with None are skipped
+    :return: array of shape (10, TEMPLATE_HEIGHT * TEMPLATE_WIDTH) with the normalized templates
+    """
+
+    templates = render_templates()
+    sums = np.zeros_like(templates)
+    counts = np.zeros(10, dtype=np.int32)
+
+    for number_img, number in zip(number_imgs, numbers):
+        if number is None:
+            continue
+        digits = extract_digits(number_img)
+        label = [int(char) for char in str(number)]
+        if len(digits) != len(label):
+            continue
+        for digit, value in zip(digits, label):
+            sums[value] += digit
+            counts[value] += 1
+
+    trained = counts > 0
+    templates[trained] = sums[trained] / counts[trained, None]
+    norms = np.linalg.norm(templates, axis=1, keepdims=True)
+    return templates / np.where(norms > 0, norms, 1)
+
+
+class OcrBackend:
+    """
+    Interface of the ocr backends that read the cropped numbers
+    """
+
+    name = "base"
+
+    def recognize(self, number_imgs):
+        """
+        Reads the numbers in the preprocessed crops
+        :param number_imgs: preprocessed images of the numbers
+        :return: list with an ocr result for every image
+        """
+
+        raise NotImplementedError
+
+
+class TesseractBackend(OcrBackend):
+    """
+    Reads the numbers with tesseract, either with one call per crop or with one call for all crops
+    """
+
+    name = "tesseract"
+
+    def __init__(self, tesseract_cmd=None, batched=True):
+        import pytesseract
+
+        if tesseract_cmd is not None:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        self.batched = batched
+
+    def recognize(self, number_imgs):
+        if not number_imgs:
+            return []
+        if self.batched:
+            return self.recognize_batched(number_imgs)
+        return [self.recognize_single(number_img) for number_img in number_imgs]
+
+    def recognize_single(self, number_img):
+        """
+        Reads a single number with one tesseract call
+        :param number_img: preprocessed image of the number
+        :return: ocr result
+        """
+
+        import pytesseract
+
+        start = time.perf_counter()
+        count("ocr_calls")
+        data = pytesseract.image_to_data(number_img, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+        words = list(zip(data["left"], data["text"], data["conf"]))
+        return words_to_result(words, time.perf_counter() - start)
+
+    def recognize_batched(self, number_imgs):
+        """
+        Reads all numbers with a single tesseract call by tiling the crops into one image and mapping every
+        recognized word back to the cell it was found in
+        :param number_imgs: preprocessed images of the numbers
+        :return: list of ocr results, the latency is the total time divided by the number of crops
+        """
+
+        import pytesseract
+
+        start = time.perf_counter()
+        canvas, cell_width, cell_height = tile_number_crops(number_imgs)
+        columns = canvas.shape[1] // cell_width
+
+        count("ocr_calls")
+        data = pytesseract.image_to_data(canvas, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+
+        words = [[] for _ in number_imgs]
+        for text, conf, left, top, width, height in zip(data["text"], data["conf"], data["left"], data["top"],
+                                                        data["width"], data["height"]):
+            if not text.strip():
+                continue
+            column = (left + width // 2) // cell_width
+            row = (top + height // 2) // cell_height
+            index = row * columns + column
+            if index < len(words):
+                words[index].append((left, text, conf))
+
+        latency = (time.perf_counter() - start) / len(number_imgs)
+        return [words_to_result(cell, latency) for cell in words]
+
+
+class TemplateBackend(OcrBackend):
+    """
+    Reads the numbers by matching every connected component against digit templates with normalized correlation.
+    The confidence of a number is the correlation of its worst matching digit
+    """
+
+    name = "template"
+
+    def __init__(self, templates_path=None):
+        if templates_path is not None and os.path.exists(templates_path):
+            self.templates = np.load(templates_path)["templates"]
+        else:
+            self.templates = render_templates()
+
+    def recognize(self, number_imgs):
+        return [self.recognize_single(number_img) for number_img in number_imgs]
+
+    def recognize_single(self, number_img):
+        """
+        Reads a single number by matching its digits against the templates
+        :param number_img: preprocessed image of the number
+        :return: ocr result
+        """
+
+        start = time.perf_counter()
+        digits = extract_digits(number_img)
+        if len(digits) == 0:
+            return OcrResult(None, 0.0, time.perf_counter() - start)
+
+        scores = digits @ self.templates.T
+        values = scores.argmax(axis=1)
+        confidence = float(scores[np.arange(len(values)), values].min())
+        number = int(''.join(str(value) for value in values))
+        return OcrResult(number, max(confidence, 0.0), time.perf_counter() - start)
+
+
+class FallbackBackend(OcrBackend):
+    """
+    Uses a fast backend and reads every number with a confidence below the threshold again with a fallback backend
+    """
+
+    def __init__(self, primary, fallback, min_confidence):
+        self.primary = primary
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def recognize(self, number_imgs):
+        results = self.primary.recognize(number_imgs)
+        retry = [i for i, result in enumerate(results) if result.confidence < self.min_confidence]
+        if retry:
+            fallback_results = self.fallback.recognize([number_imgs[i] for i in retry])
+            for i, fallback_result in zip(retry, fallback_results):
+                latency = results[i].latency + fallback_result.latency
+                results[i] = fallback_result._replace(latency=latency)
+        return results
+
+
+def create_ocr_backend(config=None):
+    """
+    Creates the ocr backend selected in the config
+    :param config: settings to use, the defaults if None
+    :return: ocr backend
+    """
+
+    config = config or Config()
+    tesseract = TesseractBackend(config.pytesseract_path, batched=config.ocr_batched)
+    if config.ocr_backend == "tesseract":
+        return tesseract
+    if config.ocr_backend == "template":
+        return FallbackBackend(TemplateBackend(config.ocr_templates_path), tesseract, config.ocr_min_confidence)
+    raise ValueError(f"Unknown ocr backend: {config.ocr_backend}")
+
+
+def train_templates(img_paths, output_path, min_confidence=0.9, config=None):
+    """
+    Trains digit templates from the crops yolo detects in the given images, labelled by tesseract
+    :param img_paths: paths of the images to train on
+    :param output_path: path of the .npz file to save the templates to
+    :param min_confidence: minimum tesseract confidence of a crop to be used for training
+    :param config: settings to use, the defaults if None
+    """
+
+    from object_detection.detect_numbers import process_image, preprocess_number_crop, load_crop
+    from object_detection.model_registry import get_model
+
+    config = config or Config()
+    model = get_model(config.object_detection_model_path, task="detect", config=config)
+    tesseract = TesseractBackend(config.pytesseract_path, batched=False)
+
+    number_imgs = []
+    numbers = []
+    for img_path in img_paths:
+        number_coords, _, _, _ = process_image(model, img_path, config)
+        imgs = [preprocess_number_crop(load_crop(number_info, config), config) for number_info in number_coords]
+        for number_img, result in zip(imgs, tesseract.recognize(imgs)):
+            if result.confidence >= min_confidence:
+                number_imgs.append(number_img)
+                numbers.append(result.number)
+
+    np.savez(output_path, templates=build_templates(number_imgs, numbers))
+    print(f"Trained templates from {len(number_imgs)} crops and saved them to {output_path}")
+
+
+if __name__ == '__main__':
+    import glob
+
+    train_templates(sorted(glob.glob("resources/captured_img/*.jpg")), Config().ocr_templates_path)
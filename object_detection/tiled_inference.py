@@ -0,0 +1,183 @@
+import numpy as np
+from config import Config
+from utils.calibration import detect_sheet
+
+
+def sheet_roi(img, margin=0.02):
+    """
+    Finds the region of the image that contains the sheet
+    :param img: image of the sheet
+    :param margin: margin added around the sheet as a fraction of its size
+    :return: (x_min, y_min, x_max, y_max) of the region, the whole image if no sheet is found
+    """
+
+    height, width = img.shape[:2]
+    corners, _ = detect_sheet(img)
+    if corners is None:
+        return 0, 0, width, height
+
+    x_min, y_min = corners.min(axis=0)
+    x_max, y_max = corners.max(axis=0)
+    pad_x = margin * (x_max - x_min)
+    pad_y = margin * (y_max - y_min)
+    return (
+        max(int(x_min - pad_x), 0),
+        max(int(y_min - pad_y), 0),
+        min(int(np.ceil(x_max + pad_x)), width),
+        min(int(np.ceil(y_max + pad_y)), height),
+    )
+
+
+def tile_starts(start, end, tile_size, stride):
+    """
+    Calculates the start positions of the tiles along one axis, the last tile ends at the end of the region
+    :param start: start of the region
+    :param end: end of the region
+    :param tile_size: size of a tile
+    :param stride: distance between the starts of two tiles
+    :return: list of start positions
+    """
+
+    if end - start <= tile_size:
+        return [start]
+    starts = list(range(start, end - tile_size, stride))
+    starts.append(end - tile_size)
+    return starts
+
+
+def tile_windows(roi, tile_size=640, overlap=0.2):
+    """
+    Splits a region into overlapping tiles
+    :param roi: (x_min, y_min, x_max, y_max) of the region
+    :param tile_size: size of the square tiles in pixels
+    :param overlap: overlap of neighbouring tiles as a fraction of the tile size
+    :return: list of (x_min, y_min, x_max, y_max) tiles
+    """
+
+    x_min, y_min, x_max, y_max = roi
+    stride = max(int(tile_size * (1 - overlap)), 1)
+    return [
+        (x, y, min(x + tile_size, x_max), min(y + tile_size, y_max))
+        for y in tile_starts(y_min, y_max, tile_size, stride)
+        for x in tile_starts(x_min, x_max, tile_size, stride)
+    ]
+
+
+def box_overlaps(box, boxes):
+    """
+    Calculates the intersection of a box with other boxes over the area of the smaller box.
+    A box cut off at the border of a tile lies inside the complete box found by the neighbouring tile, so it
+    overlaps it completely although their intersection over union is small
+    :param box: array of shape (4,)
+    :param boxes: array of shape (n, 4)
+    :return: array of shape (n,)
+    """
+
+    width = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    height = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return width * height / np.maximum(np.minimum(area, areas), 1e-9)
+
+
+def truncated_boxes(xyxy, windows, roi, margin=1.0):
+    """
+    Finds the boxes that touch an edge of their tile inside the region, these objects were cut off by the tile
+    :param xyxy: array of shape (n, 4) in the coordinates of the image
+    :param windows: array of shape (n, 4) with the (x_min, y_min, x_max, y_max) tile of every box
+    :param roi: (x_min, y_min, x_max, y_max) of the region, its border does not cut off objects
+    :param margin: max distance in pixels of a box to the edge of its tile
+    :return: boolean array of shape (n,)
+    """
+
+    roi = np.asarray(roi, dtype=np.float64)
+    near_min = (xyxy[:, :2] - windows[:, :2] <= margin) & (windows[:, :2] > roi[:2])
+    near_max = (windows[:, 2:] - xyxy[:, 2:] <= margin) & (windows[:, 2:] < roi[2:])
+    return near_min.any(axis=1) | near_max.any(axis=1)
+
+
+def non_max_suppression(xyxy, confidence, class_id, threshold=0.5, truncated=None):
+    """
+    Keeps one box of every group of overlapping boxes of the same class.
+    Complete boxes are preferred over boxes cut off at a tile edge and more confident boxes over less confident ones,
+    so a truncated box never replaces the complete box of the same object found by the neighbouring tile
+    :param xyxy: array of shape (n, 4)
+    :param confidence: array of shape (n,)
+    :param class_id: array of shape (n,)
+    :param threshold: boxes that overlap a preferred box by more than this are removed
+    :param truncated: boolean array of shape (n,) of the boxes cut off at a tile edge, no box is truncated if None
+    :return: indices of the kept boxes
+    """
+
+    if truncated is None:
+        truncated = np.zeros(len(xyxy), dtype=bool)
+
+    keep = []
+    for value in np.unique(class_id):
+        indices = np.where(class_id == value)[0]
+        indices = indices[np.lexsort((-confidence[indices], truncated[indices]))]
+        while len(indices):
+            best = indices[0]
+            keep.append(best)
+            indices = indices[1:][box_overlaps(xyxy[best], xyxy[indices[1:]]) <= threshold]
+    return np.sort(np.array(keep, dtype=int))
+
+
+def tiled_detect(model, img, conf, tile_size=640, overlap=0.2, batch_size=4, nms_threshold=0.5):
+    """
+    Detects small objects by running the model on overlapping tiles of the sheet region at the full resolution
+    instead of on the downscaled image, the boxes of all tiles are merged with non max suppression that prefers
+    the complete boxes over the boxes cut off at a tile edge
+    :param model: yolo model to use
+    :param img: image to process
+    :param conf: confidence threshold of the model
+    :param tile_size: size of the square tiles in pixels
+    :param overlap: overlap of neighbouring tiles as a fraction of the tile size
+    :param batch_size: number of tiles passed to the model at once
+    :param nms_threshold: overlap above which boxes of the same class are merged
+    :return: detections in the coordinates of the image
+    """
+
+    import supervision as sv
+
+    roi = sheet_roi(img)
+    windows = tile_windows(roi, tile_size, overlap)
+
+    xyxy, confidence, class_id, box_windows = [], [], [], []
+    for i in range(0, len(windows), batch_size):
+        batch = windows[i:i + batch_size]
+        tiles = [img[y_min:y_max, x_min:x_max] for x_min, y_min, x_max, y_max in batch]
+        results = model(tiles, conf=conf, imgsz=tile_size, verbose=False)
+
+        for window, result in zip(batch, results):
+            x_min, y_min = window[:2]
+            detections = sv.Detections.from_ultralytics(result)
+            xyxy.append(detections.xyxy + np.array([x_min, y_min, x_min, y_min]))
+            confidence.append(detections.confidence)
+            class_id.append(detections.class_id)
+            box_windows.append(np.tile(np.array(window, dtype=np.float64), (len(detections), 1)))
+
+    if not xyxy:
+        return sv.Detections.empty()
+
+    xyxy = np.concatenate(xyxy).astype(np.float32)
+    confidence = np.concatenate(confidence)
+    class_id = np.concatenate(class_id)
+    truncated = truncated_boxes(xyxy, np.concatenate(box_windows), roi)
+    keep = non_max_suppression(xyxy, confidence, class_id, nms_threshold, truncated)
+
+    return sv.Detections(xyxy=xyxy[keep], confidence=confidence[keep], class_id=class_id[keep])
+
+
+def detect_tiled(model, img, config=None):
+    """
+    Runs the tiled detection with the settings of the config
+    :param model: yolo model to use
+    :param img: image to process
+    :param config: settings to use, the defaults if None
+    :return: detections in the coordinates of the image
+    """
+
+    config = config or Config()
+    return tiled_detect(model, img, config.confidence_threshold, config.tile_size, config.tile_overlap,
+                        config.tile_batch_size, config.tile_nms_threshold)
@@ -1,26 +1,57 @@
 import cv2
 import numpy as np
-import supervision as sv
-from object_detection.detect_numbers import delete_folder_contents, load_model
+from config import Config
+from object_detection.model_registry import get_model
+from object_segmentation.simplify_polygons import smooth_polygon, simplify_polygon
+from utils.coordinate_transform import get_sheet_transform
+from utils.profiling import timed, timer, count
+from utils.review_server import show_image
 
 
-def segment_instances():
+def segment_masks(img=None, config=None):
+    """
+    Segments the instances of the captured image and returns their masks
+    :param img: the image to segment, the image at captured_img_path is used if None
+    :param config: settings to use, the defaults if None
+    :return: boolean array of shape (n, height, width) with the mask of every detected object
+    """
+
+    import supervision as sv
+
+    config = config or Config()
+
+    model = get_model(config.object_segmentation_model_path, task="segment", config=config)
+    if img is None:
+        img = cv2.imread(config.captured_img_path)
+
+    with timer("segmentation"):
+        results = model(img, conf=config.segmentation_confidence_threshold, verbose=False)[0]
+        masks = sv.Detections.from_ultralytics(results).mask
+    if masks is None:
+        masks = np.zeros((0,) + img.shape[:2], dtype=bool)
+    count("segments", len(masks))
+
+    return masks
+
+
+def segment_instances(img=None, config=None):
     """
     Segments the instances of the captured image and returns the polygons of the detected objects.
+    :param img: the image to segment, the image at captured_img_path is used if None
+    :param config: settings to use, the defaults if None
     :return: polygons: List of polygons of the detected objects
     """
 
-    from app import OBJECT_SEGMENTATION_MODEL_PATH, CAPTURED_IMG_PATH, SAVE_DIR, RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT, SHOW_POLYGONS
-
-    delete_folder_contents(SAVE_DIR)
+    import supervision as sv
 
-    model = load_model(OBJECT_SEGMENTATION_MODEL_PATH)
-    img = cv2.imread(CAPTURED_IMG_PATH)
+    config = config or Config()
 
-    results = model(img, conf=0.5, save=True, save_crop=True, project=SAVE_DIR)[0]
-    detections = sv.Detections.from_ultralytics(results)
+    if img is None:
+        img = cv2.imread(config.captured_img_path)
 
-    polygons = [sv.mask_to_polygons(m) for m in detections.mask]
+    masks = segment_masks(img, config)
+    with timer("polygon_extraction"):
+        polygons = [sv.mask_to_polygons(m) for m in masks]
 
     img_with_polygons = img.copy()
     for poly in polygons:
@@ -28,52 +59,37 @@ def segment_instances():
             points = p.reshape((-1, 1, 2))
             cv2.polylines(img_with_polygons, [points], True, (0, 255, 0), 2)
 
-    if SHOW_POLYGONS:
-        cv2.namedWindow('Object Segmentations', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('Object Segmentations', RESULT_WINDOW_WIDTH, RESULT_WINDOW_HEIGHT)
-        cv2.imshow('Object Segmentations', img_with_polygons)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+    if config.show_polygons:
+        show_image('Object Segmentations', img_with_polygons, config)
 
     return polygons
 
 
-def convert_coordinates_poly(poly_coords):
+@timed("polygon_simplification")
+def convert_coordinates_poly(poly_coords, image_shape=None, config=None):
     """
     Converts the coordinates of the detected polygons to a format that can be used by the Dobot.
+    Every polygon is smoothed and simplified, so it keeps only the vertices needed for polygon_tolerance_mm
     :param poly_coords: List of polygons of the detected objects
-    :return: converted_data: List of converted coordinates for the detected polygons
+    :param image_shape: Shape of the segmented image, the webcam resolution is used if None
+    :param config: settings to use, the defaults if None
+    :return: converted_data: List of vertex arrays of shape (n, 2), one for every polygon
     """
 
+    config = config or Config()
+
+    height, width = image_shape[:2] if image_shape is not None else (None, None)
+    transform = get_sheet_transform(width, height, config)
+
     converted_data = []
 
     for polygons in poly_coords:
-        polygon_data = []
-        previous_point = None
-
         for poly in polygons:
-            for point in poly:
-                if isinstance(point, (np.int64, np.float64)):
-                    continue
-
-                x = point[0]
-                y = point[1]
-
-                if x > 882:
-                    x -= 882
-
-                new_x = round((x / 2268) * 100, 2)
-                new_y = round((y / 2268) * 100, 2)
-
-                if previous_point is not None:
-                    diff_x = abs(new_x - previous_point[0])
-                    diff_y = abs(new_y - previous_point[1])
-
-                    if diff_x > 0.1 or diff_y > 0.1:
-                        polygon_data.append((new_x, new_y))
-
-                previous_point = (new_x, new_y)
+            points = transform.apply(np.asarray(poly, dtype=np.float64).reshape(-1, 2))
+            points = smooth_polygon(points, config.polygon_smoothing_window)
+            points = simplify_polygon(points, config.polygon_tolerance_mm)
 
-        converted_data.append(polygon_data)
+            if len(points) >= 3:
+                converted_data.append(np.round(points, 2))
 
     return converted_data
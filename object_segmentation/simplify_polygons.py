@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def smooth_polygon(points, window):
+    """
+    Smooths a closed polygon with a circular moving average over its vertices
+    :param points: array of shape (n, 2)
+    :param window: number of vertices to average, smoothing is skipped for windows smaller than 2
+    :return: array of shape (n, 2)
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    if window < 2 or len(points) <= window:
+        return points
+
+    half = window // 2
+    padded = np.concatenate([points[-half:], points, points[:window - half - 1]])
+    kernel = np.ones(window) / window
+    return np.column_stack([np.convolve(padded[:, i], kernel, mode="valid") for i in range(2)])
+
+
+def line_distances(points, start, end):
+    """
+    Calculates the distance of points to the line through start and end
+    :param points: array of shape (n, 2)
+    :param start: first point of the line
+    :param end: second point of the line
+    :return: array of shape (n,)
+    """
+
+    direction = end - start
+    length = np.hypot(direction[0], direction[1])
+    if length == 0:
+        return np.hypot(points[:, 0] - start[0], points[:, 1] - start[1])
+    return np.abs(direction[0] * (points[:, 1] - start[1]) - direction[1] * (points[:, 0] - start[0])) / length
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Simplifies an open polyline with the Douglas-Peucker algorithm.
+    The recursion is replaced by a stack and the distances of every span are calculated at once
+    :param points: array of shape (n, 2)
+    :param tolerance: maximum distance of a removed vertex to the simplified polyline
+    :return: boolean mask of the vertices to keep
+    """
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = line_distances(points[first + 1:last], points[first], points[last])
+        index = int(distances.argmax())
+        if distances[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return keep
+
+
+def simplify_polygon(points, tolerance):
+    """
+    Simplifies a closed polygon with the Douglas-Peucker algorithm.
+    The ring is split at the vertex farthest from the first vertex and both halves are simplified as polylines
+    :param points: array of shape (n, 2)
+    :param tolerance: maximum distance of a removed vertex to the simplified polygon
+    :return: array of shape (m, 2)
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 3:
+        return points
+
+    split = int(np.hypot(*(points - points[0]).T).argmax())
+    ring = np.concatenate([points, points[:1]])
+    keep = np.concatenate([
+        simplify_polyline(ring[:split + 1], tolerance)[:-1],
+        simplify_polyline(ring[split:], tolerance)[:-1],
+    ])
+    return points[keep]
@@ -0,0 +1,324 @@
+import argparse
+import itertools
+import queue
+import threading
+import time
+from logging import Logger
+from batch import iter_images
+from config import Config
+from object_detection.detect_numbers import process_image, group_numbers_dots, recognize_numbers
+from object_detection.model_registry import get_model
+from utils.result_cache import get_result_cache
+
+# Marks the end of the items in a queue
+_STOP = object()
+
+
+class StageStats:
+    """
+    Latency and throughput counters of a pipeline stage
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+        self.blocked_time = 0.0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def record(self, latency, wait_time, blocked_time, failed=False):
+        with self._lock:
+            self.items += 1
+            self.errors += int(failed)
+            self.busy_time += latency
+            self.wait_time += wait_time
+            self.blocked_time += blocked_time
+            self.latencies.append(latency)
+
+    def summary(self, wall_time):
+        """
+        Summarizes the counters of the stage
+        :param wall_time: run time of the whole pipeline in seconds
+        :return: dictionary with the summary
+        """
+
+        latencies = sorted(self.latencies)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "mean_latency": self.busy_time / self.items if self.items else 0.0,
+            "max_latency": latencies[-1] if latencies else 0.0,
+            "throughput": self.items / wall_time if wall_time > 0 else 0.0,
+            "utilization": self.busy_time / (wall_time * self.workers) if wall_time > 0 else 0.0,
+            "wait_time": self.wait_time,
+            "blocked_time": self.blocked_time,
+        }
+
+
+class Pipeline:
+    """
+    Runs stages in their own threads connected by bounded queues.
+    A full queue blocks the stage in front of it, so a slow stage slows down the stages before it instead of
+    letting the items pile up. Stages with several workers may change the order of the items, so the source numbers
+    them and a stage with a single worker puts them back into that order before it processes them
+    """
+
+    def __init__(self, stages, queue_size=2):
+        """
+        :param stages: list of (name, function, workers) tuples, every function takes the output of the stage before
+        :param queue_size: maximum number of items waiting in front of every stage
+        """
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = []
+        self.wall_time = 0.0
+        # Released for every item that left the last stage, so a source can wait until its items are done
+        self.done = threading.Semaphore(0)
+
+    def run(self, source):
+        """
+        Feeds all items of the source through the stages and waits until the last stage finished
+        :param source: iterable of input items
+        :return: list with the summary of every stage, the source is the first entry
+        """
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.stats = [StageStats("source", 1)] + [StageStats(name, workers) for name, _, workers in self.stages]
+
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0], self.stats[0]), name="source")]
+        for i, (name, function, workers) in enumerate(self.stages):
+            # Number of workers of the stage that did not see the end yet, shared with a lock
+            remaining = [workers, threading.Lock()]
+            for worker in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(function, queues[i], queues[i + 1], self.stats[i + 1], remaining, workers == 1),
+                    name=f"{name}-{worker}",
+                ))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # Drain the output of the last stage, so it never blocks
+        while queues[-1].get() is not _STOP:
+            self.done.release()
+
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+        return self.report()
+
+    @staticmethod
+    def _feed(source, output_queue, stats):
+        # The end is always queued, otherwise the following stages and run would wait forever
+        try:
+            iterator = iter(source)
+            for sequence in itertools.count():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    # A generator can not continue after it raised, so the source ends here
+                    print(f"Source failed: {e}")
+                    stats.record(time.perf_counter() - start, 0.0, 0.0, failed=True)
+                    break
+                latency = time.perf_counter() - start
+
+                start = time.perf_counter()
+                output_queue.put((sequence, item))
+                stats.record(latency, 0.0, time.perf_counter() - start)
+        finally:
+            output_queue.put(_STOP)
+
+    @staticmethod
+    def _work(function, input_queue, output_queue, stats, remaining, ordered):
+        # Items that arrived before the items in front of them, by their sequence number
+        pending = {}
+        next_sequence = 0
+        start = time.perf_counter()
+        while True:
+            if ordered and next_sequence in pending:
+                item = pending.pop(next_sequence)
+            else:
+                item = input_queue.get()
+
+            if item is _STOP:
+                # Let the other workers of the stage see the end as well, the last one forwards it
+                input_queue.put(_STOP)
+                with remaining[1]:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    output_queue.put(_STOP)
+                return
+
+            sequence, data = item
+            if ordered and sequence != next_sequence:
+                pending[sequence] = item
+                continue
+            next_sequence += 1
+
+            # The item failed in a stage before, it is passed on so the following stages do not wait for it
+            if data is None:
+                output_queue.put(item)
+                start = time.perf_counter()
+                continue
+            wait_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            try:
+                result = function(data)
+                failed = False
+            except Exception as e:
+                print(f"Stage {stats.name} failed: {e}")
+                result = None
+                failed = True
+            latency = time.perf_counter() - start
+
+            start = time.perf_counter()
+            output_queue.put((sequence, result))
+            stats.record(latency, wait_time, time.perf_counter() - start, failed)
+            start = time.perf_counter()
+
+    def report(self):
+        """
+        Prints the counters of every stage and marks the stage with the highest utilization as the bottleneck
+        :return: list with the summary of every stage
+        """
+
+        summaries = [stats.summary(self.wall_time) for stats in self.stats]
+        bottleneck = max(summaries[1:], key=lambda summary: summary["utilization"], default=None)
+
+        print(f"{'stage':<10} {'workers':>7} {'items':>6} {'errors':>6} {'mean':>8} {'max':>8} {'items/s':>8} "
+              f"{'busy':>6} {'waiting':>8} {'blocked':>8}")
+        for summary in summaries:
+            marker = " <- bottleneck" if summary is bottleneck else ""
+            print(f"{summary['stage']:<10} {summary['workers']:>7} {summary['items']:>6} {summary['errors']:>6} "
+                  f"{summary['mean_latency']:>7.2f}s {summary['max_latency']:>7.2f}s {summary['throughput']:>8.2f} "
+                  f"{summary['utilization']:>6.0%} {summary['wait_time']:>7.1f}s {summary['blocked_time']:>7.1f}s"
+                  f"{marker}")
+        print(f"Total: {self.wall_time:.1f}s")
+        return summaries
+
+
+def camera_sheets(count, config=None, done=None):
+    """
+    Captures sheets with the capture service. Before every sheet after the first it waits until the previous sheet
+    was drawn and then until another sheet lies under the camera, so the same sheet is never captured twice.
+    The camera and the Dobot share one sheet, so the vision of a sheet never overlaps the drawing of the previous one
+    :param count: number of sheets to capture
+    :param config: settings to use, the defaults if None
+    :param done: semaphore released for every sheet that was drawn, e.g. done of the pipeline
+    :return: generator of (name, frame) tuples
+    """
+
+    from object_detection.capture_service import capture_frame
+
+    config = config or Config()
+    cache = get_result_cache(config)
+
+    def same_sheet(key, other):
+        return key.matches(other, config.result_cache_hash_distance, config.result_cache_cell_threshold,
+                           config.result_cache_corner_tolerance)
+
+    previous = None
+    for i in range(count):
+        if previous is not None:
+            if done is not None:
+                # The drawn sheet is the one to be replaced, the arm covered it until it was drawn
+                done.acquire()
+                previous = cache.key(capture_frame(config), "dot_to_dot", config)
+            print(f"Waiting for sheet {i + 1} of {count}")
+
+        frame = capture_frame(config)
+        key = cache.key(frame, "dot_to_dot", config)
+        # The next sheet has to differ from the previous one and stay still for two frames
+        still = False
+        while previous is not None and (same_sheet(key, previous) or not still):
+            time.sleep(config.pipeline_poll_interval)
+            frame = capture_frame(config)
+            last, key = key, cache.key(frame, "dot_to_dot", config)
+            still = same_sheet(key, last)
+
+        previous = key
+        yield f"sheet_{i:04d}", frame
+
+
+def dot_to_dot_stages(dobot, config=None):
+    """
+    Creates the stages to detect, recognize and draw dot to dot sheets
+    :param dobot: controller that draws the sheets, the drawing is skipped if it is not connected
+    :param config: settings to use, the config of the controller if None
+    :return: list of stages for the pipeline
+    """
+
+    config = config or dobot.config
+    model = get_model(config.object_detection_model_path, task="detect", config=config)
+
+    def detect(sheet):
+        name, img = sheet
+        number_coords, dot_coords, _, img = process_image(model, img, config)
+        grouped_coords, _, _ = group_numbers_dots(number_coords, dot_coords, img, config)
+        return name, grouped_coords, img.shape
+
+    def ocr(sheet):
+        name, grouped_coords, image_shape = sheet
+        return name, recognize_numbers(grouped_coords, show=False, config=config, image_shape=image_shape) or []
+
+    def draw(sheet):
+        name, data = sheet
+        if dobot.is_connected and data:
+            dobot.draw_dot_to_dot([coordinates for _, coordinates in data])
+        return name
+
+    return [
+        ("detect", detect, 1),
+        ("ocr", ocr, config.ocr_workers),
+        # A single worker, so only one thread talks to the serial port
+        ("draw", draw, 1),
+    ]
+
+
+def run_pipelined_dot_to_dot(source, dobot, config=None):
+    """
+    Runs the dot to dot use case for several sheets, the vision of the next sheet runs while the Dobot draws.
+    This only overlaps for sources with all sheets at hand like a folder, camera_sheets waits for every drawing
+    :param source: iterable of (name, image) tuples
+    :param dobot: controller that draws the sheets
+    :param config: settings to use, the config of the controller if None
+    :return: list with the summary of every stage
+    """
+
+    config = config or dobot.config
+    return Pipeline(dot_to_dot_stages(dobot, config), config.pipeline_queue_size).run(source)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detect and draw several dot to dot sheets in a pipeline')
+    parser.add_argument('--source', help='folder with the images of the sheets, the webcam is used if not set')
+    parser.add_argument('--count', type=int, default=1, help='number of sheets to capture with the webcam')
+    parser.add_argument('--simulate', action='store_true', help='draw on the simulated Dobot')
+    args = parser.parse_args()
+
+    settings = Config()
+
+    if args.simulate:
+        from dobot.simulator import SimulatedDobotController
+        controller = SimulatedDobotController(config=settings)
+    else:
+        from dobot.dobot_controller import DobotController
+        controller = DobotController(logger=Logger(name="dobot"), port=settings.dobot_port, config=settings)
+
+    pipeline = Pipeline(dot_to_dot_stages(controller, settings), settings.pipeline_queue_size)
+    sheets = iter_images(args.source) if args.source else camera_sheets(args.count, settings, pipeline.done)
+    pipeline.run(sheets)
@@ -0,0 +1,47 @@
+import numpy as np
+from object_detection.tiled_inference import non_max_suppression, truncated_boxes
+
+# Region of the sheet split into two tiles that overlap between x = 500 and x = 640
+ROI = (0, 0, 1140, 640)
+LEFT_TILE = (0, 0, 640, 640)
+RIGHT_TILE = (500, 0, 1140, 640)
+
+
+def test_truncated_box_does_not_replace_complete_box():
+    # The left tile cuts the number off at its edge x = 640 but is more confident than the right tile
+    xyxy = np.array([[610, 100, 640, 130], [610, 100, 660, 130]], dtype=np.float64)
+    confidence = np.array([0.9, 0.6])
+    class_id = np.array([1, 1])
+    windows = np.array([LEFT_TILE, RIGHT_TILE], dtype=np.float64)
+
+    truncated = truncated_boxes(xyxy, windows, ROI)
+    keep = non_max_suppression(xyxy, confidence, class_id, 0.5, truncated)
+
+    assert truncated.tolist() == [True, False]
+    assert keep.tolist() == [1]
+
+
+def test_truncated_box_without_complete_box_is_kept():
+    xyxy = np.array([[610, 100, 640, 130], [100, 100, 130, 130]], dtype=np.float64)
+    confidence = np.array([0.9, 0.8])
+    class_id = np.array([1, 1])
+    windows = np.array([LEFT_TILE, LEFT_TILE], dtype=np.float64)
+
+    keep = non_max_suppression(xyxy, confidence, class_id, 0.5, truncated_boxes(xyxy, windows, ROI))
+
+    assert keep.tolist() == [0, 1]
+
+
+def test_box_at_the_border_of_the_region_is_not_truncated():
+    xyxy = np.array([[0, 0, 20, 20], [1120, 620, 1140, 640]], dtype=np.float64)
+    windows = np.array([LEFT_TILE, RIGHT_TILE], dtype=np.float64)
+
+    assert not truncated_boxes(xyxy, windows, ROI).any()
+
+
+def test_most_confident_complete_box_is_kept():
+    xyxy = np.array([[100, 100, 130, 130], [102, 101, 131, 131]], dtype=np.float64)
+    confidence = np.array([0.6, 0.9])
+    class_id = np.array([0, 0])
+
+    assert non_max_suppression(xyxy, confidence, class_id).tolist() == [1]
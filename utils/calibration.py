@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+import cv2
+import numpy as np
+from config import Config
+from utils.coordinate_transform import CoordinateTransform
+
+
+def order_corners(corners):
+    """
+    Orders four corners as top left, top right, bottom right, bottom left
+    :param corners: array of shape (4, 2)
+    :return: ordered array of shape (4, 2)
+    """
+
+    corners = np.asarray(corners, dtype=np.float64).reshape(4, 2)
+    sums = corners.sum(axis=1)
+    diffs = corners[:, 1] - corners[:, 0]
+    return np.array([
+        corners[np.argmin(sums)],
+        corners[np.argmin(diffs)],
+        corners[np.argmax(sums)],
+        corners[np.argmax(diffs)],
+    ])
+
+
+def intersect_lines(line1, line2):
+    """
+    Intersects two lines given as (vx, vy, x0, y0) like returned by cv2.fitLine
+    :return: intersection point as array of shape (2,)
+    """
+
+    direction1, point1 = line1[:2], line1[2:]
+    direction2, point2 = line2[:2], line2[2:]
+    t = np.linalg.solve(np.column_stack([direction1, -direction2]), point2 - point1)
+    return point1 + t[0] * direction1
+
+
+def detect_sheet(img, min_area_ratio=0.1):
+    """
+    Detects the sheet as the largest bright quadrilateral of the image.
+    The corners are refined by fitting a line through the contour points of every side and intersecting them
+    :param img: image of the sheet
+    :param min_area_ratio: minimum area of the sheet as a fraction of the image area
+    :return: ordered corners of shape (4, 2) and the contour points of shape (n, 2), or (None, None)
+    """
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+    contours = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[0]
+    if not contours:
+        return None, None
+    contour = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(contour) < min_area_ratio * gray.shape[0] * gray.shape[1]:
+        return None, None
+
+    approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+    if len(approx) != 4:
+        return None, None
+
+    corners = order_corners(approx)
+    points = contour.reshape(-1, 2).astype(np.float64)
+
+    # Assign every contour point to the side it is closest to and fit a line per side
+    sides = np.stack([corners, np.roll(corners, -1, axis=0)], axis=1)
+    distances = np.stack([point_segment_distances(points, start, end) for start, end in sides], axis=1)
+    side_of_point = distances.argmin(axis=1)
+
+    lines = []
+    for side in range(4):
+        side_points = points[side_of_point == side]
+        if len(side_points) < 2:
+            return corners, points
+        lines.append(cv2.fitLine(side_points.astype(np.float32), cv2.DIST_HUBER, 0, 0.01, 0.01).ravel())
+
+    refined = np.array([intersect_lines(lines[i - 1], lines[i]) for i in range(4)])
+    return refined, points
+
+
+def point_segment_distances(points, start, end):
+    """
+    Calculates the distance of points to a line segment
+    :param points: array of shape (n, 2)
+    :param start: start of the segment
+    :param end: end of the segment
+    :return: array of shape (n,)
+    """
+
+    segment = end - start
+    length = max(segment @ segment, 1e-12)
+    t = np.clip((points - start) @ segment / length, 0, 1)
+    return np.linalg.norm(points - (start + t[:, None] * segment), axis=1)
+
+
+def reprojection_error(transform, contour_points, robot_corners):
+    """
+    Measures how well the homography maps the detected outline of the sheet onto the edges of the sheet on the
+    Dobot plane. The four corners define the homography exactly, so the outline is used to measure the error
+    :param transform: transform from image pixels to the Dobot plane
+    :param contour_points: detected contour points of the sheet in the image
+    :param robot_corners: corners of the sheet on the Dobot plane
+    :return: dictionary with the errors in mm
+    """
+
+    projected = transform.apply(contour_points)
+    sides = zip(robot_corners, np.roll(robot_corners, -1, axis=0))
+    edge_errors = np.min([point_segment_distances(projected, start, end) for start, end in sides], axis=0)
+
+    return {
+        "edge_mean": float(edge_errors.mean()),
+        "edge_max": float(edge_errors.max()),
+        "edge_points": int(len(edge_errors)),
+    }
+
+
+def calibrate(img, robot_corners):
+    """
+    Solves the homography from image pixels to the Dobot plane from the corners of the sheet
+    :param img: image of the empty sheet under the camera
+    :param robot_corners: corners of the sheet on the Dobot plane (top left, top right, bottom right, bottom left)
+    :return: transform and reprojection error report, or (None, None) if no sheet was found
+    """
+
+    corners, contour_points = detect_sheet(img)
+    if corners is None:
+        return None, None
+
+    robot_corners = np.asarray(robot_corners, dtype=np.float64)
+    matrix = cv2.getPerspectiveTransform(corners.astype(np.float32), robot_corners.astype(np.float32))
+    transform = CoordinateTransform(matrix)
+    return transform, reprojection_error(transform, contour_points, robot_corners)
+
+
+def camera_setup(config=None):
+    """
+    Returns the settings a calibration is only valid for
+    :param config: settings to use, the defaults if None
+    :return: dictionary of the settings
+    """
+
+    config = config or Config()
+    return {
+        "camera_index": config.webcam_index,
+        "width": config.webcam_resolution_width,
+        "height": config.webcam_resolution_height,
+        "sheet_corners": [list(corner) for corner in config.calibration_sheet_corners],
+    }
+
+
+def setup_checksum(setup):
+    """
+    Calculates the checksum of a camera setup
+    :param setup: dictionary returned by camera_setup
+    :return: hex digest
+    """
+
+    return hashlib.sha256(json.dumps(setup, sort_keys=True).encode()).hexdigest()
+
+
+def save_calibration(path, transform, report, setup):
+    """
+    Saves a calibration together with the checksum of the camera setup it was made with
+    :param path: path of the json file
+    :param transform: transform from image pixels to the Dobot plane
+    :param report: reprojection error report
+    :param setup: dictionary returned by camera_setup
+    """
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "matrix": transform.to_list(),
+            "checksum": setup_checksum(setup),
+            "setup": setup,
+            "reprojection_error": report,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, indent=1)
+    load_calibration.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def load_calibration(path, checksum):
+    """
+    Loads a saved calibration, the file is only read once per process
+    :param path: path of the json file
+    :param checksum: checksum of the current camera setup
+    :return: transform from image pixels to the Dobot plane, or None if there is no calibration for the setup
+    """
+
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("checksum") != checksum:
+        print(f"Calibration in {path} was made for a different camera setup, recalibrate")
+        return None
+    return CoordinateTransform.from_list(data["matrix"])
+
+
+def get_calibration(config=None):
+    """
+    Returns the calibration for the camera setup of the config
+    :param config: settings to use, the defaults if None
+    :return: transform from image pixels to the Dobot plane, or None
+    """
+
+    config = config or Config()
+    return load_calibration(config.calibration_path, setup_checksum(camera_setup(config)))
+
+
+def render_synthetic_sheet(width, height, corners, noise=0.0, seed=0):
+    """
+    Renders a bright sheet on a dark background, used to check the calibration without a camera
+    :param width: width of the image
+    :param height: height of the image
+    :param corners: corners of the sheet in the image
+    :param noise: standard deviation of the gaussian noise added to the image
+    :param seed: seed of the noise
+    :return: the rendered image
+    """
+
+    img = np.full((height, width, 3), 40, dtype=np.uint8)
+    cv2.fillPoly(img, [np.round(np.asarray(corners)).astype(np.int32)], (235, 235, 235), cv2.LINE_AA)
+    if noise > 0:
+        rng = np.random.default_rng(seed)
+        img = np.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+    return img
+
+
+def print_report(report):
+    print(f"Reprojection error over {report['edge_points']} edge points: mean {report['edge_mean']:.3f}mm, "
+          f"max {report['edge_max']:.3f}mm")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate the camera against the Dobot plane with an empty sheet')
+    parser.add_argument('--image', help='image of the sheet, a frame of the webcam is used if not set')
+    args = parser.parse_args()
+
+    settings = Config()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+    else:
+        from object_detection.capture_service import capture_frame
+        frame = capture_frame(settings)
+
+    result, error_report = calibrate(frame, settings.calibration_sheet_corners)
+    if result is None:
+        print("No sheet found in the image")
+    else:
+        print_report(error_report)
+        save_calibration(settings.calibration_path, result, error_report, camera_setup(settings))
+        print(f"Calibration saved to {settings.calibration_path}")
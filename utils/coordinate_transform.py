@@ -0,0 +1,142 @@
+from functools import lru_cache
+import numpy as np
+from config import Config
+
+
+class CoordinateTransform:
+    """
+    Projective transform between two planes, stored as a 3x3 matrix.
+    Affine transforms are a special case with [0, 0, 1] as the last row
+    """
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self._inverse = None
+
+    def __matmul__(self, other):
+        """
+        Chains two transforms, (a @ b) applies b first and then a
+        """
+
+        return CoordinateTransform(self.matrix @ other.matrix)
+
+    def apply(self, points):
+        """
+        Transforms points
+        :param points: array-like of shape (n, 2)
+        :return: array of shape (n, 2)
+        """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        transformed = points @ self.matrix[:, :2].T + self.matrix[:, 2]
+        return transformed[:, :2] / transformed[:, 2:]
+
+    def inverse(self):
+        """
+        Returns the inverse transform
+        :return: coordinate transform
+        """
+
+        if self._inverse is None:
+            self._inverse = CoordinateTransform(np.linalg.inv(self.matrix))
+        return self._inverse
+
+    def invert(self, points):
+        """
+        Transforms points back to the source plane
+        :param points: array-like of shape (n, 2)
+        :return: array of shape (n, 2)
+        """
+
+        return self.inverse().apply(points)
+
+    def to_list(self):
+        return self.matrix.tolist()
+
+    @classmethod
+    def from_list(cls, matrix):
+        return cls(np.array(matrix, dtype=np.float64))
+
+
+@lru_cache(maxsize=None)
+def pixel_to_sheet_transform(width, height):
+    """
+    Transform from image pixels to sheet coordinates.
+    The sheet is the centered square of the image with the image height as side length, its coordinates are
+    percentages of the side length
+    :param width: width of the image in pixels
+    :param height: height of the image in pixels
+    :return: coordinate transform
+    """
+
+    scale = 100 / height
+    offset_x = (width - height) / 2
+    return CoordinateTransform([
+        [scale, 0, -offset_x * scale],
+        [0, scale, 0],
+        [0, 0, 1],
+    ])
+
+
+@lru_cache(maxsize=None)
+def sheet_to_robot_transform(offset_x, offset_y):
+    """
+    Transform from sheet coordinates to the coordinate system of the Dobot in mm.
+    The x axis of the Dobot runs along the y axis of the sheet
+    :param offset_x: x coordinate of the top edge of the sheet in the Dobot coordinate system
+    :param offset_y: negative y coordinate of the left edge of the sheet in the Dobot coordinate system
+    :return: coordinate transform
+    """
+
+    return CoordinateTransform([
+        [0, 1, offset_x],
+        [1, 0, -offset_y],
+        [0, 0, 1],
+    ])
+
+
+def get_sheet_transform(width=None, height=None, config=None):
+    """
+    Returns the transform from image pixels to sheet coordinates for the camera setup of the config.
+    With use_calibration the saved homography is used for images in the webcam resolution
+    :param width: width of the image, webcam_resolution_width if None
+    :param height: height of the image, webcam_resolution_height if None
+    :param config: settings to use, the defaults if None
+    :return: coordinate transform
+    """
+
+    config = config or Config()
+    width = width or config.webcam_resolution_width
+    height = height or config.webcam_resolution_height
+
+    if config.use_calibration and (width, height) == (config.webcam_resolution_width, config.webcam_resolution_height):
+        from utils.calibration import get_calibration
+
+        calibration = get_calibration(config)
+        if calibration is not None:
+            return get_robot_transform(config).inverse() @ calibration
+
+    return pixel_to_sheet_transform(width, height)
+
+
+def get_robot_transform(config=None):
+    """
+    Returns the transform from sheet coordinates to the coordinate system of the Dobot
+    :param config: settings to use, the defaults if None
+    :return: coordinate transform
+    """
+
+    config = config or Config()
+    return sheet_to_robot_transform(config.calc_points_offset_x, config.calc_points_offset_y)
+
+
+def get_pixel_to_robot_transform(width=None, height=None, config=None):
+    """
+    Returns the transform from image pixels directly to the coordinate system of the Dobot
+    :param width: width of the image, webcam_resolution_width if None
+    :param height: height of the image, webcam_resolution_height if None
+    :param config: settings to use, the defaults if None
+    :return: coordinate transform
+    """
+
+    return get_robot_transform(config) @ get_sheet_transform(width, height, config)
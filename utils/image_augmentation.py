@@ -1,35 +1,241 @@
-import cv2
-import imgaug.augmenters as ia
+import argparse
 import glob
+import os
+import time
+from multiprocessing import Pool
+import cv2
+
+# Augmenting images to create more images for creating a dataset.
+# The images are streamed through a pool of processes, every output image is written as soon as it is created
+
+# Folder with the source images
+DEFAULT_SOURCE = "resources/train_images/v2"
+# Folder the augmented images are written to
+DEFAULT_OUTPUT = "resources/train_images/v2/augmented_images"
+# File extensions of the source images
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Augmentation of the worker process, created once per process
+_augmentation = None
+
+
+def build_augmentation():
+    """
+    Creates the augmentation pipeline
+    :return: imgaug augmenter
+    """
+
+    import imgaug.augmenters as ia
+
+    return ia.Sequential([
+        ia.Affine(translate_percent={"x": (-0.2, 0.2), "y": (-0.2, 0.2)}, scale=(0.7, 1), rotate=(-30, 30)),
+        ia.Multiply((0.8, 1.2)),
+        ia.LinearContrast((0.6, 1.4)),
+        ia.Sometimes(0.5, ia.GaussianBlur(sigma=(0, 0.5))),
+    ])
+
+
+def find_sources(source):
+    """
+    Finds the source images
+    :param source: folder with the images or a glob pattern
+    :return: sorted list of image paths
+    """
+
+    pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+    return sorted(path for path in glob.glob(pattern) if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def find_label_path(img_path):
+    """
+    Finds the yolo label file of an image, either next to the image or in the labels folder of a yolo dataset
+    :param img_path: path of the image
+    :return: path of the label file or None
+    """
+
+    stem = os.path.splitext(img_path)[0]
+    directory, name = os.path.split(stem)
+    candidates = [f"{stem}.txt", os.path.join(os.path.dirname(directory), "labels", f"{name}.txt")]
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+def read_labels(label_path, width, height):
+    """
+    Reads yolo labels, a line with four values is a bounding box and a line with more values is a polygon
+    :param label_path: path of the label file
+    :param width: width of the image
+    :param height: height of the image
+    :return: imgaug bounding boxes and polygons, the class is stored as their label
+    """
+
+    from imgaug.augmentables.bbs import BoundingBox, BoundingBoxesOnImage
+    from imgaug.augmentables.polys import Polygon, PolygonsOnImage
+
+    boxes = []
+    polygons = []
+    with open(label_path) as f:
+        for line in f:
+            values = line.split()
+            if not values:
+                continue
+            class_id, coords = int(values[0]), [float(value) for value in values[1:]]
+            if len(coords) == 4:
+                x, y, w, h = coords
+                boxes.append(BoundingBox((x - w / 2) * width, (y - h / 2) * height, (x + w / 2) * width,
+                                         (y + h / 2) * height, label=class_id))
+            elif len(coords) >= 6:
+                points = [(coords[i] * width, coords[i + 1] * height) for i in range(0, len(coords) - 1, 2)]
+                polygons.append(Polygon(points, label=class_id))
+
+    shape = (height, width, 3)
+    return BoundingBoxesOnImage(boxes, shape), PolygonsOnImage(polygons, shape)
 
-# Augmenting images to create more images for creating a dataset
 
-images = []
-images_path = glob.glob('../resources/train_images/v2/*.png')
-for img_path in images_path:
+def format_labels(boxes, polygons, width, height):
+    """
+    Formats bounding boxes and polygons as yolo labels
+    :param boxes: imgaug bounding boxes
+    :param polygons: imgaug polygons
+    :param width: width of the image
+    :param height: height of the image
+    :return: list of label lines
+    """
+
+    lines = []
+    for box in boxes.bounding_boxes:
+        x, y = box.center_x / width, box.center_y / height
+        lines.append(f"{box.label} {x:.6f} {y:.6f} {box.width / width:.6f} {box.height / height:.6f}")
+    for polygon in polygons.polygons:
+        coords = " ".join(f"{x / width:.6f} {y / height:.6f}" for x, y in polygon.exterior)
+        lines.append(f"{polygon.label} {coords}")
+    return lines
+
+
+def init_worker():
+    global _augmentation
+    _augmentation = build_augmentation()
+
+
+def augment_job(job):
+    """
+    Augments one source image and writes the augmented image and its labels
+    :param job: (index, source path, seed, output folder, file extension) tuple
+    :return: path of the written image and the number of written labels
+    """
+
+    index, img_path, seed, output_dir, extension = job
+    if _augmentation is None:
+        init_worker()
+
     img = cv2.imread(img_path)
-    images.append(img)
+    if img is None:
+        print(f"Failed to read image {img_path}")
+        return None, 0
+    height, width = img.shape[:2]
+
+    # Seeding every image instead of every worker makes the output independent of the number of workers
+    _augmentation.seed_(seed)
+
+    label_path = find_label_path(img_path)
+    if label_path is None:
+        augmented = _augmentation(image=img)
+        labels = None
+    else:
+        boxes, polygons = read_labels(label_path, width, height)
+        augmented, boxes, polygons = _augmentation(image=img, bounding_boxes=boxes, polygons=polygons)
+        boxes = boxes.remove_out_of_image().clip_out_of_image()
+        polygons = polygons.remove_out_of_image().clip_out_of_image()
+        labels = format_labels(boxes, polygons, augmented.shape[1], augmented.shape[0])
+
+    output_path = os.path.join(output_dir, "images", f"{index}.{extension}")
+    cv2.imwrite(output_path, augmented)
+    if labels is not None:
+        with open(os.path.join(output_dir, "labels", f"{index}.txt"), "w") as f:
+            f.write("\n".join(labels) + ("\n" if labels else ""))
+    return output_path, len(labels or [])
+
+
+def iter_jobs(sources, count, output_dir, seed, extension):
+    """
+    Yields the augmentation jobs, the source images are used in turns
+    :param sources: list of source image paths
+    :param count: number of images to create
+    :param output_dir: folder to write to
+    :param seed: seed of the first image, every image gets its own seed
+    :param extension: file extension of the written images
+    :return: generator of jobs
+    """
+
+    for index in range(count):
+        yield index, sources[index % len(sources)], seed + index, output_dir, extension
+
+
+def count_results(results, count):
+    """
+    Consumes the results of the jobs and prints the progress
+    :param results: iterable of job results
+    :param count: number of jobs
+    :return: number of written images and labels
+    """
+
+    written = 0
+    labels = 0
+    for output_path, label_count in results:
+        if output_path is None:
+            continue
+        written += 1
+        labels += label_count
+        if written % 100 == 0 or written == count:
+            print(f"{written}/{count} images")
+    return written, labels
+
+
+def augment_dataset(source, output_dir, count, workers=None, seed=0, extension="jpg", chunksize=4):
+    """
+    Creates augmented images from the source images, bounding box and polygon labels in the yolo format are
+    augmented together with their image. Only the images the workers are augmenting are held in memory
+    :param source: folder with the images or a glob pattern
+    :param output_dir: folder to write the images to, the labels are written to its labels folder
+    :param count: number of images to create
+    :param workers: number of processes, the number of cpus if None
+    :param seed: seed of the augmentation, the same seed creates the same images
+    :param extension: file extension of the written images
+    :param chunksize: number of jobs sent to a worker at once
+    :return: number of written images
+    """
+
+    sources = find_sources(source)
+    if not sources:
+        print(f"No images found in {source}")
+        return 0
 
-augmentation = ia.Sequential([
-    ia.Affine(translate_percent={"x": (-0.2, 0.2), "y": (-0.2, 0.2)}, scale=(0.7, 1), rotate=(-30, 30)),
-    ia.Multiply((0.8, 1.2)),
-    ia.LinearContrast((0.6, 1.4)),
-    ia.Sometimes(0.5, ia.GaussianBlur(sigma=(0, 0.5))),
-])
+    os.makedirs(os.path.join(output_dir, "images"), exist_ok=True)
+    if any(find_label_path(path) is not None for path in sources):
+        os.makedirs(os.path.join(output_dir, "labels"), exist_ok=True)
 
-target_images = 50
+    jobs = iter_jobs(sources, count, output_dir, seed, extension)
+    workers = workers or os.cpu_count()
 
-while len(images) < target_images:
-    augmented_images = augmentation(images=images)
-    for img in augmented_images:
-        images.append(img)
+    start = time.perf_counter()
+    if workers == 1:
+        written, labels = count_results(map(augment_job, jobs), count)
+    else:
+        with Pool(workers, initializer=init_worker) as pool:
+            written, labels = count_results(pool.imap_unordered(augment_job, jobs, chunksize), count)
 
-images = images[:target_images]
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {written} images with {labels} labels to {output_dir} in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed > 0 else 0:.1f} images/s)")
+    return written
 
-for i, img in enumerate(images):
-    cv2.imwrite(f'../resources/train_images/v2/augmented_images/{i}.jpg', img)
 
-# for img in augmented_images:
-#     cv2.imshow('Augmented Image', img)
-#     cv2.waitKey(0)
-#     cv2.destroyAllWindows()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create an augmented dataset from labelled training images')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='folder with the source images or a glob pattern')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='folder to write the augmented images to')
+    parser.add_argument('--count', type=int, default=50, help='number of images to create')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, all cpus if not set')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--extension', default="jpg")
+    args = parser.parse_args()
+    augment_dataset(args.source, args.output, args.count, args.workers, args.seed, args.extension)
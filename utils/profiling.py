@@ -0,0 +1,270 @@
+import csv
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from config import Config
+
+
+class Profiler:
+    """
+    Collects the durations of named stages and counters of a run.
+    Timers and counters do nothing while the profiler is disabled, so the instrumentation can stay in the code
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = {}
+        self.counters = {}
+        self.started = None
+        self.wall_time = 0.0
+        self.hook = None
+        self._hook_profiler = None
+        self._start_time = None
+        self._lock = threading.Lock()
+
+    def start(self, hook=None):
+        """
+        Clears the collected timings and counters and enables the profiler
+        :param hook: None, "cprofile" or "pyinstrument" to additionally profile every function call of the run
+        """
+
+        with self._lock:
+            self.timings = {}
+            self.counters = {}
+        self.started = datetime.now()
+        self.wall_time = 0.0
+        self.hook = None
+        self._hook_profiler = None
+
+        if hook == "cprofile":
+            import cProfile
+            self._hook_profiler = cProfile.Profile()
+            self._hook_profiler.enable()
+            self.hook = hook
+        elif hook == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as InstrumentProfiler
+            except ImportError:
+                print("pyinstrument is not installed, profiling without it")
+            else:
+                self._hook_profiler = InstrumentProfiler()
+                self._hook_profiler.start()
+                self.hook = hook
+        elif hook is not None:
+            print(f"Unknown profiling hook: {hook}")
+
+        self._start_time = time.perf_counter()
+        self.enabled = True
+
+    def stop(self):
+        """
+        Disables the profiler and stops the profiling hook
+        """
+
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.wall_time = time.perf_counter() - self._start_time
+
+        if self.hook == "cprofile":
+            self._hook_profiler.disable()
+        elif self.hook == "pyinstrument":
+            self._hook_profiler.stop()
+
+    def record(self, name, duration):
+        """
+        Records one duration of a stage
+        :param name: name of the stage
+        :param duration: duration in seconds
+        """
+
+        with self._lock:
+            self.timings.setdefault(name, []).append(duration)
+
+    def count(self, name, value=1):
+        """
+        Increases a counter
+        :param name: name of the counter
+        :param value: amount to add
+        """
+
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Times the code in a with block as one call of a stage
+        :param name: name of the stage
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name=None):
+        """
+        Decorator that times every call of a function as one call of a stage
+        :param name: name of the stage, the name of the function is used if None
+        """
+
+        def decorator(function):
+            stage = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def summary(self):
+        """
+        Summarizes the collected timings and counters
+        :return: dictionary with the calls, total, mean, p50, p95 and max duration of every stage and the counters
+        """
+
+        with self._lock:
+            timings = {name: np.array(durations) for name, durations in self.timings.items()}
+            counters = dict(self.counters)
+
+        stages = {}
+        for name, durations in timings.items():
+            stages[name] = {
+                "calls": len(durations),
+                "total": float(durations.sum()),
+                "mean": float(durations.mean()),
+                "p50": float(np.percentile(durations, 50)),
+                "p95": float(np.percentile(durations, 95)),
+                "max": float(durations.max()),
+            }
+
+        return {
+            "started": self.started.isoformat(timespec="seconds") if self.started else None,
+            "wall_time": self.wall_time,
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_report(self, path):
+        """
+        Writes the summary of the run to a json or csv file, chosen by the extension of the path.
+        The output of the profiling hook is saved next to it
+        :param path: path of the report
+        :return: path of the report
+        """
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        summary = self.summary()
+
+        if path.endswith(".csv"):
+            columns = ["kind", "name", "calls", "total", "mean", "p50", "p95", "max", "value"]
+            with open(path, "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=columns)
+                writer.writeheader()
+                writer.writerow({"kind": "run", "name": "wall_time", "value": summary["wall_time"]})
+                for name, stage in summary["stages"].items():
+                    writer.writerow({"kind": "stage", "name": name, **stage})
+                for name, value in summary["counters"].items():
+                    writer.writerow({"kind": "counter", "name": name, "value": value})
+        else:
+            with open(path, "w") as file:
+                json.dump(summary, file, indent=2)
+
+        base_path = os.path.splitext(path)[0]
+        if self.hook == "cprofile":
+            self._hook_profiler.dump_stats(f"{base_path}.prof")
+        elif self.hook == "pyinstrument":
+            with open(f"{base_path}.html", "w") as file:
+                file.write(self._hook_profiler.output_html())
+
+        return path
+
+    def print_summary(self):
+        """
+        Prints the collected timings and counters
+        """
+
+        summary = self.summary()
+        print(f"{'stage':<24}{'calls':>7}{'total':>10}{'p50':>10}{'p95':>10}")
+        for name, stage in summary["stages"].items():
+            print(f"{name:<24}{stage['calls']:>7}{stage['total']:>9.3f}s"
+                  f"{stage['p50'] * 1000:>8.1f}ms{stage['p95'] * 1000:>8.1f}ms")
+        for name, value in summary["counters"].items():
+            print(f"{name:<24}{value:>7}")
+        print(f"wall time: {summary['wall_time']:.2f}s")
+
+
+profiler = Profiler()
+
+
+def timer(name):
+    """
+    Times the code in a with block with the profiler of the process
+    :param name: name of the stage
+    """
+
+    return profiler.timer(name)
+
+
+def timed(name=None):
+    """
+    Decorator that times every call of a function with the profiler of the process
+    :param name: name of the stage, the name of the function is used if None
+    """
+
+    return profiler.timed(name)
+
+
+def count(name, value=1):
+    """
+    Increases a counter of the profiler of the process
+    :param name: name of the counter
+    :param value: amount to add
+    """
+
+    profiler.count(name, value)
+
+
+def start_profiling(config=None):
+    """
+    Starts profiling a run with the hook selected in the config
+    :param config: settings to use, the defaults if None
+    """
+
+    config = config or Config()
+    profiler.start(config.profiling_hook)
+
+
+def finish_profiling(config=None):
+    """
+    Stops profiling the run, prints the summary and writes the report to the profiling directory of the config
+    :param config: settings to use, the defaults if None
+    :return: path of the report
+    """
+
+    config = config or Config()
+    profiler.stop()
+    profiler.print_summary()
+
+    path = os.path.join(config.profiling_dir, f"{profiler.started:%Y%m%d_%H%M%S}.{config.profiling_format}")
+    profiler.write_report(path)
+    print(f"Saved profiling report to {path}")
+    return path
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from config import Config
+from utils.calibration import detect_sheet
+from utils.profiling import timed, count
+
+# Size of the gray thumbnail of the rectified sheet the hash and the cells are calculated on
+THUMBNAIL_SIZE = 256
+# Number of cells per side of the thumbnail, every cell is compared on its own to notice small changes
+GRID_SIZE = 32
+# Settings that do not change the results, they are left out of the fingerprint
+IGNORED_SETTINGS = ("show_", "result_window_", "result_cache", "profiling", "webcam_buffer_size",
+                    "webcam_select_sharpest")
+
+
+def rectify_sheet(img, size=THUMBNAIL_SIZE):
+    """
+    Warps the sheet of an image to a square gray thumbnail, the brightness is normalized to the paper
+    :param img: image of the sheet
+    :param size: size of the thumbnail in pixels
+    :return: thumbnail of shape (size, size) and the corners of the sheet, the whole image if no sheet is found
+    """
+
+    height, width = img.shape[:2]
+    corners, _ = detect_sheet(img)
+    if corners is None:
+        corners = np.array([(0, 0), (width, 0), (width, height), (0, height)], dtype=np.float64)
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    # The sheet is warped to a larger square first, so resizing it averages all of its pixels
+    side = size * 4
+    target = np.array([(0, 0), (side, 0), (side, side), (0, side)], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners.astype(np.float32), target)
+    sheet = cv2.warpPerspective(gray, matrix, (side, side), flags=cv2.INTER_LINEAR)
+    thumbnail = cv2.resize(sheet, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    paper = max(float(np.percentile(thumbnail, 90)), 1.0)
+    return np.clip(thumbnail * (200 / paper), 0, 255).astype(np.uint8), corners
+
+
+def perceptual_hash(thumbnail):
+    """
+    Calculates the 64 bit perceptual hash of a thumbnail from the signs of its low frequencies
+    :param thumbnail: gray image
+    :return: hash as int
+    """
+
+    small = cv2.resize(thumbnail, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    frequencies = cv2.dct(small)[:8, :8].ravel()
+    bits = frequencies > np.median(frequencies[1:])
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(hash_value, other):
+    """
+    Counts the differing bits of two hashes
+    """
+
+    return bin(hash_value ^ other).count("1")
+
+
+def cell_differences(thumbnail, other, grid=GRID_SIZE):
+    """
+    Calculates the mean absolute difference of every cell of two thumbnails
+    :param thumbnail: gray image
+    :param other: gray image of the same shape
+    :param grid: number of cells per side
+    :return: array of shape (grid, grid)
+    """
+
+    difference = np.abs(thumbnail.astype(np.int16) - other.astype(np.int16)).astype(np.float32)
+    size = thumbnail.shape[0] // grid
+    return difference[:grid * size, :grid * size].reshape(grid, size, grid, size).mean(axis=(1, 3))
+
+
+def settings_fingerprint(use_case, config=None):
+    """
+    Calculates the fingerprint of the settings and models the results of a use case depend on,
+    so changed settings or a retrained model never return old results
+    :param use_case: name of the use case
+    :param config: settings to use, the defaults if None
+    :return: hex digest
+    """
+
+    config = config or Config()
+    settings = {name: getattr(config, name) for name in dir(Config)
+                if not name.startswith("_") and not callable(getattr(Config, name))
+                and not name.startswith(IGNORED_SETTINGS)}
+    models = {path: os.path.getmtime(path) for path in (config.object_detection_model_path,
+                                                        config.object_segmentation_model_path)
+              if os.path.exists(path)}
+    data = {"use_case": use_case, "settings": settings, "models": models}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def to_serializable(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} can not be cached")
+
+
+class SheetKey:
+    """
+    Key of the results of a sheet: the fingerprint of the settings, the perceptual hash of the sheet, its thumbnail
+    and the position of its corners in the image
+    """
+
+    def __init__(self, fingerprint, hash_value, thumbnail, corners):
+        self.fingerprint = fingerprint
+        self.hash = hash_value
+        self.thumbnail = thumbnail
+        self.corners = np.asarray(corners, dtype=np.float64)
+
+    @property
+    def name(self):
+        return f"{self.fingerprint[:16]}_{self.hash:016x}"
+
+    def matches(self, other, max_hash_distance, cell_threshold, corner_tolerance):
+        """
+        Checks if two keys show the same sheet at the same position.
+        The hash finds the candidates, every cell of the thumbnails is compared to notice a changed part of the sheet
+        :param other: sheet key
+        :param max_hash_distance: max number of differing bits of the hashes
+        :param cell_threshold: max mean difference of the gray values of a cell
+        :param corner_tolerance: max distance in pixels between the corners of the sheets
+        :return: True if the results of the other key can be used
+        """
+
+        return (
+            self.fingerprint == other.fingerprint
+            and hash_distance(self.hash, other.hash) <= max_hash_distance
+            and np.abs(self.corners - other.corners).max() <= corner_tolerance
+            and cell_differences(self.thumbnail, other.thumbnail).max() <= cell_threshold
+        )
+
+
+class ResultCache:
+    """
+    Caches the results of sheets by their perceptual hash, the recently used sheets are kept in memory and all
+    sheets in a directory, so an unchanged sheet under the camera skips the detection, ocr and path planning
+    """
+
+    def __init__(self, directory=None, capacity=8, disk_capacity=100, max_hash_distance=10, cell_threshold=5.0,
+                 corner_tolerance=4.0):
+        self.directory = directory
+        self.capacity = capacity
+        self.disk_capacity = disk_capacity
+        self.max_hash_distance = max_hash_distance
+        self.cell_threshold = cell_threshold
+        self.corner_tolerance = corner_tolerance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @timed("sheet_hash")
+    def key(self, img, use_case, config=None):
+        """
+        Calculates the key of the sheet in an image
+        :param img: image of the sheet
+        :param use_case: name of the use case the results belong to
+        :param config: settings the results are calculated with, the defaults if None
+        :return: sheet key
+        """
+
+        thumbnail, corners = rectify_sheet(img)
+        return SheetKey(settings_fingerprint(use_case, config), perceptual_hash(thumbnail), thumbnail, corners)
+
+    def lookup(self, key):
+        """
+        Returns the results of the same sheet, the memory is searched first and then the directory
+        :param key: sheet key
+        :return: dictionary of the results or None
+        """
+
+        results = self._lookup_memory(key)
+        if results is None and self.directory is not None:
+            results = self._lookup_disk(key)
+
+        count("result_cache_hits" if results is not None else "result_cache_misses")
+        return results
+
+    def _matches(self, key, other):
+        return key.matches(other, self.max_hash_distance, self.cell_threshold, self.corner_tolerance)
+
+    def _lookup_memory(self, key):
+        with self._lock:
+            for name, (other, results) in reversed(self._entries.items()):
+                if self._matches(key, other):
+                    self._entries.move_to_end(name)
+                    return results
+        return None
+
+    def _lookup_disk(self, key):
+        if not os.path.isdir(self.directory):
+            return None
+
+        prefix = f"{key.fingerprint[:16]}_"
+        for file_name in os.listdir(self.directory):
+            if not file_name.startswith(prefix) or not file_name.endswith(".npz"):
+                continue
+            # The hash is part of the file name, so only candidates are loaded
+            hash_value = int(file_name[len(prefix):-len(".npz")], 16)
+            if hash_distance(key.hash, hash_value) > self.max_hash_distance:
+                continue
+
+            path = os.path.join(self.directory, file_name)
+            try:
+                with np.load(path) as data:
+                    other = SheetKey(str(data["fingerprint"]), hash_value, data["thumbnail"], data["corners"])
+                    results = json.loads(str(data["results"]))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Failed to read cached results {path}: {e}")
+                continue
+
+            if self._matches(key, other):
+                os.utime(path)
+                self._remember(other, results)
+                return results
+        return None
+
+    def store(self, key, results):
+        """
+        Stores the results of a sheet, the least recently used sheets are removed when the cache is full
+        :param key: sheet key
+        :param results: dictionary of json serializable results, numpy arrays are converted to lists
+        """
+
+        serialized = json.dumps(results, default=to_serializable)
+        self._remember(key, json.loads(serialized))
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez_compressed(os.path.join(self.directory, f"{key.name}.npz"), fingerprint=key.fingerprint,
+                            thumbnail=key.thumbnail, corners=key.corners, results=serialized)
+
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        for path in sorted(paths, key=os.path.getmtime)[:max(len(paths) - self.disk_capacity, 0)]:
+            os.remove(path)
+
+    def _remember(self, key, results):
+        with self._lock:
+            self._entries[key.name] = (key, results)
+            self._entries.move_to_end(key.name)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self, disk=False):
+        """
+        Removes all cached results
+        :param disk: if True, the results in the directory are removed as well
+        """
+
+        with self._lock:
+            self._entries.clear()
+        if disk and self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+_cache = None
+
+
+def get_result_cache(config=None):
+    """
+    Returns the result cache of the process
+    :param config: settings to use, the defaults if None
+    :return: result cache
+    """
+
+    config = config or Config()
+
+    global _cache
+    if _cache is None:
+        _cache = ResultCache(config.result_cache_dir, config.result_cache_size, config.result_cache_disk_size,
+                             config.result_cache_hash_distance, config.result_cache_cell_threshold,
+                             config.result_cache_corner_tolerance)
+    return _cache
@@ -0,0 +1,382 @@
+import html
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+from config import Config
+
+# Max width of the overlays on the review page, larger overlays are scaled down before they are encoded
+IMAGE_MAX_WIDTH = 1600
+# Seconds between two reloads of the list of reviews
+REFRESH_INTERVAL = 2
+# Statuses of a review that allow the sheet to be drawn
+APPROVED = ("approved", "auto-approved")
+
+
+class Review:
+    """
+    Overlays, summary and problems of one sheet together with the decision whether it is drawn
+    """
+
+    def __init__(self, review_id, title, overlays, summary, problems):
+        self.id = review_id
+        self.title = title
+        self.overlays = overlays
+        self.summary = summary
+        self.problems = problems
+        self.status = "pending"
+        self.created = time.strftime("%H:%M:%S")
+        self._decided = threading.Event()
+
+    def decide(self, status):
+        """
+        Sets the decision of a pending review
+        :param status: "approved", "auto-approved", "rejected" or "timeout"
+        """
+
+        if self.status == "pending":
+            self.status = status
+            self._decided.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits for the decision of the review
+        :param timeout: seconds to wait, the review is rejected afterwards. None waits forever
+        :return: True if the sheet was approved
+        """
+
+        if not self._decided.wait(timeout):
+            self.decide("timeout")
+        return self.status in APPROVED
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "created": self.created,
+            "status": self.status,
+            "summary": self.summary,
+            "problems": self.problems,
+            "overlays": [name for name, _ in self.overlays],
+        }
+
+
+class ReviewHandler(BaseHTTPRequestHandler):
+    """
+    Serves the review pages of the review server set as review_server
+    """
+
+    review_server = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+
+        if not parts:
+            self.send_html(self.review_server.render_index(), refresh=True)
+        elif parts == ["api", "reviews"]:
+            reviews = [review.to_dict() for review in self.review_server.reviews()]
+            self.send_body(json.dumps(reviews).encode(), "application/json")
+        elif len(parts) == 2 and parts[0] == "reviews":
+            review = self.review_server.get(parts[1])
+            if review is None:
+                self.send_error(404)
+            else:
+                self.send_html(self.review_server.render_review(review))
+        elif len(parts) == 4 and parts[0] == "reviews" and parts[2] == "overlays":
+            review = self.review_server.get(parts[1])
+            index = parts[3].split(".")[0]
+            if review is None or not index.isdigit() or int(index) >= len(review.overlays):
+                self.send_error(404)
+            else:
+                self.send_body(review.overlays[int(index)][1], "image/jpeg")
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        parts = [part for part in self.path.split("/") if part]
+        review = self.review_server.get(parts[1]) if len(parts) == 3 and parts[0] == "reviews" else None
+        if review is None or parts[2] not in ("approve", "reject"):
+            self.send_error(404)
+            return
+
+        review.decide("approved" if parts[2] == "approve" else "rejected")
+        self.send_response(303)
+        self.send_header("Location", "/")
+        self.end_headers()
+
+    def send_html(self, body, refresh=False):
+        head = f'<meta http-equiv="refresh" content="{REFRESH_INTERVAL}">' if refresh else ""
+        page = (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Review</title>{head}"
+                f"<style>body{{font-family:Arial;margin:20px}}img{{max-width:100%;margin:8px 0}}"
+                f"td,th{{padding:4px 12px;text-align:left}}.problem{{color:#c00}}</style></head>"
+                f"<body>{body}</body></html>")
+        self.send_body(page.encode(), "text/html; charset=utf-8")
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReviewServer:
+    """
+    Local web page to review the results of the sheets without blocking the pipeline.
+    The overlays of a sheet are collected in its review context and submitted with its summary and problems,
+    sheets without problems are approved automatically and only problem sheets wait for an operator
+    """
+
+    def __init__(self, host="127.0.0.1", port=8050, history=20):
+        self.host = host
+        self.port = port
+        self.history = history
+        self._reviews = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    def start(self):
+        """
+        Starts serving the review page in a background thread
+        """
+
+        if self._server is not None:
+            return
+        handler = type("BoundReviewHandler", (ReviewHandler,), {"review_server": self})
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        except OSError as e:
+            raise OSError(f"The review page can not be served at {self.url}, set another review_port: {e}") from e
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"Review the results at {self.url}")
+
+    def stop(self):
+        """
+        Stops serving the review page
+        """
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def submit(self, title, summary, problems, overlays=(), auto_approve=True):
+        """
+        Submits the results of a sheet
+        :param title: title of the sheet
+        :param summary: dictionary of results shown on the review page
+        :param problems: list of problems found in the results
+        :param overlays: list of (name, jpeg bytes) overlays of the sheet
+        :param auto_approve: if True, a sheet without problems is approved at once
+        :return: review
+        """
+
+        with self._lock:
+            review = Review(str(next(self._ids)), title, list(overlays), summary, problems)
+            self._reviews[review.id] = review
+
+            # Only decided reviews are removed, a pending review stays until the operator decided
+            decided = [review_id for review_id, item in self._reviews.items() if item.status != "pending"]
+            for review_id in decided[:max(len(self._reviews) - self.history, 0)]:
+                del self._reviews[review_id]
+
+        if auto_approve and not problems:
+            review.decide("auto-approved")
+        return review
+
+    def get(self, review_id):
+        with self._lock:
+            return self._reviews.get(review_id)
+
+    def reviews(self):
+        """
+        Returns the reviews, the newest first
+        """
+
+        with self._lock:
+            return list(reversed(self._reviews.values()))
+
+    def render_index(self):
+        rows = []
+        for review in self.reviews():
+            problems = html.escape("; ".join(review.problems)) or "-"
+            rows.append(f"<tr><td>{review.created}</td><td><a href='/reviews/{review.id}'>"
+                        f"{html.escape(review.title)}</a></td><td>{review.status}</td>"
+                        f"<td class='problem'>{problems}</td></tr>")
+        pending = sum(review.status == "pending" for review in self.reviews())
+        return (f"<h1>Review</h1><p>{pending} sheets wait for a review</p><table>"
+                f"<tr><th>Time</th><th>Sheet</th><th>Status</th><th>Problems</th></tr>{''.join(rows)}</table>")
+
+    def render_review(self, review):
+        summary = "".join(f"<tr><th>{html.escape(str(name))}</th><td>{html.escape(str(value))}</td></tr>"
+                          for name, value in review.summary.items())
+        problems = "".join(f"<li class='problem'>{html.escape(problem)}</li>" for problem in review.problems)
+        overlays = "".join(f"<h3>{html.escape(name)}</h3><img src='/reviews/{review.id}/overlays/{i}.jpg'>"
+                           for i, (name, _) in enumerate(review.overlays))
+        buttons = ""
+        if review.status == "pending":
+            buttons = (f"<p class='problem'>Execute homing of Dobot before approving!</p>"
+                       f"<form method='post' action='/reviews/{review.id}/approve' style='display:inline'>"
+                       f"<button>Approve and draw</button></form> "
+                       f"<form method='post' action='/reviews/{review.id}/reject' style='display:inline'>"
+                       f"<button>Reject</button></form>")
+        return (f"<p><a href='/'>All sheets</a></p><h1>{html.escape(review.title)}</h1>"
+                f"<p>Status: {review.status}</p><table>{summary}</table><ul>{problems}</ul>{buttons}{overlays}")
+
+
+def encode_overlay(img):
+    """
+    Encodes an overlay for the review page, larger overlays are scaled down first
+    :param img: BGR or gray image
+    :return: jpeg bytes
+    """
+
+    if img.shape[1] > IMAGE_MAX_WIDTH:
+        scale = IMAGE_MAX_WIDTH / img.shape[1]
+        img = cv2.resize(img, (IMAGE_MAX_WIDTH, round(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+class ReviewContext:
+    """
+    Overlays of the sheet the calling thread processes, show_image adds them and review_sheet submits them
+    """
+
+    def __init__(self):
+        self.overlays = []
+
+    def add_overlay(self, name, img):
+        self.overlays.append((name, encode_overlay(img)))
+
+
+# Review context of every thread, only set while a sheet is processed for a review
+_local = threading.local()
+
+
+@contextmanager
+def review_context():
+    """
+    Collects the overlays shown while the calling thread processes one sheet, they are dropped when it ends.
+    Without a review context the overlays are not kept
+    :return: review context
+    """
+
+    context = ReviewContext()
+    previous = getattr(_local, "context", None)
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = previous
+        context.overlays.clear()
+
+
+_server = None
+
+
+def get_review_server(config=None):
+    """
+    Returns the review server of the process and starts it on first use on the host and port of the config
+    :param config: settings to use, the defaults if None
+    :return: review server
+    """
+
+    config = config or Config()
+
+    global _server
+    if _server is None:
+        _server = ReviewServer(config.review_host, config.review_port, config.review_history)
+    _server.start()
+    return _server
+
+
+def show_image(title, img, config=None):
+    """
+    Shows an overlay of the results. With review = "server" it is added to the review context of the sheet and the
+    call returns at once, with review = "window" it is shown in an opencv window until a key is pressed
+    :param title: title of the overlay
+    :param img: image to show
+    :param config: settings to use, the defaults if None
+    """
+
+    config = config or Config()
+
+    if config.review == "window":
+        cv2.namedWindow(title, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(title, min(config.result_window_width, img.shape[1]),
+                         min(config.result_window_height, img.shape[0]))
+        cv2.imshow(title, img)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+        return
+
+    context = getattr(_local, "context", None)
+    if context is not None:
+        context.add_overlay(title, img)
+
+
+def dot_to_dot_problems(numbers):
+    """
+    Checks the recognized numbers of a dot to dot sheet, a sheet is fine if every number from 1 to the highest
+    number was recognized exactly once
+    :param numbers: recognized numbers
+    :return: list of problems
+    """
+
+    if not numbers:
+        return ["No numbers recognized"]
+
+    problems = []
+    duplicates = sorted({number for number in numbers if numbers.count(number) > 1})
+    if duplicates:
+        problems.append(f"Recognized more than once: {', '.join(map(str, duplicates))}")
+    missing = sorted(set(range(1, max(numbers) + 1)) - set(numbers))
+    if missing:
+        problems.append(f"Missing numbers: {', '.join(map(str, missing))}")
+    return problems
+
+
+def fill_problems(strokes):
+    """
+    Checks the planned strokes of a sheet with areas to color
+    :param strokes: planned strokes
+    :return: list of problems
+    """
+
+    return [] if strokes else ["No areas to color found"]
+
+
+def review_sheet(title, summary, problems, config=None):
+    """
+    Submits the results of a sheet with the overlays of its review context to the review server and waits for the
+    decision if the sheet has problems
+    :param title: title of the sheet
+    :param summary: dictionary of results shown on the review page
+    :param problems: list of problems found in the results
+    :param config: settings to use, the defaults if None
+    :return: True if the sheet should be drawn
+    """
+
+    config = config or Config()
+    context = getattr(_local, "context", None)
+    server = get_review_server(config)
+    review = server.submit(title, summary, problems, context.overlays if context is not None else (),
+                           config.review_auto_approve)
+
+    if review.status == "pending":
+        print(f"{title}: {'; '.join(problems) or 'waiting for approval'}, review it at {server.url}reviews/{review.id}")
+    approved = review.wait(config.review_timeout)
+    print(f"{title}: {review.status}")
+    return approved